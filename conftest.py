@@ -43,7 +43,7 @@ def mock_load_metric(monkeypatch):
 def mock_load_dataset(monkeypatch):
     load_dataset = MagicMock()
     monkeypatch.setattr(
-        "data_measurements.measurement_suite.load_dataset", load_dataset
+        "data_measurements.dataset_source.load_dataset", load_dataset
     )
 
     return load_dataset
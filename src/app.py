@@ -17,31 +17,34 @@ import ast
 import gradio as gr
 import utils
 from data_measurements import DataMeasurementSuite
+from data_measurements.cache import ResultsCache
 from data_measurements.measurements import (
     GeneralStats,
     LabelDistribution,
     TextLengths,
     TextDuplicates,
 )
+from data_measurements.tokenizers import WhitespaceTokenizer
 
 logs = utils.prepare_logging(__file__)
 
 def get_suite():
-    def dummy_tokenizer(sentence: str):
-        return sentence.split()
-
     suite = DataMeasurementSuite(
         dataset="society-ethics/data-measurements-end-to-end-test",
         feature="text",
         label="label",
         split="train",
-        tokenizer=dummy_tokenizer,
+        tokenizer=WhitespaceTokenizer(),
         measurements=[
             GeneralStats,
             LabelDistribution,
             TextLengths,
             TextDuplicates,
         ],
+        # Identical suites are rerun on every restart, so keep their results around
+        cache=ResultsCache("cache_dir/measurements"),
+        # Listing every duplicated text takes memory growing with the number of duplicates
+        measurement_options={"text_duplicates": {"max_listed": 100}},
     )
 
     return suite
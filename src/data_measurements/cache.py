@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Union
+
+from datasets import Dataset
+from datasets.fingerprint import Hasher
+
+import utils
+
+logs = utils.prepare_logging(__file__)
+
+
+def fingerprint(obj: Any) -> Optional[str]:
+    """
+    Stable hash of an object (e.g. a tokenizer) across runs, or None if it can't be hashed. Objects that can't be
+    serialized, or whose serialization isn't deterministic, shouldn't be used in cache keys.
+    """
+    try:
+        return Hasher.hash(obj)
+    except Exception as e:
+        # Any serialization error means the object can't be fingerprinted
+        logs.warning(f"Could not fingerprint {obj!r}, it won't be cached: {e}")
+        return None
+
+
+def cache_key(components: Dict[str, Any]) -> str:
+    return hashlib.sha256(json.dumps(components, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class ResultsCache:
+    """
+    On-disk cache of measurement results, one pickle file per key, and of tokenized columns. When `max_size` (in
+    bytes) is set, the least recently used entries and tokenized columns are evicted once the cache grows beyond it.
+    """
+
+    suffix = ".pkl"
+
+    def __init__(self, cache_dir: Union[str, Path], max_size: Optional[int] = None):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        # Tokenized columns memory-mapped by the datasets being measured, which aren't evicted
+        self._in_use: Set[Path] = set()
+
+    @property
+    def tokenized_dir(self) -> Path:
+        # Tokenized columns, memory-mapped Arrow files evicted along with the results
+        return self.cache_dir / "tokenized"
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}{self.suffix}"
+
+    def artifact_path(self, key: str, suffix: str) -> Path:
+        """
+        Where to store a file the results of `key` refer to (e.g. a memory-mapped Arrow file). Artifacts are
+        removed and evicted along with their results.
+        """
+        return self.cache_dir / f"{key}{suffix}"
+
+    def _entry_paths(self, key: str) -> List[Path]:
+        return list(self.cache_dir.glob(f"{key}.*"))
+
+    def _tokenized_paths(self) -> List[Path]:
+        return list(self.tokenized_dir.glob("*.arrow"))
+
+    def use_tokenized(self, dataset: Dataset):
+        """
+        Marks the tokenized columns a dataset memory-maps as used: they're evicted last, and not at all while this
+        cache is in use.
+        """
+        tokenized_dir = self.tokenized_dir.resolve()
+        for cache_file in dataset.cache_files:
+            path = Path(cache_file["filename"]).resolve()
+            if path.parent == tokenized_dir and path.exists():
+                os.utime(path)
+                self._in_use.add(path)
+        self.evict()
+
+    def get(self, key: str) -> Optional[Any]:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, OSError):
+            # OSError includes artifacts of the entry having been removed
+            logs.warning(f"Dropping unreadable cache entry {path}")
+            self.invalidate(key)
+            return None
+        # Reading counts as a use for the LRU eviction
+        os.utime(path)
+        return value
+
+    def set(self, key: str, value: Any):
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def invalidate(self, key: str):
+        for path in self._entry_paths(key):
+            path.unlink(missing_ok=True)
+
+    def clear(self):
+        for path in self.cache_dir.glob(f"*{self.suffix}"):
+            self.invalidate(path.stem)
+        for path in self._tokenized_paths():
+            path.unlink(missing_ok=True)
+
+    def _entry_size(self, key: str) -> int:
+        return sum(path.stat().st_size for path in self._entry_paths(key))
+
+    def _sizes(self) -> Dict[Path, int]:
+        # Results (with their artifacts) and tokenized columns
+        sizes = {path: self._entry_size(path.stem) for path in self.cache_dir.glob(f"*{self.suffix}")}
+        sizes.update((path, path.stat().st_size) for path in self._tokenized_paths())
+        return sizes
+
+    def size(self) -> int:
+        return sum(self._sizes().values())
+
+    def evict(self):
+        if self.max_size is None:
+            return
+        sizes = self._sizes()
+        size = sum(sizes.values())
+        for path in sorted(sizes, key=lambda path: path.stat().st_mtime):
+            if size <= self.max_size:
+                break
+            if path.suffix == self.suffix:
+                self.invalidate(path.stem)
+                size -= sizes[path]
+            elif path.resolve() not in self._in_use:
+                path.unlink(missing_ok=True)
+                size -= sizes[path]
@@ -0,0 +1,51 @@
+import functools
+from typing import FrozenSet
+
+# NLTK's stopwords, bundled so that nothing is downloaded when measuring
+_STOPWORDS = {
+    "english": (
+        "i", "me", "my", "myself", "we", "our", "ours", "ourselves", "you", "you're", "you've", "you'll",
+        "you'd", "your", "yours", "yourself", "yourselves", "he", "him", "his", "himself", "she", "she's",
+        "her", "hers", "herself", "it", "it's", "its", "itself", "they", "them", "their", "theirs",
+        "themselves", "what", "which", "who", "whom", "this", "that", "that'll", "these", "those", "am", "is",
+        "are", "was", "were", "be", "been", "being", "have", "has", "had", "having", "do", "does", "did",
+        "doing", "a", "an", "the", "and", "but", "if", "or", "because", "as", "until", "while", "of", "at",
+        "by", "for", "with", "about", "against", "between", "into", "through", "during", "before", "after",
+        "above", "below", "to", "from", "up", "down", "in", "out", "on", "off", "over", "under", "again",
+        "further", "then", "once", "here", "there", "when", "where", "why", "how", "all", "any", "both", "each",
+        "few", "more", "most", "other", "some", "such", "no", "nor", "not", "only", "own", "same", "so", "than",
+        "too", "very", "s", "t", "can", "will", "just", "don", "don't", "should", "should've", "now", "d", "ll",
+        "m", "o", "re", "ve", "y", "ain", "aren", "aren't", "couldn", "couldn't", "didn", "didn't", "doesn",
+        "doesn't", "hadn", "hadn't", "hasn", "hasn't", "haven", "haven't", "isn", "isn't", "ma", "mightn",
+        "mightn't", "mustn", "mustn't", "needn", "needn't", "shan", "shan't", "shouldn", "shouldn't", "wasn",
+        "wasn't", "weren", "weren't", "won", "won't", "wouldn", "wouldn't"
+    ),
+}
+
+# Pieces of contractions left by tokenizers splitting on apostrophes, and common misspellings
+_EXTRA_WORDS = {
+    "english": (
+        "t", "n", "ll", "d", "s", "wasn", "weren", "won", "aren", "wouldn", "shouldn", "didn", "don", "hasn", "ain",
+        "couldn", "doesn", "hadn", "haven", "isn", "mightn", "mustn", "needn", "shan", "would", "could", "dont",
+    ),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def closed_class_words(language: str = "english") -> FrozenSet[str]:
+    """
+    Closed class words of `language`: its stopwords, and numbers below 99. Languages that aren't bundled are read
+    from NLTK's stopwords corpus when it was downloaded beforehand, e.g. with `nltk.download("stopwords")`.
+    """
+    if language in _STOPWORDS:
+        stopwords = _STOPWORDS[language]
+    else:
+        from nltk.corpus import stopwords as nltk_stopwords
+
+        try:
+            stopwords = nltk_stopwords.words(language)
+        except (LookupError, OSError) as e:
+            raise ValueError(
+                f"No closed class words for {language}, bundled ones are for {', '.join(_STOPWORDS)}"
+            ) from e
+    return frozenset(stopwords) | frozenset(_EXTRA_WORDS.get(language, ())) | {str(i) for i in range(0, 99)}
@@ -0,0 +1,137 @@
+import json
+import os
+from pathlib import Path
+from typing import List, Optional, Union
+
+import datasets
+from datasets import Dataset, DatasetDict, IterableDataset, load_dataset, load_from_disk
+from huggingface_hub import HfApi
+
+from data_measurements.cache import cache_key
+
+import utils
+
+logs = utils.prepare_logging(__file__)
+
+# Builders for local files, by extension
+_FILE_BUILDERS = {
+    ".parquet": "parquet",
+    ".json": "json",
+    ".jsonl": "json",
+    ".csv": "csv",
+}
+
+
+def saved_dataset_files(path: Path) -> List[Path]:
+    """
+    Files of a `save_to_disk` directory: its metadata and the data files it lists, but not the `cache-*.arrow`
+    files `datasets` writes next to them when the dataset is mapped.
+    """
+    dataset_dict_file = path / datasets.config.DATASETDICT_JSON_FILENAME
+    if dataset_dict_file.is_file():
+        splits = json.loads(dataset_dict_file.read_text())["splits"]
+        return [dataset_dict_file] + [f for split in splits for f in saved_dataset_files(path / split)]
+    state_file = path / datasets.config.DATASET_STATE_JSON_FILENAME
+    if not state_file.is_file():
+        return sorted(f for f in path.rglob("*") if f.is_file() and not f.name.startswith("cache-"))
+    data_files = json.loads(state_file.read_text())["_data_files"]
+    metadata = [state_file, path / datasets.config.DATASET_INFO_FILENAME]
+    return [f for f in metadata if f.is_file()] + [path / data_file["filename"] for data_file in data_files]
+
+
+class DatasetSource:
+    """
+    Where the rows of a suite come from: an in-memory dataset, a local Arrow/Parquet/JSON(L)/CSV file or
+    `save_to_disk` directory, or a dataset on the hub. Nothing is loaded until `load` is called, and only the
+    `columns` that are measured are kept.
+    """
+
+    def __init__(
+        self,
+        dataset: Union[str, os.PathLike, Dataset, DatasetDict, IterableDataset],
+        split: Optional[str],
+        columns: List[str],
+        streaming: bool = False,
+    ):
+        self.dataset = dataset
+        self.split = split
+        self.columns = [c for c in columns if c is not None]
+        self.streaming = streaming
+
+    @property
+    def is_local(self) -> bool:
+        return isinstance(self.dataset, (str, os.PathLike)) and Path(self.dataset).exists()
+
+    def load(self) -> Union[Dataset, IterableDataset]:
+        dataset = self.dataset
+        if isinstance(dataset, DatasetDict):
+            dataset = dataset[self.split]
+        elif self.is_local:
+            dataset = self._load_local(Path(dataset))
+        elif isinstance(dataset, str):
+            dataset = self._load_hub(dataset)
+        # Datasets that are already loaded (or memory-mapped) are streamed batch after batch as they are
+        return self._project(dataset)
+
+    def _load_hub(self, name: str) -> Union[Dataset, IterableDataset]:
+        kwargs = {"streaming": True} if self.streaming else {}
+        try:
+            # Parquet datasets (which most hub datasets are) only read the measured columns
+            return load_dataset(name, split=self.split, columns=self.columns, **kwargs)
+        except ValueError as e:
+            # Other builders have no `columns` option, the columns are then selected once loaded
+            if "'columns'" not in str(e):
+                raise
+            return load_dataset(name, split=self.split, **kwargs)
+
+    def _load_local(self, path: Path) -> Dataset:
+        if path.is_dir():
+            dataset = load_from_disk(str(path))
+            return dataset[self.split] if isinstance(dataset, DatasetDict) else dataset
+        if path.suffix == ".arrow":
+            return Dataset.from_file(str(path))
+
+        builder = _FILE_BUILDERS.get(path.suffix)
+        if builder is None:
+            raise ValueError(f"Unsupported dataset file {path}, expected one of .arrow, {', '.join(_FILE_BUILDERS)}")
+        split = self.split or "train"
+        kwargs = {"columns": self.columns} if builder == "parquet" else {}
+        return load_dataset(builder, data_files={split: str(path)}, split=split, streaming=self.streaming, **kwargs)
+
+    def _project(self, dataset: Union[Dataset, IterableDataset]) -> Union[Dataset, IterableDataset]:
+        column_names = dataset.column_names
+        # Streamed hub datasets don't always know their columns up front
+        if not isinstance(column_names, list):
+            return dataset
+        columns = [c for c in self.columns if c in column_names]
+        if columns and columns != column_names:
+            dataset = dataset.select_columns(columns)
+        return dataset
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        """
+        Identifies the rows of the source without loading them, or None when that isn't possible (e.g. offline).
+        """
+        dataset = self.dataset
+        if isinstance(dataset, DatasetDict):
+            dataset = dataset[self.split]
+
+        if isinstance(dataset, Dataset):
+            source = dataset._fingerprint
+        elif isinstance(dataset, IterableDataset):
+            return None
+        elif self.is_local:
+            path = Path(dataset).resolve()
+            files = saved_dataset_files(path) if path.is_dir() else [path]
+            source = [(str(f), f.stat().st_size, f.stat().st_mtime_ns) for f in files]
+        else:
+            if datasets.config.HF_DATASETS_OFFLINE:
+                return None
+            try:
+                source = [dataset, HfApi().dataset_info(dataset, timeout=10).sha]
+            except Exception as e:
+                logs.warning(f"Could not get the revision of {dataset} from the hub: {e}")
+                return None
+
+        return cache_key({"source": source, "split": self.split, "columns": self.columns})
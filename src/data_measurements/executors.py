@@ -0,0 +1,33 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List, Optional
+
+from multiprocess import Pool
+
+
+EXECUTORS = ["serial", "threads", "processes"]
+
+
+def parallel_map(
+    function: Callable,
+    items: Iterable,
+    executor: str = "serial",
+    num_workers: Optional[int] = None,
+) -> List:
+    """
+    Applies `function` to every item with the chosen executor. Results are always returned in the order of
+    `items`, whatever order the workers finish in.
+    """
+    items = list(items)
+    if executor not in EXECUTORS:
+        raise ValueError(f"Unknown executor {executor}, expected one of {EXECUTORS}")
+
+    if executor == "serial" or len(items) <= 1:
+        return [function(item) for item in items]
+
+    if executor == "threads":
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            return list(pool.map(function, items))
+
+    # multiprocess serializes with dill, so measurements holding closures (e.g. tokenizers) can be sent to workers
+    with Pool(num_workers) as pool:
+        return pool.map(function, items)
@@ -0,0 +1,179 @@
+import heapq
+import os
+import shutil
+import tempfile
+import uuid
+from typing import Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from data_measurements.sketches import hash_values
+
+
+def hash_texts(texts: Union[pa.Array, pa.ChunkedArray]) -> np.ndarray:
+    """
+    64-bit hashes of texts with surrounding whitespace removed, as the evaluate text_duplicates metric compares them.
+    """
+    return hash_values(pc.utf8_trim_whitespace(texts).to_numpy(zero_copy_only=False))
+
+
+def _count(hashes: np.ndarray, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # Sorted distinct hashes, with the sum of their counts
+    distinct, inverse = np.unique(hashes, return_inverse=True)
+    return distinct, np.bincount(inverse, weights=counts, minlength=len(distinct)).astype(np.int64)
+
+
+class HashCounts:
+    """
+    Exact counts of 64-bit hashes, kept as sorted NumPy arrays: 16 bytes per distinct hash. Beyond
+    `memory_budget` bytes, the counts are spilled to `spill_dir` as a sorted run, and runs are merged range by range
+    when iterating the counts, so memory stays within the budget. Spilled runs are kept until `clear` is called, which
+also removes the temporary directory they were spilled to when no `spill_dir` is given.
+
+    Counts of separate shards are merged with `merge`, which is how the states of streamed and sharded runs combine.
+    """
+
+    def __init__(self, memory_budget: Optional[int] = 1 << 30, spill_dir: Optional[Union[str, os.PathLike]] = None):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        # Temporary spill directories created by these counts (or the counts merged into them)
+        self._temp_dirs: List[str] = []
+        self._reset()
+
+    def _reset(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.num_hashes = 0
+        # Paths of the spilled runs, each a pair of .npy files of sorted distinct hashes and their counts
+        self.runs: List[str] = []
+        self._pending: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._num_pending = 0
+
+    def update(self, hashes: np.ndarray, counts: Optional[np.ndarray] = None):
+        hashes = np.asarray(hashes, dtype=np.uint64)
+        counts = np.ones(len(hashes), dtype=np.int64) if counts is None else np.asarray(counts, dtype=np.int64)
+        self._pending.append((hashes, counts))
+        self._num_pending += len(hashes)
+        self.num_hashes += int(counts.sum())
+        # Counting batches together amortizes re-sorting the distinct hashes, as long as they fit in the budget
+        over_budget = self.memory_budget is not None and 16 * self._num_pending > self.memory_budget
+        if over_budget or self._num_pending >= max(len(self.hashes), 1 << 16):
+            self._compact()
+
+    def merge(self, other: "HashCounts") -> "HashCounts":
+        other._compact()
+        self._pending.append((other.hashes, other.counts))
+        self._num_pending += len(other.hashes)
+        self.num_hashes += other.num_hashes
+        self.runs.extend(other.runs)
+        self._temp_dirs.extend(other._temp_dirs)
+        self._compact()
+        return self
+
+    def _compact(self):
+        if not self._pending:
+            return
+        self.hashes, self.counts = _count(
+            np.concatenate([self.hashes] + [hashes for hashes, _ in self._pending]),
+            np.concatenate([self.counts] + [counts for _, counts in self._pending]),
+        )
+        self._pending, self._num_pending = [], 0
+        if self.memory_budget is not None and self.hashes.nbytes + self.counts.nbytes > self.memory_budget:
+            self._spill()
+
+    def _spill(self):
+        if self.spill_dir is None:
+            self.spill_dir = tempfile.mkdtemp(prefix="data_measurements-hashes-")
+            self._temp_dirs.append(self.spill_dir)
+        os.makedirs(self.spill_dir, exist_ok=True)
+        run = os.path.join(self.spill_dir, uuid.uuid4().hex)
+        np.save(f"{run}-hashes.npy", self.hashes)
+        np.save(f"{run}-counts.npy", self.counts)
+        self.runs.append(run)
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.counts = np.empty(0, dtype=np.int64)
+
+    def iter_counts(self) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Sorted distinct hashes and their counts, in chunks of increasing hashes.
+        """
+        self._compact()
+        if not self.runs:
+            yield self.hashes, self.counts
+            return
+
+        runs = [self.hashes] + [np.load(f"{run}-hashes.npy", mmap_mode="r") for run in self.runs]
+        run_counts = [self.counts] + [np.load(f"{run}-counts.npy", mmap_mode="r") for run in self.runs]
+        # Split the hash space so that each chunk of the runs fits in the budget, as a whole run did
+        total = sum(len(hashes) for hashes in runs)
+        max_run = max(max(len(hashes) for hashes in runs), 1)
+        num_chunks = -(-total // max_run)
+        bounds = np.linspace(0, 2**64, num_chunks + 1)
+        starts = [0] * len(runs)
+        for chunk in range(num_chunks):
+            parts = []
+            for i, hashes in enumerate(runs):
+                if chunk == num_chunks - 1:
+                    end = len(hashes)
+                else:
+                    end = int(np.searchsorted(hashes, np.uint64(bounds[chunk + 1]), side="left"))
+                parts.append((np.asarray(hashes[starts[i]:end]), np.asarray(run_counts[i][starts[i]:end])))
+                starts[i] = end
+            yield _count(
+                np.concatenate([hashes for hashes, _ in parts]), np.concatenate([counts for _, counts in parts])
+            )
+
+    def num_distinct(self) -> int:
+        return sum(len(hashes) for hashes, _ in self.iter_counts())
+
+    def distinct(self) -> np.ndarray:
+        """
+        Sorted distinct hashes, e.g. as an index to look hashes up in with `np.searchsorted`.
+        """
+        return np.concatenate([hashes for hashes, _ in self.iter_counts()])
+
+    def most_common(self, k: int, min_count: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The `k` most counted hashes (of those counted at least `min_count` times) and their counts, from the most
+        counted, as `Counter.most_common`. Only `k` hashes are kept across chunks, in a heap; ties go to the
+        largest hash.
+        """
+        if k <= 0:
+            return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int64)
+        heap: List[Tuple[int, int]] = []
+        for hashes, counts in self.iter_counts():
+            candidates = np.flatnonzero(counts >= min_count)
+            if len(candidates) > k:
+                # Only the top k of a chunk (with their ties) can make it into the heap
+                threshold = np.partition(counts[candidates], -k)[-k]
+                candidates = candidates[counts[candidates] >= threshold]
+            for count, hash_ in zip(counts[candidates].tolist(), hashes[candidates].tolist()):
+                if len(heap) < k:
+                    heapq.heappush(heap, (count, hash_))
+                elif (count, hash_) > heap[0]:
+                    heapq.heapreplace(heap, (count, hash_))
+        top = sorted(heap, reverse=True)
+        return (
+            np.array([hash_ for _, hash_ in top], dtype=np.uint64),
+            np.array([count for count, _ in top], dtype=np.int64),
+        )
+
+    def duplicated(self) -> np.ndarray:
+        """
+        Hashes counted more than once.
+        """
+        return np.concatenate([hashes[counts > 1] for hashes, counts in self.iter_counts()])
+
+    def clear(self):
+        for run in self.runs:
+            for suffix in ["-hashes.npy", "-counts.npy"]:
+                if os.path.exists(run + suffix):
+                    os.remove(run + suffix)
+        for temp_dir in self._temp_dirs:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        if self.spill_dir in self._temp_dirs:
+            self.spill_dir = None
+        self._temp_dirs = []
+        self._reset()
@@ -1,33 +1,454 @@
-from typing import Callable, Dict, List, Optional, Type
+import os
+import pickle
+from contextlib import nullcontext
+from functools import partial
+from pathlib import Path
+from typing import Any, Callable, ContextManager, Dict, List, Optional, Tuple, Type, Union
 
-from datasets import Dataset, load_dataset
+from datasets import Dataset, DatasetDict, IterableDataset
 
+from data_measurements.cache import ResultsCache
+from data_measurements.dataset_source import DatasetSource
+from data_measurements.executors import parallel_map
 from data_measurements.measurements import (
     DataMeasurement,
     DataMeasurementFactory,
     DataMeasurementResults,
 )
-from data_measurements.measurements.base import Widget
+from data_measurements.measurements.base import (
+    CachedMeasurementMixin,
+    MeasurementState,
+    TokenizedDatasetMixin,
+    Widget,
+    intern_dataset,
+    tokenize_batch,
+    tokenize_dataset,
+)
+from data_measurements.profiling import ProfileReport, StageProfile, accumulate_time, profile_stage, trace_memory
+from data_measurements.streaming import iter_arrow_batches
+
+
+def build_measurement_graph(
+    measurements: List[DataMeasurement], options: Optional[Dict[str, Dict[str, Any]]] = None, **kwargs
+) -> Dict[str, DataMeasurement]:
+    """
+    Expands the requested measurements with the measurements they (transitively) depend on, created with their
+    `options` (keyed by measurement name). The returned dict is keyed by name and is in topological order: every
+    measurement comes after its dependencies.
+    """
+    options = options or {}
+    requested = {m.name: m for m in measurements}
+    graph: Dict[str, DataMeasurement] = {}
+    visiting = set()
+
+    def visit(measurement: Type[DataMeasurement]):
+        if measurement.name in graph:
+            return
+        if measurement.name in visiting:
+            raise ValueError(f"Circular dependency on measurement {measurement.name}")
+        visiting.add(measurement.name)
+        for dependency in measurement.dependencies:
+            visit(dependency)
+        visiting.remove(measurement.name)
+        graph[measurement.name] = requested.get(measurement.name) or DataMeasurementFactory.create(
+            measurement, options=options.get(measurement.name), **kwargs
+        )
+
+    for m in measurements:
+        visit(m.__class__)
+
+    return graph
+
+
+def measurement_stages(graph: Dict[str, DataMeasurement]) -> List[List[DataMeasurement]]:
+    """
+    Groups a topologically ordered graph into stages. Measurements within a stage only depend on earlier stages,
+    so they can run concurrently.
+    """
+    levels = {}
+    for name, measurement in graph.items():
+        levels[name] = 1 + max((levels[d.name] for d in measurement.dependencies), default=-1)
+
+    stages = [[] for _ in range(max(levels.values(), default=-1) + 1)]
+    for name, measurement in graph.items():
+        stages[levels[name]].append(measurement)
+    return stages
+
+
+def _num_rows(dataset: Union[Dataset, IterableDataset]) -> Optional[int]:
+    return len(dataset) if isinstance(dataset, Dataset) else None
+
+
+def _measure(measurement: DataMeasurement, dataset: Dataset) -> DataMeasurementResults:
+    return measurement.measure(dataset=dataset)
+
+
+def _profiled_measure(measurement: DataMeasurement, dataset: Dataset) -> Tuple[DataMeasurementResults, StageProfile]:
+    # Profiled in the worker, so that CPU time and memory are those of the measurement
+    with profile_stage(measurement.name, num_rows=_num_rows(dataset)) as profile:
+        results = measurement.measure(dataset=dataset)
+    return results, profile
+
+
+def _measure_shard(
+    shard: Tuple[int, Dataset], measurements: List[DataMeasurement], batch_size: int, profile: bool
+) -> Tuple[Dict[str, MeasurementState], Optional[StageProfile]]:
+    index, dataset = shard
+    with profile_stage(f"shard_{index}", num_rows=len(dataset)) if profile else nullcontext() as shard_profile:
+        states = {m.name: m.measure_partial(dataset, batch_size=batch_size) for m in measurements}
+    return states, shard_profile
 
 
 class DataMeasurementSuite:
     def __init__(
         self,
-        dataset: str,
+        dataset: Union[str, os.PathLike, Dataset, DatasetDict, IterableDataset],
         feature: str,
-        split: str,
+        split: Optional[str],
         measurements: List[Type[DataMeasurement]],
         tokenizer: Optional[Callable[[str], List[str]]] = None,
         label: Optional[str] = None,
+        streaming: bool = False,
+        cache: Optional[ResultsCache] = None,
+        tokenize_batch_size: int = 1000,
+        num_proc: Optional[int] = None,
+        token_ids: bool = False,
+        measurement_options: Optional[Dict[str, Dict[str, Any]]] = None,
     ):
-        # TODO: TEMPORARY
-        self.dataset: Dataset = load_dataset(dataset, split=split)
+        """
+        Args:
+            dataset: A hub dataset id, the path to a local Arrow/Parquet/JSON(L)/CSV file or `save_to_disk`
+                directory, or an already loaded dataset. Only the feature and label columns are loaded, and only
+                once a measurement needs rows.
+            tokenize_batch_size: Number of texts passed to the tokenizer at once.
+            num_proc: Number of processes tokenizing the dataset; defaults to tokenizing in this process.
+            token_ids: Store the tokenized dataset as int32 token ids into a single vocabulary rather than as
+                lists of strings. Tokenizers returning integer ids are used as they are. Sharded runs measure the
+                tokens.
+            measurement_options: Arguments of the measurements (and of their dependencies) other than those of the
+                suite, keyed by measurement name, e.g. `{"text_duplicates": {"max_listed": 100}}`.
+        """
+        self.source = DatasetSource(dataset, split=split, columns=[feature, label], streaming=streaming)
+        self._dataset: Optional[Union[Dataset, IterableDataset]] = None
+        self._dataset_fingerprint: Optional[str] = None
+        self.streaming = streaming
+        self.feature = feature
+        self.tokenizer = tokenizer
+        self.tokenize_batch_size = tokenize_batch_size
+        self.num_proc = num_proc
+        self.token_ids = token_ids
+        self.cache = cache
+        measurement_options = measurement_options or {}
         self.measurements = [
-            DataMeasurementFactory.create(m, tokenizer=tokenizer, feature=feature, label=label) for m in measurements
+            DataMeasurementFactory.create(
+                m,
+                options=measurement_options.get(m.name),
+                tokenizer=tokenizer,
+                feature=feature,
+                label=label,
+                cache=cache,
+                source=self.source,
+            )
+            for m in measurements
         ]
+        self.graph = build_measurement_graph(
+            self.measurements,
+            options=measurement_options,
+            tokenizer=tokenizer,
+            feature=feature,
+            label=label,
+            cache=cache,
+            source=self.source,
+        )
+        unknown = set(measurement_options) - set(self.graph)
+        if unknown:
+            raise ValueError(f"Options were given for measurements that aren't run: {', '.join(sorted(unknown))}")
+        # Measurement states of the rows measured so far, keyed by measurement name
+        self.states: Optional[Dict[str, MeasurementState]] = None
+        # Profile of the last run, when it was run with `profile=True`
+        self.profile_report: Optional[ProfileReport] = None
+
+    @property
+    def dataset(self) -> Union[Dataset, IterableDataset]:
+        if self._dataset is None:
+            with self._stage("load") as profile:
+                self._dataset = self.source.load()
+                profile.num_rows = _num_rows(self._dataset)
+        return self._dataset
+
+    @property
+    def dataset_fingerprint(self) -> Optional[str]:
+        if self._dataset_fingerprint is None:
+            self._dataset_fingerprint = self.source.fingerprint
+            if self._dataset_fingerprint is None and not self.streaming:
+                # Fall back to the fingerprint of the loaded dataset
+                self._dataset_fingerprint = getattr(self.dataset, "_fingerprint", None)
+        return self._dataset_fingerprint
+
+    @property
+    def tokenized(self) -> bool:
+        return any(isinstance(m, TokenizedDatasetMixin) for m in self.graph.values())
+
+    def run(
+        self,
+        executor: str = "serial",
+        num_workers: Optional[int] = None,
+        batch_size: int = 1000,
+        num_shards: Optional[int] = None,
+        profile: bool = False,
+    ) -> Dict[str, DataMeasurementResults]:
+        """
+        Args:
+            executor: How independent measurements (or shards) are run, one of "serial", "threads" or
+                "processes". Streaming suites update their measurements serially, batch after batch.
+            num_workers: Maximum number of concurrent workers; defaults to the number of CPUs.
+            batch_size: Number of rows per batch in streaming and sharded modes.
+            num_shards: When set, split the dataset into this many contiguous shards and measure them in parallel
+                instead of running each measurement over the whole dataset, see `run_sharded`.
+            profile: Record the wall time, CPU time, peak memory and throughput of loading, tokenization and each
+                measurement in `profile_report`.
+        """
+        if not profile:
+            self.profile_report = None
+            return self._run(executor=executor, num_workers=num_workers, batch_size=batch_size, num_shards=num_shards)
+
+        self.profile_report = ProfileReport()
+        # Trace memory for the whole run, so that stages running in threads don't stop each other's tracing
+        with trace_memory():
+            return self._run(executor=executor, num_workers=num_workers, batch_size=batch_size, num_shards=num_shards)
+
+    def _run(
+        self, executor: str, num_workers: Optional[int], batch_size: int, num_shards: Optional[int]
+    ) -> Dict[str, DataMeasurementResults]:
+        if self.streaming:
+            return self.run_streaming(batch_size=batch_size)
+
+        if self.cache is not None:
+            results = self.cached_results()
+            if results is not None:
+                return results
+
+        if num_shards is not None:
+            return self.run_sharded(
+                num_shards=num_shards, executor=executor, num_workers=num_workers, batch_size=batch_size
+            )
+
+        dataset = self._tokenized_dataset()
+        if self.tokenized and self.token_ids:
+            with self._stage("intern_tokens", num_rows=_num_rows(dataset)):
+                dataset, vocabulary = intern_dataset(dataset)
+            for measurement in self.graph.values():
+                if isinstance(measurement, TokenizedDatasetMixin):
+                    measurement.vocabulary = vocabulary
+
+        results = {}
+        for stage in measurement_stages(self.graph):
+            for measurement in stage:
+                measurement.upstream_results = {d.name: results[d.name] for d in measurement.dependencies}
+            if self.profile_report is None:
+                stage_results = parallel_map(
+                    partial(_measure, dataset=dataset), stage, executor=executor, num_workers=num_workers
+                )
+            else:
+                stage_results, profiles = zip(*parallel_map(
+                    partial(_profiled_measure, dataset=dataset), stage, executor=executor, num_workers=num_workers
+                ))
+                for profile in profiles:
+                    self.profile_report.add(profile)
+            results.update(zip([m.name for m in stage], stage_results))
+
+        return {m.name: results[m.name] for m in self.measurements}
+
+    def run_sharded(
+        self,
+        num_shards: int,
+        executor: str = "processes",
+        num_workers: Optional[int] = None,
+        batch_size: int = 1000,
+    ) -> Dict[str, DataMeasurementResults]:
+        """
+        Splits the dataset into `num_shards` contiguous shards, computes the state of every measurement on each
+        shard in parallel, and merges the states in shard order. Since merging shard states is equivalent to
+        measuring the whole dataset, the results are identical to those of a serial run, and are cached as a
+        serial run caches them.
+
+        Shards are measured on the tokens rather than on token ids, `token_ids` only applies to serial runs.
+        """
+        dataset = self._tokenized_dataset()
+        if self.cache is not None:
+            self._key_on_source()
+        # Measurements already in the cache aren't measured again, as in a serial run
+        results = {name: self._cached_result(measurement, dataset) for name, measurement in self.graph.items()}
+        results = {name: result for name, result in results.items() if result is not None}
+        measurements = [measurement for name, measurement in self.graph.items() if name not in results]
+
+        shards = [(i, dataset.shard(num_shards=num_shards, index=i, contiguous=True)) for i in range(num_shards)]
+        shard_states, profiles = zip(*parallel_map(
+            partial(
+                _measure_shard,
+                measurements=measurements,
+                batch_size=batch_size,
+                profile=self.profile_report is not None,
+            ),
+            shards,
+            executor=executor,
+            num_workers=num_workers,
+        ))
+        if self.profile_report is not None:
+            for profile in profiles:
+                self.profile_report.add(profile)
+
+        for measurement in measurements:
+            measurement.upstream_results = {d.name: results[d.name] for d in measurement.dependencies}
+            with self._stage(measurement.name):
+                results[measurement.name] = measurement.merge_partials(
+                    [states[measurement.name] for states in shard_states]
+                )
+            if isinstance(measurement, CachedMeasurementMixin) and measurement.cache is not None:
+                key = measurement.cache_key(dataset)
+                if key is not None:
+                    measurement.store_results(key, results[measurement.name])
+
+        return {m.name: results[m.name] for m in self.measurements}
+
+    @staticmethod
+    def _cached_result(measurement: DataMeasurement, dataset: Dataset) -> Optional[DataMeasurementResults]:
+        if not isinstance(measurement, CachedMeasurementMixin) or measurement.cache is None:
+            return None
+        return measurement.cached_results(dataset)
+
+    def _key_on_source(self) -> Optional[str]:
+        dataset_fingerprint = self.dataset_fingerprint
+        if dataset_fingerprint is not None:
+            for measurement in self.graph.values():
+                if isinstance(measurement, CachedMeasurementMixin):
+                    # Cache keys refer to the source of the dataset, not to the tokenized copy that is measured
+                    measurement.dataset_fingerprint = dataset_fingerprint
+        return dataset_fingerprint
+
+    def cached_results(self) -> Optional[Dict[str, DataMeasurementResults]]:
+        """
+        Results of the requested measurements if they are all in the cache, found without tokenizing the dataset.
+        """
+        if self._key_on_source() is None:
+            return None
+
+        results = {
+            m.name: m.cached_results() if isinstance(m, CachedMeasurementMixin) else None for m in self.measurements
+        }
+        return results if all(r is not None for r in results.values()) else None
+
+    def run_streaming(self, batch_size: int = 1000) -> Dict[str, DataMeasurementResults]:
+        """
+        Measures the dataset in a single pass over its Arrow batches: every batch is tokenized once and fed to each
+        measurement's state, so memory is bounded by the batch size and the measurement states. The states are
+        kept on the suite, so that rows appended later can be measured with `update`, until `close` is called.
+        """
+        self.close()
+        self.states = {name: measurement.create_state() for name, measurement in self.graph.items()}
+        dataset = self.dataset
+        with self._stage("stream") as profile:
+            profile.num_rows = self._update_states(
+                dataset, batch_size=batch_size, profile=self.profile_report is not None
+            )
+        return self._results_from_states()
+
+    def update(
+        self, new_rows: Union[Dataset, IterableDataset], batch_size: int = 1000
+    ) -> Dict[str, DataMeasurementResults]:
+        """
+        Measures rows appended to the dataset since the states were computed (by `run_streaming` or `load_state`),
+        in time proportional to the number of new rows, and returns the results for the whole dataset.
+        """
+        if self.states is None:
+            raise ValueError("There is no measurement state to update, run the suite or load a state first.")
+        self._update_states(new_rows, batch_size=batch_size)
+        return self._results_from_states()
+
+    def close(self):
+        """
+        Releases the measurement states kept for `update` (e.g. the spilled text hashes).
+        """
+        if self.states is not None:
+            for state in self.states.values():
+                state.close()
+            self.states = None
+
+    def save_state(self, path: Union[str, Path]):
+        if self.states is None:
+            raise ValueError("There is no measurement state to save, run the suite first.")
+        with open(path, "wb") as f:
+            pickle.dump({"feature": self.feature, "states": self.states}, f)
+
+    def load_state(self, path: Union[str, Path]):
+        with open(path, "rb") as f:
+            saved = pickle.load(f)
+
+        if saved["feature"] != self.feature:
+            raise ValueError(f"The saved state measures feature {saved['feature']}, not {self.feature}.")
+        missing = [name for name in self.graph if name not in saved["states"]]
+        if missing:
+            raise ValueError(f"The saved state has no state for measurements {missing}.")
+
+        self.close()
+        self.states = {name: saved["states"][name] for name in self.graph}
+
+    def _update_states(
+        self, dataset: Union[Dataset, IterableDataset], batch_size: int, profile: bool = False
+    ) -> int:
+        # Time spent tokenizing and in the updates of each measurement, summed over the batches
+        profiles = {}
+        if profile:
+            profiles = {name: StageProfile(f"update_{name}") for name in self.states}
+            if self.tokenized:
+                profiles["tokenize"] = StageProfile("tokenize")
+
+        num_rows = 0
+        for batch in iter_arrow_batches(dataset, batch_size=batch_size):
+            if self.tokenized:
+                with accumulate_time(profiles["tokenize"]) if profile else nullcontext():
+                    batch = tokenize_batch(batch, feature=self.feature, tokenizer=self.tokenizer)
+            for name, state in self.states.items():
+                with accumulate_time(profiles[name]) if profile else nullcontext():
+                    state.update(batch)
+            num_rows += batch.num_rows
+
+        for stage in profiles.values():
+            stage.num_rows = num_rows
+            self.profile_report.add(stage)
+        return num_rows
+
+    def _results_from_states(self) -> Dict[str, DataMeasurementResults]:
+        results = {}
+        for name, measurement in self.graph.items():
+            measurement.upstream_results = {d.name: results[d.name] for d in measurement.dependencies}
+            with self._stage(name):
+                results[name] = measurement.results_from_state(self.states[name])
+
+        return {m.name: results[m.name] for m in self.measurements}
+
+    def _tokenized_dataset(self) -> Dataset:
+        dataset = self.dataset
+        if self.tokenized:
+            # Tokenize once, every tokenized measurement then reuses the shared column
+            with self._stage("tokenize", num_rows=_num_rows(dataset)):
+                dataset = tokenize_dataset(
+                    dataset,
+                    feature=self.feature,
+                    tokenizer=self.tokenizer,
+                    batch_size=self.tokenize_batch_size,
+                    num_proc=self.num_proc,
+                    cache_dir=self.cache.tokenized_dir if self.cache is not None else None,
+                    dataset_fingerprint=self.dataset_fingerprint if self.cache is not None else None,
+                )
+            if self.cache is not None:
+                self.cache.use_tokenized(dataset)
+        return dataset
 
-    def run(self) -> Dict[str, DataMeasurementResults]:
-        return {m.name: m.measure(dataset=self.dataset) for m in self.measurements}
+    def _stage(self, name: str, num_rows: Optional[int] = None) -> ContextManager[StageProfile]:
+        if self.profile_report is None:
+            return nullcontext(StageProfile(name, num_rows=num_rows))
+        return self.profile_report.stage(name, num_rows=num_rows)
 
     @property
     def widgets(self) -> List[Widget]:
@@ -1,13 +1,18 @@
 from .base import DataMeasurement, DataMeasurementFactory, DataMeasurementResults
 from .cooccurences import Cooccurences, CooccurencesResults
-from .general_stats import GeneralStats, GeneralStatsResults
+from .general_stats import ApproximateGeneralStats, GeneralStats, GeneralStatsResults
 from .label_distribution import LabelDistribution, LabelDistributionResults
+from .near_duplicates import NearDuplicates, NearDuplicatesResults
 from .pmi import PMI, PMIResults
+from .split_overlap import SplitOverlap, SplitOverlapResults
 from .text_duplicates import TextDuplicates, TextDuplicatesResults
 from .text_lengths import TextLengths, TextLengthsResults
+from .vocabulary import VocabularyCounts, VocabularyCountsResults
+from .zipf import Zipf, ZipfResults
 
 
 __all__ = [
+    "ApproximateGeneralStats",
     "DataMeasurement",
     "DataMeasurementFactory",
     "DataMeasurementResults",
@@ -17,10 +22,18 @@ __all__ = [
     "GeneralStatsResults",
     "LabelDistribution",
     "LabelDistributionResults",
+    "NearDuplicates",
+    "NearDuplicatesResults",
     "PMI",
     "PMIResults",
+    "SplitOverlap",
+    "SplitOverlapResults",
     "TextDuplicates",
     "TextDuplicatesResults",
     "TextLengths",
     "TextLengthsResults",
+    "VocabularyCounts",
+    "VocabularyCountsResults",
+    "Zipf",
+    "ZipfResults",
 ]
@@ -1,12 +1,25 @@
 import abc
+import os
 from abc import ABC
-from typing import Callable, Dict, List, Type
+from functools import reduce, wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, Union
 
 import evaluate
-from datasets import Dataset
+import pyarrow as pa
+import pyarrow.compute as pc
+from datasets import Dataset, concatenate_datasets
 from evaluate import load as load_metric
 import gradio as gr
 
+from data_measurements.cache import ResultsCache, cache_key, fingerprint
+from data_measurements.dataset_source import DatasetSource
+from data_measurements.streaming import iter_arrow_batches
+
+
+TOKENIZED_FIELD = "tokenized_text"
+TOKEN_IDS_FIELD = "token_ids"
+
 
 class DataMeasurementResults(ABC):
     @abc.abstractmethod
@@ -18,6 +31,29 @@ class DataMeasurementResults(ABC):
         raise NotImplementedError()
 
 
+class MeasurementState:
+    """
+    Partial state of a measurement, accumulated over Arrow batches and mergeable with the states of other shards.
+    The base state keeps nothing, which suits measurements that are derived entirely from their dependencies.
+    """
+
+    def update(self, batch: pa.Table) -> None:
+        pass
+
+    def merge(self, other: "MeasurementState") -> "MeasurementState":
+        """
+        Merges the state of another shard into this one and returns it. Merging is associative, and merging
+        states in shard order gives the same state as updating a single state with all the shards' batches.
+        """
+        return self
+
+    def close(self) -> None:
+        """
+        Releases what the state holds outside of memory (e.g. spilled files). It can't be updated afterwards.
+        """
+        pass
+
+
 class Widget(ABC):
     @abc.abstractmethod
     def render(self):
@@ -38,8 +74,14 @@ class Widget(ABC):
 
 
 class DataMeasurement(ABC):
+    # Measurements (or intermediate artifacts) whose results this measurement consumes
+    dependencies: List[Type["DataMeasurement"]] = []
+
     def __init__(self, feature: str, *args, **kwargs):
         self.feature = feature
+        # Filled in by the suite with the results of `dependencies`, keyed by name
+        self.upstream_results: Dict[str, DataMeasurementResults] = {}
+        self.state: Optional[MeasurementState] = None
 
     @property
     @abc.abstractmethod
@@ -55,6 +97,56 @@ class DataMeasurement(ABC):
     def measure(self, dataset) -> DataMeasurementResults:
         raise NotImplementedError()
 
+    def create_state(self) -> MeasurementState:
+        raise NotImplementedError()
+
+    def results_from_state(self, state: MeasurementState) -> DataMeasurementResults:
+        raise NotImplementedError()
+
+    def update(self, batch: pa.Table) -> None:
+        if self.state is None:
+            self.state = self.create_state()
+        self.state.update(batch)
+
+    def finalize(self) -> DataMeasurementResults:
+        state = self.state if self.state is not None else self.create_state()
+        self.state = None
+        try:
+            return self.results_from_state(state)
+        finally:
+            state.close()
+
+    def measure_partial(self, dataset: Dataset, batch_size: int = 1000) -> MeasurementState:
+        state = self.create_state()
+        for batch in iter_arrow_batches(dataset, batch_size=batch_size):
+            state.update(batch)
+        return state
+
+    def merge_partials(self, states: List[MeasurementState]) -> DataMeasurementResults:
+        # Measurements with dependencies expect `upstream_results` to hold their merged results
+        merged = reduce(lambda merged, state: merged.merge(state), states)
+        try:
+            return self.results_from_state(merged)
+        finally:
+            merged.close()
+
+    def dependency_results(self, measurement: Type["DataMeasurement"], dataset) -> DataMeasurementResults:
+        # When run outside of a suite, compute the upstream measurement here. The results dict is shared so
+        # that dependencies common to several upstream measurements are still only computed once.
+        if measurement.name not in self.upstream_results:
+            upstream = DataMeasurementFactory.create(
+                measurement,
+                feature=self.feature,
+                tokenizer=getattr(self, "tokenizer", None),
+                label=self.feature,
+                cache=getattr(self, "cache", None),
+            )
+            upstream.upstream_results = self.upstream_results
+            if isinstance(upstream, TokenizedDatasetMixin):
+                upstream.vocabulary = getattr(self, "vocabulary", None)
+            self.upstream_results[measurement.name] = upstream.measure(dataset)
+        return self.upstream_results[measurement.name]
+
     @classmethod
     def standalone(cls, dataset, *args, **kwargs):
         with gr.Blocks() as demo:
@@ -78,7 +170,12 @@ class DataMeasurement(ABC):
 
 class DataMeasurementFactory:
     @classmethod
-    def create(cls, measurement: Type[DataMeasurement], *args, **kwargs):
+    def create(
+        cls, measurement: Type[DataMeasurement], *args, options: Optional[Dict[str, Any]] = None, **kwargs
+    ):
+        """
+        Creates a measurement with the arguments of the suite it's in that apply to it, and its own `options`.
+        """
         arguments = {"feature": kwargs["feature"]}
 
         if issubclass(measurement, TokenizedDatasetMixin):
@@ -87,7 +184,13 @@ class DataMeasurementFactory:
         if issubclass(measurement, LabelMeasurementMixin):
             arguments["feature"] = kwargs["label"]
 
-        return measurement(**arguments)
+        if issubclass(measurement, CachedMeasurementMixin):
+            arguments["cache"] = kwargs.get("cache")
+
+        if issubclass(measurement, SourceMeasurementMixin):
+            arguments["source"] = kwargs.get("source")
+
+        return measurement(**arguments, **(options or {}))
 
 
 class EvaluateMixin:
@@ -102,17 +205,263 @@ class EvaluateMixin:
         return self.metric.compute(data=dataset[self.feature], *args, **kwargs)
 
 
+def batch_tokenizer(tokenizer: Callable[[str], List[str]]) -> Callable[[List[str]], List[List[str]]]:
+    """
+    Tokenizes a list of texts at once with the tokenizer's batch API when it has one: a `batch_tokenize` method,
+    or the Rust backend of a fast HF tokenizer (giving the tokens of `tokenizer.tokenize`). Any other tokenizer is
+    called on each text.
+    """
+    if hasattr(tokenizer, "batch_tokenize"):
+        return tokenizer.batch_tokenize
+    if getattr(tokenizer, "is_fast", False) and hasattr(tokenizer, "backend_tokenizer"):
+        return lambda texts: [
+            encoding.tokens for encoding in tokenizer.backend_tokenizer.encode_batch(texts, add_special_tokens=False)
+        ]
+    return lambda texts: [tokenizer(text) for text in texts]
+
+
+def tokenized_cache_file(
+    cache_dir: Union[str, os.PathLike], dataset_fingerprint: str, feature: str, tokenizer: Callable[[str], List[str]]
+) -> Optional[str]:
+    """
+    Arrow file of the tokenized column of a dataset's feature, or None if the tokenizer can't be fingerprinted (in
+    which case the tokenized column isn't persisted).
+    """
+    tokenizer_fingerprint = fingerprint(tokenizer)
+    if tokenizer_fingerprint is None:
+        return None
+    key = cache_key({"dataset": dataset_fingerprint, "feature": feature, "tokenizer": tokenizer_fingerprint})
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    return str(Path(cache_dir) / f"tokenized-{key}.arrow")
+
+
+def tokenize_dataset(
+    dataset: Dataset,
+    feature: str,
+    tokenizer: Callable[[str], List[str]],
+    batch_size: int = 1000,
+    num_proc: Optional[int] = None,
+    cache_dir: Optional[Union[str, os.PathLike]] = None,
+    dataset_fingerprint: Optional[str] = None,
+) -> Dataset:
+    """
+    Args:
+        cache_dir: Where to persist the tokenized column. It's then memory-mapped from there, rather than
+            tokenized again, by later calls on the same dataset, feature and tokenizer.
+        dataset_fingerprint: Identifies the dataset in the cache, defaults to the fingerprint of `dataset`.
+    """
+    map_kwargs = dict(batched=True, batch_size=batch_size, num_proc=num_proc, remove_columns=[feature])
+    if cache_dir is not None:
+        cache_file_name = tokenized_cache_file(
+            cache_dir, dataset_fingerprint or dataset._fingerprint, feature=feature, tokenizer=tokenizer
+        )
+        if cache_file_name is not None:
+            map_kwargs.update(cache_file_name=cache_file_name, load_from_cache_file=True)
+
+    # Only the feature is read and only the tokenized column is written, then put alongside the other columns
+    features = dataset.select_columns([feature])
+    if hasattr(tokenizer, "tokenize_arrow"):
+        # Arrow tokenizers work on whole Arrow batches, without converting texts to Python
+        tokenized = features.with_format("arrow").map(
+            lambda batch: pa.table({TOKENIZED_FIELD: tokenizer.tokenize_arrow(batch.column(feature))}),
+            **map_kwargs,
+        ).with_format(None)
+    else:
+        tokenize = batch_tokenizer(tokenizer)
+        tokenized = features.map(lambda batch: {TOKENIZED_FIELD: tokenize(batch[feature])}, **map_kwargs)
+    return concatenate_datasets([dataset, tokenized], axis=1)
+
+
+def tokenize_batch(batch: pa.Table, feature: str, tokenizer: Callable[[str], List[str]]) -> pa.Table:
+    if hasattr(tokenizer, "tokenize_arrow"):
+        tokenized = tokenizer.tokenize_arrow(batch.column(feature))
+    else:
+        tokenized = pa.array(batch_tokenizer(tokenizer)(batch.column(feature).to_pylist()))
+    return batch.append_column(TOKENIZED_FIELD, tokenized)
+
+
+def count_values(values: Union[pa.Array, pa.ChunkedArray]) -> Dict[Any, int]:
+    """
+    Number of occurrences of each distinct value. The values are counted in Arrow, so that only the distinct ones
+    become Python objects, which keeps per-batch state updates cheap.
+    """
+    counts = pc.value_counts(values)
+    return dict(zip(counts.field("values").to_pylist(), counts.field("counts").to_pylist()))
+
+
+def intern_tokens(tokens: Union[pa.Array, pa.ChunkedArray]) -> Tuple[pa.ListArray, Optional[pa.Array]]:
+    """
+    Replaces the tokens of a tokenized column by int32 ids into a vocabulary of its distinct tokens, in order of
+    first appearance. Tokens that already are integer ids (e.g. from HF tokenizers) are kept as they are, and
+    have no vocabulary.
+    """
+    if isinstance(tokens, pa.ChunkedArray):
+        tokens = tokens.combine_chunks()
+    if pa.types.is_integer(tokens.type.value_type):
+        return tokens, None
+
+    values = tokens.flatten()
+    vocabulary = pc.unique(values)
+    ids = pc.index_in(values, value_set=vocabulary).cast(pa.int32())
+    offsets = pc.subtract(tokens.offsets, tokens.offsets[0])
+    return pa.ListArray.from_arrays(offsets, ids, mask=tokens.is_null()), vocabulary
+
+
+def intern_dataset(dataset: Dataset) -> Tuple[Dataset, Optional[pa.Array]]:
+    """
+    Swaps the tokenized column of a dataset for a token ids column, and returns the vocabulary the ids index.
+    """
+    ids, vocabulary = intern_tokens(dataset.with_format("arrow")[TOKENIZED_FIELD])
+    if vocabulary is None:
+        return dataset.rename_column(TOKENIZED_FIELD, TOKEN_IDS_FIELD), None
+    return dataset.remove_columns(TOKENIZED_FIELD).add_column(TOKEN_IDS_FIELD, ids), vocabulary
+
+
 class TokenizedDatasetMixin:
     tokenizer: Callable[[str], List[str]]
     feature: str
-
-    def __init__(self, tokenizer: Callable[[str], List[str]], *args, **kwargs):
+    # Vocabulary indexed by the token ids column, when the suite has interned the tokens of the dataset
+    vocabulary: Optional[pa.Array] = None
+
+    def __init__(
+        self,
+        tokenizer: Callable[[str], List[str]],
+        *args,
+        tokenize_batch_size: int = 1000,
+        num_proc: Optional[int] = None,
+        **kwargs,
+    ):
         self.tokenizer = tokenizer
+        self.tokenize_batch_size = tokenize_batch_size
+        self.num_proc = num_proc
         super().__init__(*args, **kwargs)
 
+    def measure_partial(self, dataset: Dataset, *args, **kwargs) -> MeasurementState:
+        return super().measure_partial(self.tokenize_dataset(dataset), *args, **kwargs)
+
     def tokenize_dataset(self, dataset: Dataset) -> Dataset:
-        return dataset.map(lambda x: {**x, "tokenized_text": self.tokenizer(x[self.feature])})
+        # The suite tokenizes once up front and shares the column between all tokenized measurements
+        if TOKENIZED_FIELD in dataset.column_names or TOKEN_IDS_FIELD in dataset.column_names:
+            return dataset
+        # Cached measurements also persist their tokenized column next to their results
+        cache = getattr(self, "cache", None)
+        dataset = tokenize_dataset(
+            dataset,
+            feature=self.feature,
+            tokenizer=self.tokenizer,
+            batch_size=self.tokenize_batch_size,
+            num_proc=self.num_proc,
+            cache_dir=cache.tokenized_dir if cache is not None else None,
+            dataset_fingerprint=getattr(self, "dataset_fingerprint", None),
+        )
+        if cache is not None:
+            cache.use_tokenized(dataset)
+        return dataset
+
+    def tokens(self, dataset: Dataset) -> pa.ChunkedArray:
+        """
+        The tokens (or token ids) of each instance of a tokenized dataset.
+        """
+        field = TOKEN_IDS_FIELD if TOKEN_IDS_FIELD in dataset.column_names else TOKENIZED_FIELD
+        return dataset.with_format("arrow")[field]
+
+    def token_ids(self, dataset: Dataset) -> Tuple[pa.ListArray, Optional[pa.Array]]:
+        """
+        The token ids of each instance of a tokenized dataset and the vocabulary they index, interning the tokens
+        if the suite hasn't.
+        """
+        if TOKEN_IDS_FIELD in dataset.column_names:
+            return self.tokens(dataset).combine_chunks(), self.vocabulary
+        return intern_tokens(self.tokens(dataset))
 
 
 class LabelMeasurementMixin:
     pass
+
+
+class SourceMeasurementMixin:
+    """
+    Measurements which read other splits of the measured dataset, e.g. to compare them. The suite passes the
+    source of its rows.
+    """
+
+    def __init__(self, *args, source: Optional[DatasetSource] = None, **kwargs):
+        self.source = source
+        super().__init__(*args, **kwargs)
+
+
+def _cached_measure(measure: Callable) -> Callable:
+    @wraps(measure)
+    def cached_measure(self, dataset: Dataset) -> DataMeasurementResults:
+        # Only the most derived measure() caches, so that subclasses calling super().measure() aren't stored
+        # twice under the same key
+        if getattr(self, "cache", None) is None or getattr(type(self), "measure") is not cached_measure:
+            return measure(self, dataset)
+
+        key = self.cache_key(dataset)
+        results = self.cache.get(key) if key is not None else None
+        if results is None:
+            results = measure(self, dataset)
+            if key is not None:
+                self.store_results(key, results)
+        return results
+
+    return cached_measure
+
+
+class CachedMeasurementMixin:
+    """
+    Returns the stored results when the measurement was already computed on the same dataset, split, feature and
+    tokenizer. Results are keyed by content, so bumping `version` invalidates the results of older code.
+    """
+    name: str
+    feature: str
+    version: str = "1"
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Measurements define measure() themselves, which would shadow a mixin method, so wrap it instead
+        if "measure" in cls.__dict__:
+            cls.measure = _cached_measure(cls.__dict__["measure"])
+
+    def __init__(self, *args, cache: Optional[ResultsCache] = None, **kwargs):
+        self.cache = cache
+        # Fingerprint of the dataset as loaded, set by the suite since it measures a tokenized copy of it
+        self.dataset_fingerprint: Optional[str] = None
+        super().__init__(*args, **kwargs)
+
+    def cache_key(self, dataset: Optional[Dataset] = None) -> Optional[str]:
+        if self.cache is None:
+            return None
+
+        components = {
+            # The suite identifies the dataset and split it loads, without needing to load it
+            "dataset": self.dataset_fingerprint or [dataset._fingerprint, str(dataset.split)],
+            "feature": self.feature,
+            "measurement": f"{type(self).__module__}.{type(self).__qualname__}",
+            "version": self.version,
+            "config": self.cache_config(),
+        }
+        if isinstance(self, TokenizedDatasetMixin):
+            components["tokenizer"] = fingerprint(self.tokenizer)
+            if components["tokenizer"] is None:
+                return None
+        return cache_key(components)
+
+    def cache_config(self) -> Dict[str, Any]:
+        """
+        Options of the measurement which change its results, so that results of other options aren't reused.
+        """
+        return {}
+
+    def store_results(self, key: str, results: DataMeasurementResults):
+        self.cache.set(key, results)
+
+    def cached_results(self, dataset: Optional[Dataset] = None) -> Optional[DataMeasurementResults]:
+        key = self.cache_key(dataset)
+        return self.cache.get(key) if key is not None else None
+
+    def invalidate_cache(self, dataset: Optional[Dataset] = None):
+        key = self.cache_key(dataset)
+        if key is not None:
+            self.cache.invalidate(key)
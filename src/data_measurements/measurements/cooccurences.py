@@ -1,15 +1,40 @@
-import numpy.typing as np
+from collections import Counter
+from typing import List
+
+import gradio as gr
+import numpy as np
+import numpy.typing as npt
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 from datasets import Dataset
-from sklearn.preprocessing import MultiLabelBinarizer
-
-from data_measurements.measurements.base import DataMeasurement, DataMeasurementResults, TokenizedDatasetMixin
-
-
-
-def count_words_per_sentence(dataset, vocabulary) -> np.NDArray:
-    mlb = MultiLabelBinarizer(classes=vocabulary)
-    return mlb.fit_transform(dataset["tokenized_text"])
+from scipy.sparse import csr_matrix
+
+from data_measurements.measurements.base import (
+    TOKENIZED_FIELD,
+    CachedMeasurementMixin,
+    DataMeasurement,
+    DataMeasurementResults,
+    MeasurementState,
+    TokenizedDatasetMixin,
+    Widget,
+)
+from data_measurements.measurements.vocabulary import VocabularyCounts, VocabularyIndex
+
+
+def count_cooccurences(
+    instances: npt.NDArray, words: npt.NDArray, num_instances: int, num_words: int, terms: npt.NDArray
+) -> csr_matrix:
+    """
+    Number of instances in which each word (column of `words`) appears with each term, a num_words x len(terms)
+    sparse matrix. `instances` and `words` are the instance and word code of every token.
+    """
+    # Binary instance x word matrix, so each instance counts once per pair
+    words_per_instance = csr_matrix(
+        (np.ones(len(words), dtype=np.int64), (instances, words)), shape=(num_instances, num_words)
+    )
+    words_per_instance.data[:] = 1
+    return words_per_instance.T @ words_per_instance[:, terms]
 
 
 class CooccurencesResults(DataMeasurementResults):
@@ -19,6 +44,7 @@ class CooccurencesResults(DataMeasurementResults):
     def __eq__(self, other):
         if isinstance(other, CooccurencesResults):
             try:
+                assert self.matrix.equals(other.matrix)
                 return True
             except AssertionError:
                 return False
@@ -29,10 +55,59 @@ class CooccurencesResults(DataMeasurementResults):
         pass
 
 
-class Cooccurences(TokenizedDatasetMixin, DataMeasurement):
+class CooccurencesWidget(Widget):
+    def __init__(self):
+        self.cooccurences_text = gr.Markdown(
+            render=False,
+            value="Use this widget to see how often each word appears in the same instance as an identity term.",
+        )
+        self.cooccurences_df = gr.DataFrame(render=False)
+
+    def render(self):
+        with gr.TabItem("Co-occurrences"):
+            self.cooccurences_text.render()
+            self.cooccurences_df.render()
+
+    def update(self, results: CooccurencesResults):
+        return {self.cooccurences_df: results.matrix.reset_index(names="word")}
+
+    @property
+    def output_components(self):
+        return [self.cooccurences_df]
+
+    def add_events(self, state: gr.State):
+        pass
+
+
+class CooccurencesState(MeasurementState):
+    def __init__(self, identity_terms: List[str]):
+        self.identity_terms = set(identity_terms)
+        # (word, identity term) -> number of instances containing both
+        self.pair_counts = Counter()
+
+    def update(self, batch: pa.Table):
+        tokenized = batch.column(TOKENIZED_FIELD).combine_chunks()
+        rows = pc.list_parent_indices(tokenized).to_numpy()
+        codes, words = pd.factorize(pc.list_flatten(tokenized).to_numpy(zero_copy_only=False))
+        term_codes = [code for code, word in enumerate(words) if word in self.identity_terms]
+        if not term_codes:
+            return
+
+        pairs = count_cooccurences(rows, codes, len(tokenized), len(words), term_codes).tocoo()
+        for word, term, count in zip(pairs.row, pairs.col, pairs.data):
+            self.pair_counts[(words[word], words[term_codes[term]])] += int(count)
+
+    def merge(self, other: "CooccurencesState") -> "CooccurencesState":
+        self.pair_counts.update(other.pair_counts)
+        return self
+
+
+class Cooccurences(CachedMeasurementMixin, TokenizedDatasetMixin, DataMeasurement):
     # TODO: Closed Class words should be included...
 
     name = "cooccurences"
+    widget = CooccurencesWidget
+    dependencies = [VocabularyCounts]
     identity_terms = [
         "man",
         "woman",
@@ -62,18 +137,44 @@ class Cooccurences(TokenizedDatasetMixin, DataMeasurement):
 
     def measure(self, dataset: Dataset) -> CooccurencesResults:
         dataset = self.tokenize_dataset(dataset)
-        word_count_df = count_vocab_frequencies(dataset)
-        vocabulary = word_count_df.index
-        word_counts_per_sentence = count_words_per_sentence(dataset, vocabulary)
-
-        present_terms = vocabulary.intersection(self.identity_terms)
-        min_count = word_count_df.loc[present_terms] >= self.min_count
-        present_terms = min_count.loc[min_count["count"]].index
-
-        subgroup = pd.DataFrame(word_counts_per_sentence).T.set_index(vocabulary).loc[present_terms].T
-        matrix = pd.DataFrame(word_counts_per_sentence.T.dot(subgroup))
-
-        matrix.columns = present_terms
-        matrix.index = vocabulary
-
-        return CooccurencesResults(matrix=matrix)
+        vocabulary_index = self.dependency_results(VocabularyCounts, dataset).vocabulary_index
+        vocabulary = vocabulary_index.token_index
+        present_terms = self.present_terms(vocabulary_index)
+
+        ids, id_vocabulary = self.token_ids(dataset)
+        values = ids.flatten().to_numpy()
+        # Position in the vocabulary counts of every token id
+        tokens = np.arange(values.max(initial=-1) + 1) if id_vocabulary is None else id_vocabulary
+        positions = vocabulary_index.ids(tokens)
+        matrix = count_cooccurences(
+            pc.list_parent_indices(ids).to_numpy(),
+            positions[values],
+            len(ids),
+            len(vocabulary),
+            vocabulary_index.ids(present_terms),
+        )
+
+        return CooccurencesResults(matrix=pd.DataFrame(matrix.toarray(), index=vocabulary, columns=present_terms))
+
+    def present_terms(self, vocabulary_index: VocabularyIndex) -> pd.Index:
+        present_terms = vocabulary_index.token_index.intersection(self.identity_terms)
+        return present_terms[vocabulary_index.counts[vocabulary_index.ids(present_terms)] >= self.min_count]
+
+    def create_state(self) -> CooccurencesState:
+        return CooccurencesState(self.identity_terms)
+
+    def results_from_state(self, state: CooccurencesState) -> CooccurencesResults:
+        vocabulary_index = self.upstream_results[VocabularyCounts.name].vocabulary_index
+        vocabulary = vocabulary_index.token_index
+        present_terms = self.present_terms(vocabulary_index)
+
+        matrix = np.zeros((len(vocabulary), len(present_terms)), dtype=np.int64)
+        if state.pair_counts:
+            words, terms = zip(*state.pair_counts.keys())
+            word_idx = vocabulary.get_indexer(words)
+            term_idx = present_terms.get_indexer(terms)
+            # Terms below min_count are not part of the matrix
+            kept = term_idx >= 0
+            matrix[word_idx[kept], term_idx[kept]] = np.fromiter(state.pair_counts.values(), dtype=np.int64)[kept]
+
+        return CooccurencesResults(matrix=pd.DataFrame(matrix, index=vocabulary, columns=present_terms))
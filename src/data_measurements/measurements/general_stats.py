@@ -1,35 +1,38 @@
+from typing import Any, Dict, Optional, Tuple, Union
+
 from datasets import Dataset
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import gradio as gr
-import nltk
-from nltk.corpus import stopwords
 
+from data_measurements.closed_class import closed_class_words
+from data_measurements.hash_counts import hash_texts
 from data_measurements.measurements.base import (
+    TOKEN_IDS_FIELD,
+    TOKENIZED_FIELD,
+    CachedMeasurementMixin,
     DataMeasurement,
     DataMeasurementResults,
+    MeasurementState,
     TokenizedDatasetMixin,
     Widget
 )
-from data_measurements.measurements.text_duplicates import TextDuplicates
+from data_measurements.measurements.text_duplicates import TextDuplicates, TextDuplicatesResults
+from data_measurements.measurements.vocabulary import (
+    CNT,
+    PROP,
+    VocabularyCounts,
+    VocabularyIndex,
+)
+from data_measurements.sketches import HyperLogLog, SpaceSaving
 
 
 import utils
 
 logs = utils.prepare_logging(__file__)
 
-CNT = "count"
-VOCAB = "vocab"
-PROP = "proportion"
-# TODO: Read this in depending on chosen language / expand beyond english
-nltk.download("stopwords", quiet=True)
-_CLOSED_CLASS = (
-        stopwords.words("english")
-        + ["t", "n", "ll", "d", "s"]
-        + ["wasn", "weren", "won", "aren", "wouldn", "shouldn", "didn", "don",
-           "hasn", "ain", "couldn", "doesn", "hadn", "haven", "isn", "mightn",
-           "mustn", "needn", "shan", "would", "could", "dont"]
-        + [str(i) for i in range(0, 99)]
-)
 _TOP_N = 100
 
 
@@ -41,12 +44,24 @@ class GeneralStatsResults(DataMeasurementResults):
             sorted_top_vocab_df,
             text_nan_count,
             dups_frac,
+            top_vocab_max_error=None,
+            distinct_documents=None,
+            empty_text_count=None,
+            whitespace_text_count=None,
+            feature=None,
     ):
         self.total_words = total_words
         self.total_open_words = total_open_words
         self.sorted_top_vocab_df = sorted_top_vocab_df
         self.text_nan_count = text_nan_count
         self.dups_frac = dups_frac
+        # Set when the top vocabulary is approximate: counts are overestimated by at most this much
+        self.top_vocab_max_error = top_vocab_max_error
+        self.distinct_documents = distinct_documents
+        # Texts of the feature which are empty, or only whitespace, besides the missing ones
+        self.empty_text_count = empty_text_count
+        self.whitespace_text_count = whitespace_text_count
+        self.feature = feature
 
     def __eq__(self, other):
         pass
@@ -73,19 +88,38 @@ class GeneralStatsWidget(Widget):
     def update(self, results: GeneralStatsResults):
         general_stats_text = f"""
         Use this widget to check whether the terms you see most represented in the dataset make sense for the goals of the dataset.
+        """
+        # Sizes are HyperLogLog estimates when the top vocabulary is approximate
+        about = "about " if results.top_vocab_max_error is not None else ""
+        if results.total_words is not None:
+            general_stats_text += f"""
+        There are {about}{str(results.total_words)} total words.
 
-        There are {str(results.total_words)} total words.
-
-        There are {results.total_open_words} after removing closed class words.
-
+        There are {about}{results.total_open_words} after removing closed class words.
+        """
+        if results.distinct_documents is not None:
+            general_stats_text += f"""
+        There are {about}{results.distinct_documents} distinct documents.
+        """
+        general_stats_text += """
         The most common [open class words](https://dictionary.apa.org/open-class-words) and their counts are: 
         """
+        if results.top_vocab_max_error is not None:
+            general_stats_text += f"""
+        (Approximate counts, each overestimated by at most {int(results.top_vocab_max_error)}.)
+        """
 
         top_vocab = pd.DataFrame(results.sorted_top_vocab_df).round(4)
 
         missing_text = (
             f"There are {results.text_nan_count} missing values in the dataset"
         )
+        if results.empty_text_count is not None:
+            feature = f" `{results.feature}`" if results.feature is not None else ""
+            missing_text = (
+                f"There are {results.text_nan_count} missing values, {results.empty_text_count} empty texts and "
+                f"{results.whitespace_text_count} texts of only whitespace in the{feature} feature"
+            )
 
         if results.dups_frac > 0:
             dupes_text = f"The dataset is {round(results.dups_frac * 100, 2)}% duplicates, For more information about the duplicates, click the 'Duplicates' tab."
@@ -112,56 +146,199 @@ class GeneralStatsWidget(Widget):
         pass
 
 
-def count_vocab_frequencies(dataset: Dataset):
-    return (
-        pd.DataFrame({"tokenized": dataset["tokenized_text"]})
-        .tokenized.explode()
-        .value_counts()
-        .to_frame(name="count")
-    )
-
-
-def calc_p_word(word_count_df):
-    word_count_df[PROP] = word_count_df[CNT] / float(sum(word_count_df[CNT]))
-    vocab_counts_df = pd.DataFrame(
-        word_count_df.sort_values(by=CNT, ascending=False))
-    vocab_counts_df[VOCAB] = vocab_counts_df.index
-    return vocab_counts_df
-
-
-def filter_vocab(vocab_counts_df):
+def filter_vocab(vocabulary_index: VocabularyIndex, language: str = "english"):
     # TODO: Add warnings (which words are missing) to log file?
-    filtered_vocab_counts_df = vocab_counts_df.drop(_CLOSED_CLASS, errors="ignore")
-    filtered_count = filtered_vocab_counts_df[CNT]
-    filtered_count_denom = float(sum(filtered_vocab_counts_df[CNT]))
-    filtered_vocab_counts_df[PROP] = filtered_count / filtered_count_denom
-    return filtered_vocab_counts_df
-
-
-class GeneralStats(TokenizedDatasetMixin, DataMeasurement):
+    # Proportions are recomputed over the open-class words
+    return vocabulary_index.to_frame(~vocabulary_index.closed_class_mask(language))
+
+
+def count_missing_texts(texts: Union[pa.Array, pa.ChunkedArray]) -> Tuple[int, int, int]:
+    """
+    Numbers of missing, empty and whitespace-only texts, from the null bitmap and Arrow kernels.
+    """
+    empty = pc.sum(pc.equal(pc.utf8_length(texts), 0), min_count=0).as_py()
+    whitespace = pc.sum(pc.utf8_is_space(texts), min_count=0).as_py()
+    return texts.null_count, empty, whitespace
+
+
+def document_hashes(batch: pa.Table, feature: str) -> np.ndarray:
+    # Compared as TextDuplicates compares them, so that both modes count the same distinct documents
+    return hash_texts(batch.column(feature).drop_null())
+
+
+def distinct_documents(text_duplicates: TextDuplicatesResults, text_nan_count: int) -> Optional[int]:
+    """
+    Number of distinct documents, compared as TextDuplicates compares them, from the distinct texts it counted.
+    """
+    if text_duplicates.num_distinct_texts is None:
+        return None
+    # Missing texts were counted as one more distinct text
+    return text_duplicates.num_distinct_texts - (text_nan_count > 0)
+
+
+class MissingTextsState(MeasurementState):
+    def __init__(self, feature: str):
+        self.feature = feature
+        self.text_nan_count = 0
+        self.empty_text_count = 0
+        self.whitespace_text_count = 0
+
+    def update(self, batch: pa.Table):
+        text_nan_count, empty_text_count, whitespace_text_count = count_missing_texts(batch.column(self.feature))
+        self.text_nan_count += text_nan_count
+        self.empty_text_count += empty_text_count
+        self.whitespace_text_count += whitespace_text_count
+
+    def merge(self, other: "MissingTextsState") -> "MissingTextsState":
+        self.text_nan_count += other.text_nan_count
+        self.empty_text_count += other.empty_text_count
+        self.whitespace_text_count += other.whitespace_text_count
+        return self
+
+
+class TopVocabularyState(MissingTextsState):
+    def __init__(self, feature: str, capacity: int, precision: int, vocabulary: Optional[pa.Array] = None):
+        super().__init__(feature)
+        self.sketch = SpaceSaving(capacity)
+        self.words = HyperLogLog(precision)
+        self.open_words = HyperLogLog(precision)
+        self.documents = HyperLogLog(precision)
+        # Vocabulary indexed by the token ids, when the suite has interned the tokens
+        self.vocabulary = vocabulary
+
+    def update(self, batch: pa.Table):
+        super().update(batch)
+        tokens = batch.column(TOKEN_IDS_FIELD if TOKEN_IDS_FIELD in batch.column_names else TOKENIZED_FIELD)
+        self.documents.update_hashes(document_hashes(batch, self.feature))
+
+        counts = pc.value_counts(pc.list_flatten(tokens))
+        words, counts = counts.field("values"), counts.field("counts")
+        if self.vocabulary is not None and TOKEN_IDS_FIELD in batch.column_names:
+            words = self.vocabulary.take(words)
+        self.words.update(words.to_numpy(zero_copy_only=False))
+        if pa.types.is_string(words.type):
+            # Only open class words are displayed, so only they are sketched
+            open_class = pc.invert(pc.is_in(words, value_set=pa.array(sorted(closed_class_words()), type=pa.string())))
+            words, counts = words.filter(open_class), counts.filter(open_class)
+        words = words.to_numpy(zero_copy_only=False)
+        self.open_words.update(words)
+        self.sketch.update(words, counts.to_numpy())
+
+    def merge(self, other: "TopVocabularyState") -> "TopVocabularyState":
+        super().merge(other)
+        self.sketch.merge(other.sketch)
+        self.words.merge(other.words)
+        self.open_words.merge(other.open_words)
+        self.documents.merge(other.documents)
+        return self
+
+
+class GeneralStats(CachedMeasurementMixin, TokenizedDatasetMixin, DataMeasurement):
     name = "general_stats"
     widget = GeneralStatsWidget
+    dependencies = [VocabularyCounts, TextDuplicates]
 
     def measure(self, dataset: Dataset) -> GeneralStatsResults:
         dataset = self.tokenize_dataset(dataset)
-        word_count_df = count_vocab_frequencies(dataset)
-        vocab_counts_df = calc_p_word(word_count_df)
+        vocabulary_index = self.dependency_results(VocabularyCounts, dataset).vocabulary_index
+        text_duplicates = self.dependency_results(TextDuplicates, dataset)
+        texts = dataset.with_format("arrow")[self.feature]
+        text_nan_count, empty_text_count, whitespace_text_count = count_missing_texts(texts)
 
-        total_words = len(vocab_counts_df)
-        vocab_counts_filtered_df = filter_vocab(vocab_counts_df)
+        return self.general_stats_results(
+            vocabulary_index,
+            text_nan_count,
+            text_duplicates.duplicate_fraction,
+            distinct_documents(text_duplicates, text_nan_count),
+            empty_text_count=empty_text_count,
+            whitespace_text_count=whitespace_text_count,
+            feature=self.feature,
+        )
+
+    def create_state(self) -> MissingTextsState:
+        # Distinct documents are counted by TextDuplicates, which spills its hashes past its memory budget
+        return MissingTextsState(self.feature)
+
+    def results_from_state(self, state: MissingTextsState) -> GeneralStatsResults:
+        text_duplicates = self.upstream_results[TextDuplicates.name]
+        return self.general_stats_results(
+            vocabulary_index=self.upstream_results[VocabularyCounts.name].vocabulary_index,
+            text_nan_count=state.text_nan_count,
+            dups_frac=text_duplicates.duplicate_fraction,
+            distinct_documents=distinct_documents(text_duplicates, state.text_nan_count),
+            empty_text_count=state.empty_text_count,
+            whitespace_text_count=state.whitespace_text_count,
+            feature=self.feature,
+        )
+
+    @staticmethod
+    def general_stats_results(
+            vocabulary_index,
+            text_nan_count,
+            dups_frac,
+            distinct_documents=None,
+            empty_text_count=None,
+            whitespace_text_count=None,
+            feature=None,
+    ) -> GeneralStatsResults:
+        total_words = len(vocabulary_index)
+        vocab_counts_filtered_df = filter_vocab(vocabulary_index)
         total_open_words = len(vocab_counts_filtered_df)
         sorted_top_vocab_df = vocab_counts_filtered_df.sort_values(
             "count", ascending=False
         ).head(_TOP_N)
 
-        text_nan_count = int(pd.DataFrame({"tokenized": dataset["tokenized_text"]}).isnull().sum().sum())
-
-        dups_frac = TextDuplicates(feature=self.feature).measure(dataset).duplicate_fraction
-
         return GeneralStatsResults(
             total_words=total_words,
             total_open_words=total_open_words,
             sorted_top_vocab_df=sorted_top_vocab_df,
             text_nan_count=text_nan_count,
             dups_frac=dups_frac,
+            distinct_documents=distinct_documents,
+            empty_text_count=empty_text_count,
+            whitespace_text_count=whitespace_text_count,
+            feature=feature,
+        )
+
+
+class ApproximateGeneralStats(GeneralStats):
+    """
+    General stats whose top vocabulary comes from a SpaceSaving sketch of `capacity` open class words, and whose
+    vocabulary sizes and number of distinct documents are HyperLogLog estimates, rather than from the counts of
+    the whole vocabulary: memory doesn't grow with the vocabulary or the number of documents.
+    """
+    name = "approximate_general_stats"
+    dependencies = [TextDuplicates]
+
+    def __init__(self, *args, capacity: int = 10_000, precision: int = 14, **kwargs):
+        self.capacity = capacity
+        self.precision = precision
+        super().__init__(*args, **kwargs)
+
+    def cache_config(self) -> Dict[str, Any]:
+        return {"capacity": self.capacity, "precision": self.precision}
+
+    def measure(self, dataset: Dataset) -> GeneralStatsResults:
+        dataset = self.tokenize_dataset(dataset)
+        self.dependency_results(TextDuplicates, dataset)
+        return self.results_from_state(self.measure_partial(dataset))
+
+    def create_state(self) -> TopVocabularyState:
+        return TopVocabularyState(self.feature, self.capacity, self.precision, vocabulary=self.vocabulary)
+
+    def results_from_state(self, state: TopVocabularyState) -> GeneralStatsResults:
+        top_vocab_df = state.sketch.top(_TOP_N)
+        top_vocab_df[PROP] = top_vocab_df[CNT] / float(state.sketch.total)
+
+        return GeneralStatsResults(
+            total_words=round(state.words.estimate()),
+            total_open_words=round(state.open_words.estimate()),
+            sorted_top_vocab_df=top_vocab_df,
+            text_nan_count=state.text_nan_count,
+            dups_frac=self.upstream_results[TextDuplicates.name].duplicate_fraction,
+            top_vocab_max_error=state.sketch.max_error,
+            distinct_documents=round(state.documents.estimate()),
+            empty_text_count=state.empty_text_count,
+            whitespace_text_count=state.whitespace_text_count,
+            feature=self.feature,
         )
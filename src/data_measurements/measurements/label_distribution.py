@@ -1,15 +1,20 @@
+from collections import Counter
+from fractions import Fraction
 from typing import Dict, List
 
 import plotly.express as px
+import pyarrow as pa
 from datasets import Dataset
 import gradio as gr
 
 from data_measurements.measurements.base import (
+    CachedMeasurementMixin,
     DataMeasurement,
     DataMeasurementResults,
-    EvaluateMixin,
     LabelMeasurementMixin,
-    Widget
+    MeasurementState,
+    Widget,
+    count_values,
 )
 
 import utils
@@ -75,14 +80,62 @@ class LabelDistributionWidget(Widget):
         pass
 
 
-# TODO: Implement a CachedMeasurementMixin for handling fetching from a local cache (for all measurements)
-class LabelDistribution(LabelMeasurementMixin, EvaluateMixin, DataMeasurement):
+def label_skew_from_counts(label_counts: Counter) -> float:
+    """
+    Biased skewness of the labels, as scipy.stats.skew computes it, from the count of each distinct label. Like the
+    evaluate label_distribution metric, string labels are replaced by their order of first appearance.
+
+    Moments are exact sums over the distinct labels, so results don't depend on how the rows were split.
+    """
+    labels = list(label_counts.keys())
+    if labels and isinstance(labels[0], str):
+        labels = range(len(labels))
+    num_labels = sum(label_counts.values())
+    if not num_labels:
+        return float("nan")
+
+    counts = list(label_counts.values())
+    average = sum(Fraction(label) * count for label, count in zip(labels, counts)) / num_labels
+    m2 = sum((Fraction(label) - average) ** 2 * count for label, count in zip(labels, counts)) / num_labels
+    m3 = sum((Fraction(label) - average) ** 3 * count for label, count in zip(labels, counts)) / num_labels
+    if m2 == 0:
+        return float("nan")
+    return float(m3) / float(m2) ** 1.5
+
+
+class LabelDistributionState(MeasurementState):
+    def __init__(self, feature: str):
+        self.feature = feature
+        self.label_counts = Counter()
+
+    def update(self, batch: pa.Table):
+        self.label_counts.update(count_values(batch.column(self.feature)))
+
+    def merge(self, other: "LabelDistributionState") -> "LabelDistributionState":
+        self.label_counts.update(other.label_counts)
+        return self
+
+
+class LabelDistribution(CachedMeasurementMixin, LabelMeasurementMixin, DataMeasurement):
+    """
+    Fraction of each label, and skewness of the labels, as the evaluate label_distribution metric computes them.
+    They are computed from the label counts, so whole, streamed and sharded measurements give the same results.
+    """
     name = "label_distribution"
     widget = LabelDistributionWidget
 
     def measure(self, dataset: Dataset) -> LabelDistributionResults:
-        results = super().run_metric(dataset)
+        return self.results_from_state(self.measure_partial(dataset.select_columns([self.feature]), batch_size=10_000))
+
+    def create_state(self) -> LabelDistributionState:
+        return LabelDistributionState(self.feature)
+
+    def results_from_state(self, state: LabelDistributionState) -> LabelDistributionResults:
+        num_labels = sum(state.label_counts.values())
         return LabelDistributionResults(
-            label_distribution=results["label_distribution"],
-            label_skew=results["label_skew"],
+            label_distribution={
+                "labels": list(state.label_counts.keys()),
+                "fractions": [count / num_labels for count in state.label_counts.values()],
+            },
+            label_skew=label_skew_from_counts(state.label_counts),
         )
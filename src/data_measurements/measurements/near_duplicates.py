@@ -0,0 +1,372 @@
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import gradio as gr
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from datasets import Dataset
+from scipy.integrate import trapezoid
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from data_measurements.measurements.base import (
+    TOKEN_IDS_FIELD,
+    TOKENIZED_FIELD,
+    CachedMeasurementMixin,
+    DataMeasurement,
+    DataMeasurementResults,
+    MeasurementState,
+    TokenizedDatasetMixin,
+    Widget,
+)
+from data_measurements.sketches import hash_values
+
+
+MINHASH_FIELD = "minhash"
+
+# Universal hashing of 32-bit shingle hashes modulo a Mersenne prime, as in datasketch's MinHash
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+# Odd multiplier (from the golden ratio) combining the hashes of consecutive tokens into a shingle hash
+_SHINGLE_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+# Shingles whose permuted hashes are computed at once, bounding memory to this x num_perm x 8 bytes
+_CHUNK_SIZE = 1 << 14
+# Largest clusters displayed in the widget
+_TOP_N = 100
+
+
+def minhash_permutations(num_perm: int, seed: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+    generator = np.random.RandomState(seed)
+    a = generator.randint(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    b = generator.randint(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def lsh_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    Number of bands and of rows per band of an LSH index of `num_perm` permutations, minimizing the sum of the
+    probabilities of false positives below `threshold` and of false negatives above it (as datasketch does).
+    """
+    similarities = np.linspace(0, 1, 1001)
+    best, best_error = None, np.inf
+    for rows in range(1, num_perm + 1):
+        bands = num_perm // rows
+        candidate = 1 - (1 - similarities ** rows) ** bands
+        below = similarities <= threshold
+        error = trapezoid(candidate[below], similarities[below]) + trapezoid(
+            1 - candidate[~below], similarities[~below]
+        )
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+def token_hashes(tokens: pa.Array, vocabulary_hashes: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    64-bit hashes of tokens. Ids into a vocabulary take the hash of their token, so that texts get the same
+    signatures whether or not the suite interns its tokens.
+    """
+    if vocabulary_hashes is not None and pa.types.is_integer(tokens.type):
+        return vocabulary_hashes[tokens.to_numpy()]
+    return hash_values(tokens.to_numpy(zero_copy_only=False))
+
+
+def shingle_hashes(
+    tokens: pa.ListArray, shingle_size: int, vocabulary_hashes: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rows and 64-bit hashes of the shingles (runs of `shingle_size` consecutive tokens) of tokenized texts, in row
+    order. Texts with fewer tokens are a single shingle, and empty texts have none.
+    """
+    lengths = pc.list_value_length(tokens).fill_null(0).to_numpy(zero_copy_only=False).astype(np.int64)
+    values = token_hashes(pc.list_flatten(tokens), vocabulary_hashes)
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    ends = np.repeat(np.cumsum(lengths), lengths)
+    positions = np.arange(len(values))
+
+    hashes = np.zeros(len(values), dtype=np.uint64)
+    for offset in range(shingle_size):
+        # Tokens past the end of their text don't take part in the shingle
+        in_text = positions + offset < ends
+        hashes[in_text] = hashes[in_text] * _SHINGLE_MULTIPLIER + values[positions[in_text] + offset]
+
+    starts = ends - lengths[rows]
+    shingles = (positions + shingle_size <= ends) | ((positions == starts) & (lengths[rows] < shingle_size))
+    return rows[shingles], hashes[shingles]
+
+
+def minhash_signatures(
+    tokens: Union[pa.ListArray, pa.ChunkedArray],
+    permutations: Tuple[np.ndarray, np.ndarray],
+    shingle_size: int,
+    vocabulary_hashes: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    MinHash signatures of the shingles of each tokenized text, one row of uint32 per text. Texts without shingles
+    have the maximum hash everywhere.
+    """
+    if isinstance(tokens, pa.ChunkedArray):
+        tokens = tokens.combine_chunks()
+    a, b = permutations
+    rows, hashes = shingle_hashes(tokens, shingle_size, vocabulary_hashes)
+    hashes = (hashes >> np.uint64(32)) ^ (hashes & _MAX_HASH)
+
+    # Permutations x texts, so that the shingles of a text are contiguous in memory when taking their minimum
+    signatures = np.full((len(a), len(tokens)), _MAX_HASH, dtype=np.uint32)
+    buffer = np.empty((len(a), min(_CHUNK_SIZE, len(hashes))), dtype=np.uint64)
+    for start in range(0, len(hashes), _CHUNK_SIZE):
+        chunk_rows = rows[start:start + _CHUNK_SIZE]
+        permuted = buffer[:, :len(chunk_rows)]
+        np.multiply(a[:, None], hashes[None, start:start + _CHUNK_SIZE], out=permuted)
+        permuted += b[:, None]
+        np.remainder(permuted, _MERSENNE_PRIME, out=permuted)
+        permuted &= _MAX_HASH
+        # Shingles are in row order, so the shingles of a row are contiguous
+        firsts = np.flatnonzero(np.r_[True, chunk_rows[1:] != chunk_rows[:-1]])
+        minimums = np.minimum.reduceat(permuted, firsts, axis=1)
+        signature_rows = chunk_rows[firsts]
+        signatures[:, signature_rows] = np.minimum(signatures[:, signature_rows], minimums)
+    return np.ascontiguousarray(signatures.T)
+
+
+def minhash_batch(
+    batch: pa.Table,
+    permutations: Tuple[np.ndarray, np.ndarray],
+    shingle_size: int,
+    vocabulary_hashes: Optional[np.ndarray] = None,
+) -> pa.Table:
+    field = TOKEN_IDS_FIELD if TOKEN_IDS_FIELD in batch.column_names else TOKENIZED_FIELD
+    signatures = minhash_signatures(batch.column(field), permutations, shingle_size, vocabulary_hashes)
+    num_perm = len(permutations[0])
+    return pa.table({MINHASH_FIELD: pa.FixedSizeListArray.from_arrays(signatures.reshape(-1), num_perm)})
+
+
+def near_duplicate_clusters(signatures: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Cluster of each row: rows are linked when they share a band of their signatures (LSH) and their estimated
+    Jaccard similarity is at least `threshold`, and clusters are the connected components of these links.
+    """
+    num_rows, num_perm = signatures.shape
+    if num_rows == 0:
+        return np.empty(0, dtype=np.int32)
+    num_bands, band_size = lsh_bands(threshold, num_perm)
+    # Texts without shingles are never near duplicates
+    has_shingles = ~(signatures == _MAX_HASH).all(axis=1)
+    candidates = np.flatnonzero(has_shingles)
+
+    sources, targets = [], []
+    for band in range(num_bands):
+        keys = np.zeros(len(candidates), dtype=np.uint64)
+        for column in range(band * band_size, (band + 1) * band_size):
+            keys = keys * _SHINGLE_MULTIPLIER + signatures[candidates, column]
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        # Link each row to the first row of its bucket
+        firsts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        bucket_firsts = np.repeat(firsts, np.diff(np.r_[firsts, len(order)]))
+        linked = order != order[bucket_firsts]
+        sources.append(candidates[order[bucket_firsts][linked]])
+        targets.append(candidates[order[linked]])
+
+    sources, targets = np.concatenate(sources), np.concatenate(targets)
+    # Buckets of different bands link the same pairs
+    pairs = np.unique(sources.astype(np.int64) * num_rows + targets)
+    sources, targets = pairs // num_rows, pairs % num_rows
+    # Rows sharing a band may still be less similar than the threshold
+    similar = (signatures[sources] == signatures[targets]).mean(axis=1) >= threshold
+    links = coo_matrix(
+        (np.ones(int(similar.sum()), dtype=np.int8), (sources[similar], targets[similar])), shape=(num_rows, num_rows)
+    )
+    _, labels = connected_components(links, directed=False)
+    return labels
+
+
+def near_duplicate_fraction(labels: np.ndarray) -> float:
+    # Rows that would be removed keeping one per cluster, as for exact duplicates
+    return 1 - len(np.unique(labels)) / len(labels) if len(labels) else 0.0
+
+
+class NearDuplicatesResults(DataMeasurementResults):
+    def __init__(
+        self,
+        near_duplicate_fraction: float,
+        cluster_labels: np.ndarray,
+        clusters_df: Optional[pd.DataFrame] = None,
+    ):
+        self.near_duplicate_fraction = near_duplicate_fraction
+        # Cluster of each row, rows without near duplicates are alone in theirs
+        self.cluster_labels = cluster_labels
+        # Size and an example text of the largest clusters, when the whole dataset is measured at once
+        self.clusters_df = clusters_df
+
+    @property
+    def num_clusters(self) -> int:
+        # Clusters of near duplicates, leaving out rows alone in theirs
+        return int(np.count_nonzero(np.bincount(self.cluster_labels) > 1))
+
+    def __eq__(self, other):
+        if isinstance(other, NearDuplicatesResults):
+            try:
+                assert self.near_duplicate_fraction == other.near_duplicate_fraction
+                assert np.array_equal(self.cluster_labels, other.cluster_labels)
+                return True
+            except AssertionError:
+                return False
+        else:
+            return False
+
+    def to_figure(self):
+        pass
+
+
+class NearDuplicatesWidget(Widget):
+    def __init__(self):
+        self.near_duplicates_text = gr.Markdown(render=False)
+        self.near_duplicates_df = gr.DataFrame(render=False)
+
+    def render(self):
+        with gr.TabItem("Near Duplicates"):
+            gr.Markdown(
+                "Use this widget to identify texts that are almost the same, such as boilerplate and templated "
+                "texts, which exact duplicate detection misses. Models may be negatively affected by them "
+                "([Lee et al., 2021](https://arxiv.org/abs/2107.06499))."
+            )
+            self.near_duplicates_text.render()
+            self.near_duplicates_df.render()
+
+    def update(self, results: NearDuplicatesResults):
+        if not results.near_duplicate_fraction:
+            return {
+                self.near_duplicates_text: "There are no near duplicates in this dataset! 🥳",
+                self.near_duplicates_df: gr.DataFrame.update(visible=False),
+            }
+        text = (
+            f"The fraction of data that is near duplicate is {round(results.near_duplicate_fraction, 4)}, in "
+            f"{results.num_clusters} clusters of similar texts."
+        )
+        if results.clusters_df is None:
+            return {self.near_duplicates_text: text, self.near_duplicates_df: gr.DataFrame.update(visible=False)}
+        return {
+            self.near_duplicates_text: text + " Here are the largest clusters:",
+            self.near_duplicates_df: gr.DataFrame.update(visible=True, value=results.clusters_df),
+        }
+
+    @property
+    def output_components(self):
+        return [self.near_duplicates_text, self.near_duplicates_df]
+
+    def add_events(self, state: gr.State):
+        pass
+
+
+class NearDuplicatesState(MeasurementState):
+    def __init__(
+        self,
+        permutations: Tuple[np.ndarray, np.ndarray],
+        shingle_size: int,
+        vocabulary_hashes: Optional[np.ndarray] = None,
+    ):
+        self.permutations = permutations
+        self.shingle_size = shingle_size
+        self.vocabulary_hashes = vocabulary_hashes
+        # Signatures of the rows in order, by batch
+        self.signatures: List[np.ndarray] = []
+
+    def update(self, batch: pa.Table):
+        field = TOKEN_IDS_FIELD if TOKEN_IDS_FIELD in batch.column_names else TOKENIZED_FIELD
+        self.signatures.append(
+            minhash_signatures(batch.column(field), self.permutations, self.shingle_size, self.vocabulary_hashes)
+        )
+
+    def merge(self, other: "NearDuplicatesState") -> "NearDuplicatesState":
+        self.signatures.extend(other.signatures)
+        return self
+
+
+class NearDuplicates(CachedMeasurementMixin, TokenizedDatasetMixin, DataMeasurement):
+    """
+    Near duplicate texts: texts whose shingles of `shingle_size` tokens have an estimated Jaccard similarity of at
+    least `threshold`, found with MinHash signatures of `num_perm` permutations and an LSH index of their bands.
+
+    Signatures are computed by a batched map over the tokenized dataset, in `num_proc` processes, and are 4 *
+    `num_perm` bytes per row.
+    """
+    name = "near_duplicates"
+    widget = NearDuplicatesWidget
+
+    def __init__(
+        self,
+        *args,
+        threshold: float = 0.8,
+        num_perm: int = 128,
+        shingle_size: int = 5,
+        seed: int = 1,
+        **kwargs,
+    ):
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.seed = seed
+        self.permutations = minhash_permutations(num_perm, seed)
+        self._vocabulary_hashes: Optional[Tuple[pa.Array, np.ndarray]] = None
+        super().__init__(*args, **kwargs)
+
+    def cache_config(self) -> Dict[str, Any]:
+        return {
+            "threshold": self.threshold,
+            "num_perm": self.num_perm,
+            "shingle_size": self.shingle_size,
+            "seed": self.seed,
+        }
+
+    def measure(self, dataset: Dataset) -> NearDuplicatesResults:
+        dataset = self.tokenize_dataset(dataset)
+        field = TOKEN_IDS_FIELD if TOKEN_IDS_FIELD in dataset.column_names else TOKENIZED_FIELD
+        signatures = dataset.select_columns([field]).with_format("arrow").map(
+            partial(
+                minhash_batch,
+                permutations=self.permutations,
+                shingle_size=self.shingle_size,
+                vocabulary_hashes=self.vocabulary_hashes(),
+            ),
+            batched=True,
+            num_proc=self.num_proc,
+            remove_columns=[field],
+            # Read into a NumPy array right away, rather than written next to the measured dataset's files
+            keep_in_memory=True,
+        ).with_format("arrow")[MINHASH_FIELD]
+        signatures = pc.list_flatten(signatures).to_numpy().reshape(-1, self.num_perm)
+
+        labels = near_duplicate_clusters(signatures, self.threshold)
+        return NearDuplicatesResults(
+            near_duplicate_fraction=near_duplicate_fraction(labels),
+            cluster_labels=labels,
+            clusters_df=self.clusters_df(dataset, labels),
+        )
+
+    def clusters_df(self, dataset: Dataset, labels: np.ndarray) -> pd.DataFrame:
+        sizes = np.bincount(labels)
+        clusters = np.flatnonzero(sizes > 1)
+        clusters = clusters[np.argsort(-sizes[clusters], kind="stable")][:_TOP_N]
+        # The first row of each cluster is its example
+        _, firsts = np.unique(labels, return_index=True)
+        examples = dataset.select(firsts[clusters])[self.feature]
+        return pd.DataFrame({"count": sizes[clusters], "example": examples})
+
+    def create_state(self) -> NearDuplicatesState:
+        return NearDuplicatesState(self.permutations, self.shingle_size, self.vocabulary_hashes())
+
+    def vocabulary_hashes(self) -> Optional[np.ndarray]:
+        # Token ids of a vocabulary interned by the suite, rather than of a tokenizer, are hashed as their tokens
+        if self.vocabulary is None:
+            return None
+        if self._vocabulary_hashes is None or self._vocabulary_hashes[0] is not self.vocabulary:
+            self._vocabulary_hashes = (self.vocabulary, hash_values(self.vocabulary.to_numpy(zero_copy_only=False)))
+        return self._vocabulary_hashes[1]
+
+    def results_from_state(self, state: NearDuplicatesState) -> NearDuplicatesResults:
+        signatures = np.concatenate(state.signatures) if state.signatures else np.empty((0, self.num_perm), np.uint32)
+        labels = near_duplicate_clusters(signatures, self.threshold)
+        return NearDuplicatesResults(near_duplicate_fraction=near_duplicate_fraction(labels), cluster_labels=labels)
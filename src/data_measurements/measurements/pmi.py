@@ -1,9 +1,10 @@
+import numpy as np
+import pandas as pd
 from datasets import Dataset
 
+from data_measurements.measurements.base import MeasurementState
 from data_measurements.measurements.cooccurences import Cooccurences, CooccurencesResults
-
-
-
+from data_measurements.measurements.vocabulary import CNT, PROP, VocabularyCounts
 
 
 class PMIResults(CooccurencesResults):
@@ -12,24 +13,33 @@ class PMIResults(CooccurencesResults):
 
 class PMI(Cooccurences):
     name = "PMI"
+    dependencies = [VocabularyCounts, Cooccurences]
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
     def measure(self, dataset: Dataset) -> PMIResults:
-        cooccurences = super().measure(dataset)
-
-        # calc_p_word(word_count_df)
-        print(self.vocab_counts_df["count"])
-        # # Calculation of p(subgroup)
-        # subgroup_prob = self.vocab_counts_df.loc[subgroup]["proportion"]
-        # # Calculation of p(subgroup|word) = count(subgroup,word) / count(word)
-        # # Because the indices match (the vocab words),
-        # # this division doesn't need to specify the index (I think?!)
-        # vocab_cooc_df.columns = ["cooc"]
-        # p_subgroup_g_word = (
-        #         vocab_cooc_df["cooc"] / self.vocab_counts_df["count"])
-        # logs.info("p_subgroup_g_word is")
-        # logs.info(p_subgroup_g_word)
-        # pmi_df = pd.DataFrame()
-        # pmi_df[subgroup] = np.log(p_subgroup_g_word / subgroup_prob).dropna()
+        dataset = self.tokenize_dataset(dataset)
+        vocab_counts_df = self.dependency_results(VocabularyCounts, dataset).vocab_counts_df
+        vocab_cooc_df = self.dependency_results(Cooccurences, dataset).matrix
+        return self.pmi_results(vocab_counts_df, vocab_cooc_df)
+
+    def create_state(self) -> MeasurementState:
+        return MeasurementState()
+
+    def results_from_state(self, state: MeasurementState) -> PMIResults:
+        return self.pmi_results(
+            vocab_counts_df=self.upstream_results[VocabularyCounts.name].vocab_counts_df,
+            vocab_cooc_df=self.upstream_results[Cooccurences.name].matrix,
+        )
+
+    @staticmethod
+    def pmi_results(vocab_counts_df: pd.DataFrame, vocab_cooc_df: pd.DataFrame) -> PMIResults:
+        # Calculation of p(subgroup)
+        subgroup_prob = vocab_counts_df.loc[vocab_cooc_df.columns, PROP]
+        # Calculation of p(subgroup|word) = count(subgroup,word) / count(word)
+        p_subgroup_g_word = vocab_cooc_df.div(vocab_counts_df.loc[vocab_cooc_df.index, CNT], axis=0)
+        with np.errstate(divide="ignore"):
+            pmi_df = np.log(p_subgroup_g_word / subgroup_prob)
+
+        return PMIResults(matrix=pmi_df)
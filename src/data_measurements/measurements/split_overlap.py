@@ -0,0 +1,247 @@
+import os
+from typing import Any, Dict, List, Optional, Union
+
+import gradio as gr
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from datasets import Dataset, DatasetDict, IterableDataset
+
+from data_measurements.cache import cache_key
+from data_measurements.dataset_source import DatasetSource
+from data_measurements.hash_counts import HashCounts, hash_texts
+from data_measurements.measurements.base import (
+    CachedMeasurementMixin,
+    DataMeasurement,
+    DataMeasurementResults,
+    MeasurementState,
+    SourceMeasurementMixin,
+    Widget,
+)
+from data_measurements.streaming import iter_arrow_batches
+
+
+class SplitOverlapResults(DataMeasurementResults):
+    def __init__(
+        self,
+        reference_split: Optional[str],
+        num_rows: int,
+        num_overlapping_rows: int,
+        sample_row_ids: List[int],
+        sample_texts: List[str],
+    ):
+        self.reference_split = reference_split
+        self.num_rows = num_rows
+        # Rows whose text (stripped of surrounding whitespace) is also in the reference split
+        self.num_overlapping_rows = num_overlapping_rows
+        self.sample_row_ids = sample_row_ids
+        self.sample_texts = sample_texts
+
+    @property
+    def overlap_fraction(self) -> float:
+        return self.num_overlapping_rows / self.num_rows if self.num_rows else 0.0
+
+    def __eq__(self, other):
+        if isinstance(other, SplitOverlapResults):
+            try:
+                assert self.reference_split == other.reference_split
+                assert self.num_rows == other.num_rows
+                assert self.num_overlapping_rows == other.num_overlapping_rows
+                assert self.sample_row_ids == other.sample_row_ids
+                return True
+            except AssertionError:
+                return False
+        else:
+            return False
+
+    def to_figure(self):
+        pass
+
+
+class SplitOverlapWidget(Widget):
+    def __init__(self):
+        self.split_overlap_text = gr.Markdown(render=False)
+        self.split_overlap_df = gr.DataFrame(render=False)
+
+    def render(self):
+        with gr.TabItem("Split Overlap"):
+            gr.Markdown(
+                "Use this widget to check whether the texts of this split leak from another split, e.g. test "
+                "texts that also are in the training data, which inflate evaluation results."
+            )
+            self.split_overlap_text.render()
+            self.split_overlap_df.render()
+
+    def update(self, results: SplitOverlapResults):
+        reference = f"the {results.reference_split} split" if results.reference_split else "the reference dataset"
+        if not results.num_overlapping_rows:
+            return {
+                self.split_overlap_text: f"None of the texts of this split are in {reference}! 🥳",
+                self.split_overlap_df: gr.DataFrame.update(visible=False),
+            }
+        text = (
+            f"{results.num_overlapping_rows} of the {results.num_rows} texts of this split "
+            f"({round(results.overlap_fraction * 100, 2)}%) are also in {reference}. Here are some of them:"
+        )
+        samples = pd.DataFrame({"row": results.sample_row_ids, "text": results.sample_texts})
+        return {
+            self.split_overlap_text: text,
+            self.split_overlap_df: gr.DataFrame.update(visible=True, value=samples),
+        }
+
+    @property
+    def output_components(self):
+        return [self.split_overlap_text, self.split_overlap_df]
+
+    def add_events(self, state: gr.State):
+        pass
+
+
+def build_hash_index(
+    dataset: Union[Dataset, IterableDataset],
+    feature: str,
+    batch_size: int = 10_000,
+    memory_budget: Optional[int] = 1 << 30,
+) -> np.ndarray:
+    """
+    Sorted distinct hashes of the texts of a dataset, read batch after batch: 8 bytes per distinct text.
+    """
+    counts = HashCounts(memory_budget=memory_budget)
+    try:
+        for batch in iter_arrow_batches(dataset, batch_size=batch_size):
+            texts = batch.column(feature).drop_null()
+            counts.update(hash_texts(texts))
+        return counts.distinct()
+    finally:
+        counts.clear()
+
+
+def has_splits(path: Union[str, os.PathLike]) -> bool:
+    # Directories of a DatasetDict saved with `save_to_disk`
+    return os.path.isfile(os.path.join(path, "dataset_dict.json"))
+
+
+def in_index(hashes: np.ndarray, index: np.ndarray) -> np.ndarray:
+    positions = np.searchsorted(index, hashes)
+    return index[np.minimum(positions, len(index) - 1)] == hashes if len(index) else np.zeros(len(hashes), bool)
+
+
+class SplitOverlapState(MeasurementState):
+    def __init__(self, feature: str, index: np.ndarray, num_samples: int):
+        self.feature = feature
+        self.index = index
+        self.num_samples = num_samples
+        self.num_rows = 0
+        self.num_overlapping_rows = 0
+        self.sample_row_ids: List[int] = []
+        self.sample_texts: List[str] = []
+
+    def update(self, batch: pa.Table):
+        texts = batch.column(self.feature)
+        overlapping = in_index(hash_texts(texts), self.index) & texts.is_valid().to_numpy(zero_copy_only=False)
+        rows = np.flatnonzero(overlapping)[: self.num_samples - len(self.sample_row_ids)]
+        self.sample_row_ids.extend((rows + self.num_rows).tolist())
+        self.sample_texts.extend(texts.take(pa.array(rows, type=pa.int64())).to_pylist())
+        self.num_overlapping_rows += int(overlapping.sum())
+        self.num_rows += len(texts)
+
+    def merge(self, other: "SplitOverlapState") -> "SplitOverlapState":
+        # States are merged in row order, so the rows of `other` come after these
+        remaining = self.num_samples - len(self.sample_row_ids)
+        self.sample_row_ids.extend(row + self.num_rows for row in other.sample_row_ids[:remaining])
+        self.sample_texts.extend(other.sample_texts[:remaining])
+        self.num_overlapping_rows += other.num_overlapping_rows
+        self.num_rows += other.num_rows
+        return self
+
+
+class SplitOverlap(CachedMeasurementMixin, SourceMeasurementMixin, DataMeasurement):
+    """
+    Exact overlap of the texts of the measured split with a reference split (e.g. how many test texts are also
+    in train). The reference is read batch after batch into a sorted array of the 64-bit hashes of its distinct
+    texts, and the measured rows are looked up in it, so neither split's texts are held in memory.
+
+    The reference is `reference_split` of the dataset the suite measures, or `reference` (a dataset, a path or a
+    hub name) when given.
+    """
+    name = "split_overlap"
+    widget = SplitOverlapWidget
+
+    def __init__(
+        self,
+        *args,
+        reference: Optional[Union[str, os.PathLike, Dataset, DatasetDict, IterableDataset]] = None,
+        reference_split: Optional[str] = "train",
+        num_samples: int = 10,
+        memory_budget: Optional[int] = 1 << 30,
+        **kwargs,
+    ):
+        self.reference = reference
+        self.reference_split = reference_split
+        self.num_samples = num_samples
+        self.memory_budget = memory_budget
+        self._index: Optional[np.ndarray] = None
+        super().__init__(*args, **kwargs)
+
+    @property
+    def reference_source(self) -> DatasetSource:
+        reference = self.reference
+        if reference is None:
+            reference = self.suite_reference()
+        # Hub datasets are streamed rather than downloaded, local ones are memory-mapped anyway
+        streaming = isinstance(reference, str) and not os.path.exists(reference)
+        return DatasetSource(reference, split=self.reference_split, columns=[self.feature], streaming=streaming)
+
+    def suite_reference(self) -> Union[str, os.PathLike, DatasetDict]:
+        """
+        The dataset the suite measures, as the reference of the split it measures: it must have named splits.
+        """
+        if self.source is None:
+            raise ValueError("SplitOverlap needs a reference dataset when it isn't run by a suite")
+        dataset = self.source.dataset
+        if isinstance(dataset, (Dataset, IterableDataset)) or (self.source.is_local and not has_splits(dataset)):
+            # Its only split is the one measured, which would overlap with itself
+            raise ValueError(
+                f"SplitOverlap can't take the {self.reference_split} split of {dataset!r}, which has no named "
+                "splits: pass a reference dataset"
+            )
+        if self.reference_split == self.source.split:
+            raise ValueError(f"SplitOverlap would compare the {self.source.split} split with itself")
+        return dataset
+
+    def reference_index(self) -> np.ndarray:
+        if self._index is None:
+            self._index = build_hash_index(
+                self.reference_source.load(), self.feature, memory_budget=self.memory_budget
+            )
+        return self._index
+
+    def __getstate__(self):
+        # Index the reference once, before the measurement is sent to the workers measuring shards
+        self.reference_index()
+        return self.__dict__
+
+    def cache_key(self, dataset: Optional[Dataset] = None) -> Optional[str]:
+        key = super().cache_key(dataset)
+        if key is None:
+            return None
+        reference = self.reference_source.fingerprint
+        return cache_key({"results": key, "reference": reference}) if reference is not None else None
+
+    def cache_config(self) -> Dict[str, Any]:
+        return {"reference_split": self.reference_split, "num_samples": self.num_samples}
+
+    def measure(self, dataset: Dataset) -> SplitOverlapResults:
+        return self.results_from_state(self.measure_partial(dataset.select_columns([self.feature]), batch_size=10_000))
+
+    def create_state(self) -> SplitOverlapState:
+        return SplitOverlapState(self.feature, self.reference_index(), self.num_samples)
+
+    def results_from_state(self, state: SplitOverlapState) -> SplitOverlapResults:
+        return SplitOverlapResults(
+            reference_split=self.reference_split if isinstance(self.reference, (str, DatasetDict, type(None))) else None,
+            num_rows=state.num_rows,
+            num_overlapping_rows=state.num_overlapping_rows,
+            sample_row_ids=state.sample_row_ids,
+            sample_texts=state.sample_texts,
+        )
@@ -1,20 +1,41 @@
+import os
+from collections import Counter
+
 from datasets import Dataset
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
 import utils.dataset_utils as ds_utils
 import gradio as gr
 
-from typing import Dict
+from typing import Any, Dict, Optional, Union
 
-from data_measurements.measurements.base import DataMeasurement, DataMeasurementResults, EvaluateMixin, Widget
+from data_measurements.hash_counts import HashCounts, hash_texts
+from data_measurements.measurements.base import (
+    CachedMeasurementMixin,
+    DataMeasurement,
+    DataMeasurementResults,
+    MeasurementState,
+    Widget
+)
+from data_measurements.streaming import iter_arrow_batches
 
 
 class TextDuplicatesResults(DataMeasurementResults):
     def __init__(
             self,
             duplicate_fraction: float,
-            duplicates_dict: Dict,
+            duplicates_dict: Optional[Dict] = None,
+            top_duplicates_df: Optional[pd.DataFrame] = None,
+            num_distinct_texts: Optional[int] = None,
     ):
         self.duplicate_fraction = duplicate_fraction
+        # Missing texts all count as a single distinct text
+        self.num_distinct_texts = num_distinct_texts
         self.duplicates_dict = duplicates_dict
+        # The most duplicated texts, by hash, with their count, the first row they're in and its text
+        self.top_duplicates_df = top_duplicates_df
 
     def __eq__(self, other):
         if isinstance(other, TextDuplicatesResults):
@@ -38,8 +59,6 @@ class TextDuplicatesWidget(Widget):
         A model's training and testing may be negatively affected by unwarranted duplicates ([Lee et al., 2021](https://arxiv.org/abs/2107.06499))
 
         ------
-
-        ### Here is the list of all the duplicated items and their counts in the dataset. 
         """
         self.duplicates_intro = gr.Markdown(render=False, value=duplicates_text)
         self.duplicates_df = gr.DataFrame(render=False)
@@ -54,19 +73,35 @@ class TextDuplicatesWidget(Widget):
     def update(self, results: TextDuplicatesResults):
         output = {}
 
-        if not results.duplicates_dict:
+        if not results.duplicate_fraction:
             output[self.duplicates_df] = gr.DataFrame.update(visible=False)
             output[self.duplicates_text] = gr.Markdown.update(visible=True,
                                                               value="There are no duplicates in this dataset! 🥳")
         else:
-            dupes_df_tmp = ds_utils.counter_dict_to_df(results.duplicates_dict, key_as_column=True)
-            dupes_df_tmp.columns = ["instance", "count"]
-            # Nice to have the counts show up first, because the instances
-            # can be quite long (and run off the page)
-            dupes_df = dupes_df_tmp[["count", "instance"]]
-            output[self.duplicates_df] = gr.DataFrame.update(visible=True, value=dupes_df)
+            # Streamed measurements don't list the duplicated items
+            listing = None
+            if results.top_duplicates_df is not None and len(results.top_duplicates_df):
+                dupes_df = results.top_duplicates_df[["count", "instance"]]
+                output[self.duplicates_df] = gr.DataFrame.update(visible=True, value=dupes_df)
+                listing = (
+                    f"### Here are the {len(dupes_df)} most duplicated items and their counts in the dataset.\n\n"
+                    "Texts differing only by surrounding whitespace are counted together, and listed as they "
+                    "first appear."
+                )
+            elif results.duplicates_dict:
+                dupes_df_tmp = ds_utils.counter_dict_to_df(results.duplicates_dict, key_as_column=True)
+                dupes_df_tmp.columns = ["instance", "count"]
+                # Nice to have the counts show up first, because the instances
+                # can be quite long (and run off the page)
+                dupes_df = dupes_df_tmp[["count", "instance"]]
+                output[self.duplicates_df] = gr.DataFrame.update(visible=True, value=dupes_df)
+                listing = "### Here is the list of all the duplicated items and their counts in the dataset."
+            else:
+                output[self.duplicates_df] = gr.DataFrame.update(visible=False)
 
             duplicates_text = f"The fraction of data that is duplicate is {str(round(results.duplicate_fraction, 4))}"
+            if listing is not None:
+                duplicates_text += f"\n\n{listing}"
             output[self.duplicates_text] = gr.Markdown.update(value=duplicates_text, visible=True)
 
         return output
@@ -82,16 +117,137 @@ class TextDuplicatesWidget(Widget):
         pass
 
 
-class TextDuplicates(EvaluateMixin, DataMeasurement):
+class TextDuplicatesState(MeasurementState):
+    def __init__(self, feature: str, memory_budget: Optional[int] = None, spill_dir: Optional[str] = None):
+        self.feature = feature
+        # Counts of the hashes of the texts, as the metric compares them
+        self.hashes = HashCounts(memory_budget=memory_budget, spill_dir=spill_dir)
+
+    @property
+    def num_rows(self) -> int:
+        return self.hashes.num_hashes
+
+    def update(self, batch: pa.Table):
+        self.hashes.update(hash_texts(batch.column(self.feature)))
+
+    def merge(self, other: "TextDuplicatesState") -> "TextDuplicatesState":
+        self.hashes.merge(other.hashes)
+        return self
+
+    def close(self):
+        self.hashes.clear()
+
+    def duplicate_fraction(self, num_distinct: Optional[int] = None) -> float:
+        if num_distinct is None:
+            num_distinct = self.hashes.num_distinct()
+        return 1 - (num_distinct / self.num_rows) if self.num_rows else 0.0
+
+
+def list_duplicates(dataset: Dataset, feature: str, duplicated: np.ndarray, batch_size: int = 10_000) -> Dict:
+    """
+    Counts of the texts appearing more than once, as the evaluate text_duplicates metric lists them. Only the texts
+    whose hash is `duplicated` are counted.
+    """
+    counter = Counter()
+    for batch in iter_arrow_batches(dataset.select_columns([feature]), batch_size=batch_size):
+        texts = batch.column(feature)
+        candidates = np.isin(hash_texts(texts), duplicated)
+        if candidates.any():
+            counter.update(pc.filter(texts, pa.array(candidates)).to_pylist())
+    return {text: count for text, count in counter.items() if count > 1}
+
+
+def locate_hashes(dataset: Dataset, feature: str, hashes: np.ndarray, batch_size: int = 10_000) -> np.ndarray:
+    """
+    Offset of the first row of the dataset whose text has each of the given hashes, -1 for hashes of no row.
+    """
+    order = np.argsort(hashes)
+    sorted_hashes = hashes[order]
+    rows = np.full(len(hashes), -1, dtype=np.int64)
+    offset = 0
+    for batch in iter_arrow_batches(dataset.select_columns([feature]), batch_size=batch_size):
+        if not len(sorted_hashes):
+            break
+        batch_hashes = hash_texts(batch.column(feature))
+        positions = np.minimum(np.searchsorted(sorted_hashes, batch_hashes), len(sorted_hashes) - 1)
+        found = np.flatnonzero(sorted_hashes[positions] == batch_hashes)
+        # Rows are in order, so the first one found for each hash is the first in the batch
+        found_positions, first = np.unique(positions[found], return_index=True)
+        new = rows[order[found_positions]] < 0
+        rows[order[found_positions[new]]] = offset + found[first[new]]
+        offset += batch.num_rows
+        if (rows >= 0).all():
+            break
+    return rows
+
+
+def top_duplicates(
+    dataset: Dataset, feature: str, hashes: HashCounts, max_listed: int, batch_size: int = 10_000
+) -> pd.DataFrame:
+    """
+    The `max_listed` most duplicated texts, kept as hashes and row offsets until the listed texts are taken from
+    their rows, so memory is bounded by `max_listed` rather than by the number of duplicated texts.
+    """
+    top_hashes, counts = hashes.most_common(max_listed, min_count=2)
+    rows = locate_hashes(dataset, feature, top_hashes, batch_size=batch_size)
+    instances = dataset.select_columns([feature]).select(rows)[feature] if len(rows) else []
+    return pd.DataFrame({"hash": top_hashes, "count": counts, "row": rows, "instance": instances})
+
+
+class TextDuplicates(CachedMeasurementMixin, DataMeasurement):
+    """
+    Duplicate texts, compared once stripped of surrounding whitespace as the evaluate text_duplicates metric
+    does. Texts are counted by their 64-bit hash, so memory grows with the number of distinct texts rather than
+    their size, and counts above `memory_budget` bytes are spilled to `spill_dir`.
+
+    Every duplicated text is listed with its count, unless `max_listed` is given: then only the `max_listed`
+    most duplicated texts are, each as it first appears, as listing every one of them takes memory growing with the
+    number of duplicated texts.
+    """
     name = "text_duplicates"
     widget = TextDuplicatesWidget
 
-    def measure(self, dataset: Dataset) -> TextDuplicatesResults:
-        # TODO: list_duplicates is memory-intensive for large datasets
-        # TODO: Consider making that an option, not the default.
-        metric_output = super().run_metric(dataset, list_duplicates=True)
+    def __init__(
+        self,
+        *args,
+        memory_budget: Optional[int] = 1 << 30,
+        spill_dir: Optional[Union[str, os.PathLike]] = None,
+        max_listed: Optional[int] = None,
+        **kwargs,
+    ):
+        self.memory_budget = memory_budget
+        self.spill_dir = spill_dir
+        self.max_listed = max_listed
+        super().__init__(*args, **kwargs)
 
+    def cache_config(self) -> Dict[str, Any]:
+        return {"max_listed": self.max_listed}
+
+    def measure(self, dataset: Dataset) -> TextDuplicatesResults:
+        state = self.measure_partial(dataset.select_columns([self.feature]), batch_size=10_000)
+        try:
+            num_distinct = state.hashes.num_distinct()
+            if self.max_listed is not None:
+                return TextDuplicatesResults(
+                    duplicate_fraction=state.duplicate_fraction(num_distinct),
+                    top_duplicates_df=top_duplicates(dataset, self.feature, state.hashes, self.max_listed),
+                    num_distinct_texts=num_distinct,
+                )
+            duplicated = state.hashes.duplicated()
+            duplicates_dict = list_duplicates(dataset, self.feature, duplicated) if len(duplicated) else {}
+            return TextDuplicatesResults(
+                duplicate_fraction=state.duplicate_fraction(num_distinct),
+                duplicates_dict=duplicates_dict,
+                num_distinct_texts=num_distinct,
+            )
+        finally:
+            state.close()
+
+    def create_state(self) -> TextDuplicatesState:
+        return TextDuplicatesState(self.feature, memory_budget=self.memory_budget, spill_dir=self.spill_dir)
+
+    def results_from_state(self, state: TextDuplicatesState) -> TextDuplicatesResults:
+        num_distinct = state.hashes.num_distinct()
         return TextDuplicatesResults(
-            duplicate_fraction=metric_output["duplicate_fraction"],
-            duplicates_dict=metric_output.get("duplicates_dict", {}),
+            duplicate_fraction=state.duplicate_fraction(num_distinct), num_distinct_texts=num_distinct
         )
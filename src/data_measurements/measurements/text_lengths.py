@@ -1,17 +1,28 @@
-from statistics import mean, stdev
+import math
+import sys
+from collections import Counter
+from fractions import Fraction
+from statistics import StatisticsError
+from typing import Mapping, Optional, Tuple
 
 import gradio as gr
 
 import matplotlib.pyplot as plt
+import pyarrow as pa
+import pyarrow.compute as pc
 import seaborn as sns
 from datasets import Dataset
-from pandas import DataFrame
+from pandas import DataFrame, Series
 
 from data_measurements.measurements.base import (
+    TOKENIZED_FIELD,
+    CachedMeasurementMixin,
     DataMeasurement,
     DataMeasurementResults,
+    MeasurementState,
     TokenizedDatasetMixin,
-    Widget
+    Widget,
+    count_values,
 )
 
 
@@ -21,13 +32,19 @@ class TextLengthsResults(DataMeasurementResults):
         average_instance_length: float,
         standard_dev_instance_length: float,
         num_instance_lengths: int,
-        lengths: DataFrame,
+        lengths: Optional[DataFrame],
+        length_counts: Optional[Series] = None,
     ):
         super().__init__()
         self.average_instance_length = average_instance_length
         self.standard_dev_instance_length = standard_dev_instance_length
         self.num_instance_lengths = num_instance_lengths
+        # Per-instance lengths are only kept when the whole dataset is measured at once, streamed measurements
+        # only keep the number of instances of each length.
         self.lengths = lengths
+        if length_counts is None and lengths is not None:
+            length_counts = lengths.value_counts().sort_index()
+        self.length_counts = length_counts
 
     def __eq__(self, other):
         if isinstance(other, TextLengthsResults):
@@ -35,7 +52,11 @@ class TextLengthsResults(DataMeasurementResults):
                 assert self.average_instance_length == other.average_instance_length
                 assert self.standard_dev_instance_length == other.standard_dev_instance_length
                 assert self.num_instance_lengths == other.num_instance_lengths
-                assert all(self.lengths == other.lengths)
+                # Streamed and sharded results only have the length counts
+                if self.lengths is not None and other.lengths is not None:
+                    assert self.lengths.equals(other.lengths)
+                if self.length_counts is not None and other.length_counts is not None:
+                    assert self.length_counts.equals(other.length_counts)
                 return True
             except AssertionError:
                 return False
@@ -47,6 +68,10 @@ class TextLengthsResults(DataMeasurementResults):
         # TODO: Write it OOP-style if possible (see the matplotlib guide)
         fig, axs = plt.subplots(figsize=(15, 6), dpi=150)
         plt.xlabel("Number of tokens")
+        if self.lengths is None:
+            plt.title("Binned counts of text lengths.")
+            sns.histplot(x=self.length_counts.index, weights=self.length_counts.values, ax=axs, legend=False)
+            return fig
         plt.title("Binned counts of text lengths, with kernel density estimate and ticks for each instance.")
         sns.histplot(data=self.lengths, kde=True, ax=axs, legend=False)
         sns.rugplot(data=self.lengths, ax=axs)
@@ -54,6 +79,9 @@ class TextLengthsResults(DataMeasurementResults):
 
 
 def update_text_length_df(length, results: TextLengthsResults):
+    if results.lengths is None:
+        # Streamed and sharded results only know how many instances have each length
+        return DataFrame({"length": [length], "count": [results.length_counts.get(length, 0)]})
     return DataFrame(results.lengths[results.lengths == length])
 
 
@@ -102,19 +130,11 @@ class TextLengthsWidget(Widget):
             self.text_length_distribution_plot: results.to_figure(),
             self.text_length_explainer: explainer_text,
         }
-        if results.lengths is not None:
-            import numpy as np
-
-            choices = np.sort(results.lengths.unique())[
-                ::-1
-            ].tolist()
-            output[self.text_length_drop_down] = gr.Dropdown.update(
-                choices=choices, value=choices[0]
-            )
-            output[self.text_length_df] = update_text_length_df(choices[0], results)
-        else:
-            output[self.text_length_df] = gr.update(visible=False)
-            output[self.text_length_drop_down] = gr.update(visible=False)
+        choices = results.length_counts.index[::-1].tolist()
+        output[self.text_length_drop_down] = gr.Dropdown.update(
+            choices=choices, value=choices[0]
+        )
+        output[self.text_length_df] = update_text_length_df(choices[0], results)
         return output
 
     @property
@@ -134,7 +154,46 @@ class TextLengthsWidget(Widget):
         )
 
 
-class TextLengths(TokenizedDatasetMixin, DataMeasurement):
+def _sqrt_of_fraction(numerator: int, denominator: int) -> float:
+    # Correctly rounded, as statistics.stdev rounds it: see https://bugs.python.org/msg407078
+    shift = (numerator.bit_length() - denominator.bit_length() - 2 * sys.float_info.mant_dig - 3) // 2
+    if shift >= 0:
+        numerator, denominator, scale = numerator, denominator << 2 * shift, 1 << shift
+    else:
+        numerator, denominator, scale = numerator << -2 * shift, denominator, Fraction(1, 1 << -shift)
+    root = math.isqrt(numerator // denominator)
+    # Round to odd, so that converting to a float rounds correctly
+    root |= root * root * denominator != numerator
+    return float(root * scale)
+
+
+def length_moments(length_counts: Mapping[int, int]) -> Tuple[float, float]:
+    """
+    Mean and sample standard deviation of the lengths described by a length -> count histogram, computed exactly
+    from sums over the distinct lengths and rounded as `statistics.mean` and `statistics.stdev` round them.
+    """
+    num_lengths = sum(length_counts.values())
+    if num_lengths < 2:
+        raise StatisticsError("the standard deviation requires at least two lengths")
+    total = sum(length * count for length, count in length_counts.items())
+    squares = sum(length * length * count for length, count in length_counts.items())
+    variance = Fraction(num_lengths * squares - total * total, num_lengths * (num_lengths - 1))
+    return total / num_lengths, _sqrt_of_fraction(variance.numerator, variance.denominator)
+
+
+class TextLengthsState(MeasurementState):
+    def __init__(self):
+        self.length_counts = Counter()
+
+    def update(self, batch: pa.Table):
+        self.length_counts.update(count_values(pc.list_value_length(batch.column(TOKENIZED_FIELD))))
+
+    def merge(self, other: "TextLengthsState") -> "TextLengthsState":
+        self.length_counts.update(other.length_counts)
+        return self
+
+
+class TextLengths(CachedMeasurementMixin, TokenizedDatasetMixin, DataMeasurement):
     name = "text_lengths"
     widget = TextLengthsWidget
 
@@ -144,17 +203,25 @@ class TextLengths(TokenizedDatasetMixin, DataMeasurement):
     def measure(self, dataset: Dataset) -> TextLengthsResults:
         # TODO: See if it's possible to do the tokenization with a decorator or something...
         dataset = self.tokenize_dataset(dataset)
-        dataset = dataset.map(lambda x: {**x, "length": len(x["tokenized_text"])})
-        df = dataset.to_pandas()
-        df["length"] = df.tokenized_text.apply(len)
+        lengths = Series(pc.list_value_length(self.tokens(dataset)).cast(pa.int64()).to_numpy(), name="length")
+        # Computed from the length counts as streamed and sharded measurements are, which only add the lengths
+        counts = lengths.value_counts(sort=False)
+        return self.results_from_counts(Counter(dict(zip(counts.index.tolist(), counts.tolist()))), lengths=lengths)
+
+    def create_state(self) -> TextLengthsState:
+        return TextLengthsState()
+
+    def results_from_state(self, state: TextLengthsState) -> TextLengthsResults:
+        return self.results_from_counts(state.length_counts)
 
-        avg_length = mean(df.length)
-        std_length = stdev(df.length)
-        num_uniq_lengths = len(df.length.unique())
+    @staticmethod
+    def results_from_counts(length_counts: Counter, lengths: Optional[Series] = None) -> TextLengthsResults:
+        average_length, std_length = length_moments(length_counts)
 
         return TextLengthsResults(
-            average_instance_length=avg_length,
+            average_instance_length=average_length,
             standard_dev_instance_length=std_length,
-            num_instance_lengths=num_uniq_lengths,
-            lengths=df.length,
+            num_instance_lengths=len(length_counts),
+            lengths=lengths,
+            length_counts=Series(length_counts, dtype="int64").sort_index(),
         )
@@ -0,0 +1,225 @@
+import os
+from collections import Counter
+from typing import Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from datasets import Dataset
+
+from data_measurements.closed_class import closed_class_words
+from data_measurements.measurements.base import (
+    TOKEN_IDS_FIELD,
+    TOKENIZED_FIELD,
+    CachedMeasurementMixin,
+    DataMeasurement,
+    DataMeasurementResults,
+    MeasurementState,
+    TokenizedDatasetMixin,
+    count_values,
+)
+from data_measurements.streaming import iter_arrow_batches
+
+
+CNT = "count"
+VOCAB = "vocab"
+PROP = "proportion"
+
+
+class VocabularyCountsState(MeasurementState):
+    def __init__(self):
+        # Tokens in order of first appearance
+        self.counter = Counter()
+
+    def update(self, batch: pa.Table):
+        self.counter.update(count_values(pc.list_flatten(batch.column(TOKENIZED_FIELD))))
+
+    def merge(self, other: "VocabularyCountsState") -> "VocabularyCountsState":
+        self.counter.update(other.counter)
+        return self
+
+
+def count_vocab_frequencies(dataset: Dataset, batch_size: int = 10_000) -> pd.DataFrame:
+    # Counted batch after batch, memory is bounded by the batch size and the size of the vocabulary
+    state = VocabularyCountsState()
+    for batch in iter_arrow_batches(dataset.select_columns([TOKENIZED_FIELD]), batch_size=batch_size):
+        state.update(batch)
+    return counter_to_count_frame(state.counter)
+
+
+def count_token_ids(ids: pa.ListArray, vocabulary: Optional[pa.Array]) -> pd.DataFrame:
+    """
+    Same counts as `count_vocab_frequencies`, from token ids. Without a vocabulary the ids are the tokens.
+    """
+    values = ids.flatten().to_numpy().astype(np.int64, copy=False)
+    counts = np.bincount(values, minlength=0 if vocabulary is None else len(vocabulary))
+    if vocabulary is None:
+        # Order the ids by first appearance, as the ids of a vocabulary are
+        ids, first = np.unique(values, return_index=True)
+        tokens = ids[np.argsort(first, kind="mergesort")]
+        words = tokens
+    else:
+        tokens = np.flatnonzero(counts)
+        words = vocabulary.to_numpy(zero_copy_only=False)[tokens]
+    return (
+        pd.Series(counts[tokens], index=words)
+        .sort_values(ascending=False, kind="mergesort")
+        .to_frame(name="count")
+    )
+
+
+def counter_to_count_frame(counter: Counter) -> pd.DataFrame:
+    # Ties are kept in order of first appearance, so that counts accumulated batch-wise come out identical
+    return (
+        pd.Series(counter, dtype="int64")
+        .sort_values(ascending=False, kind="mergesort")
+        .to_frame(name="count")
+    )
+
+
+def calc_p_word(word_count_df):
+    word_count_df[PROP] = word_count_df[CNT] / float(sum(word_count_df[CNT]))
+    vocab_counts_df = pd.DataFrame(
+        word_count_df.sort_values(by=CNT, ascending=False, kind="mergesort"))
+    vocab_counts_df[VOCAB] = vocab_counts_df.index
+    return vocab_counts_df
+
+
+class VocabularyIndex:
+    """
+    Vocabulary of a tokenized feature, from the most to the least frequent token (ties in order of first
+    appearance). The id of a token is its position in the index. Saved indexes are memory-mapped when loaded,
+    and pickle as a reference to their file.
+    """
+
+    def __init__(self, table: pa.Table, path: Optional[Union[str, os.PathLike]] = None):
+        self.table = table
+        self.path = path
+        self.tokens: pa.Array = table.column(VOCAB).combine_chunks()
+        self.counts: np.ndarray = table.column(CNT).to_numpy()
+        self._token_index: Optional[pd.Index] = None
+        self._closed_class_masks: Dict[str, np.ndarray] = {}
+
+    @classmethod
+    def from_count_frame(cls, count_df: pd.DataFrame) -> "VocabularyIndex":
+        return cls(pa.table({VOCAB: pa.array(count_df.index.to_numpy()), CNT: count_df[CNT].to_numpy()}))
+
+    @classmethod
+    def load(cls, path: Union[str, os.PathLike]) -> "VocabularyIndex":
+        with pa.memory_map(str(path)) as source:
+            return cls(pa.ipc.open_file(source).read_all(), path=path)
+
+    def save(self, path: Union[str, os.PathLike]):
+        with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, self.table.schema) as writer:
+            writer.write_table(self.table)
+        self.path = path
+
+    def __reduce__(self):
+        if self.path is not None:
+            return VocabularyIndex.load, (str(self.path),)
+        return VocabularyIndex, (self.table,)
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __eq__(self, other):
+        return isinstance(other, VocabularyIndex) and self.table.equals(other.table)
+
+    @property
+    def token_index(self) -> pd.Index:
+        if self._token_index is None:
+            self._token_index = pd.Index(self.tokens.to_numpy(zero_copy_only=False))
+        return self._token_index
+
+    @property
+    def proportions(self) -> np.ndarray:
+        return self.counts / float(self.counts.sum())
+
+    def closed_class_mask(self, language: str = "english") -> np.ndarray:
+        """
+        Whether each token of the index is a closed class word of `language`.
+        """
+        if language not in self._closed_class_masks:
+            if pa.types.is_string(self.tokens.type):
+                value_set = pa.array(sorted(closed_class_words(language)), type=pa.string())
+                mask = pc.is_in(self.tokens, value_set=value_set).to_numpy(zero_copy_only=False)
+            else:
+                # Token ids of HF tokenizers aren't words
+                mask = np.zeros(len(self), dtype=bool)
+            self._closed_class_masks[language] = mask
+        return self._closed_class_masks[language]
+
+    def ids(self, tokens) -> np.ndarray:
+        """
+        Ids of the given tokens, -1 for tokens that aren't in the vocabulary.
+        """
+        return self.token_index.get_indexer(tokens)
+
+    def to_frame(self, mask: Optional[np.ndarray] = None) -> pd.DataFrame:
+        """
+        The counts, proportions and tokens of the vocabulary (or of its tokens in `mask`), indexed by token.
+        """
+        if mask is None:
+            return calc_p_word(pd.DataFrame({CNT: self.counts}, index=self.token_index))
+        return calc_p_word(pd.DataFrame({CNT: self.counts[mask]}, index=self.token_index[mask]))
+
+
+class VocabularyCountsResults(DataMeasurementResults):
+    def __init__(self, vocabulary_index: VocabularyIndex):
+        self.vocabulary_index = vocabulary_index
+        self._vocab_counts_df: Optional[pd.DataFrame] = None
+
+    @property
+    def vocab_counts_df(self) -> pd.DataFrame:
+        if self._vocab_counts_df is None:
+            self._vocab_counts_df = self.vocabulary_index.to_frame()
+        return self._vocab_counts_df
+
+    def __getstate__(self):
+        # The frame is derived from the index, which pickles as a reference to its file once saved
+        return {**self.__dict__, "_vocab_counts_df": None}
+
+    def __eq__(self, other):
+        if isinstance(other, VocabularyCountsResults):
+            try:
+                assert self.vocabulary_index == other.vocabulary_index
+                return True
+            except AssertionError:
+                return False
+        else:
+            return False
+
+    def to_figure(self):
+        pass
+
+
+class VocabularyCounts(CachedMeasurementMixin, TokenizedDatasetMixin, DataMeasurement):
+    """
+    Intermediate artifact rather than a displayed measurement: the vocabulary index of the tokenized feature,
+    computed once per dataset and tokenizer and shared by every measurement that depends on it.
+    """
+    name = "vocabulary_counts"
+    widget = None
+    version = "2"
+
+    def measure(self, dataset: Dataset) -> VocabularyCountsResults:
+        dataset = self.tokenize_dataset(dataset)
+        if TOKEN_IDS_FIELD in dataset.column_names:
+            ids, vocabulary = self.token_ids(dataset)
+            count_df = count_token_ids(ids, vocabulary)
+        else:
+            count_df = count_vocab_frequencies(dataset)
+        return VocabularyCountsResults(vocabulary_index=VocabularyIndex.from_count_frame(count_df))
+
+    def create_state(self) -> VocabularyCountsState:
+        return VocabularyCountsState()
+
+    def results_from_state(self, state: VocabularyCountsState) -> VocabularyCountsResults:
+        vocabulary_index = VocabularyIndex.from_count_frame(counter_to_count_frame(state.counter))
+        return VocabularyCountsResults(vocabulary_index=vocabulary_index)
+
+    def store_results(self, key: str, results: VocabularyCountsResults):
+        # The index is stored as an Arrow file and memory-mapped when the cached results are loaded
+        results.vocabulary_index.save(self.cache.artifact_path(key, ".arrow"))
+        super().store_results(key, results)
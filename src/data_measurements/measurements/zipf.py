@@ -0,0 +1,211 @@
+from typing import Optional, Tuple
+
+import gradio as gr
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+from datasets import Dataset
+
+from data_measurements.measurements.base import (
+    CachedMeasurementMixin,
+    DataMeasurement,
+    DataMeasurementResults,
+    MeasurementState,
+    TokenizedDatasetMixin,
+    Widget,
+)
+from data_measurements.measurements.vocabulary import CNT, VocabularyCounts, VocabularyIndex
+
+
+PREDICTED_CNT = "predicted_count"
+
+# Candidate xmin values whose KS distances are computed at once, bounding memory to block size x distinct counts
+_BLOCK_SIZE = 256
+
+
+def fit_power_law(counts: np.ndarray, max_xmin_quantile: float = 0.9) -> Tuple[float, int, float]:
+    """
+    Fits a discrete power law p(x) ∝ x^-alpha to the counts at or above xmin, choosing the xmin which minimizes
+    the Kolmogorov-Smirnov distance between the observed and fitted distributions (Clauset et al., 2009), as
+    `powerlaw.Fit(counts, discrete=True)` does. Returns alpha, xmin and the KS distance.
+
+    Candidate xmins are the distinct counts up to the `max_xmin_quantile` quantile of the counts, so that the tail
+    keeps a share of the counts: the KS distances of K candidates over D distinct counts take O(K x D) time.
+    Alpha has a closed form (the approximate discrete MLE) computed from suffix sums, and both CDFs only need
+    evaluating at the distinct counts, for blocks of candidates at once.
+    """
+    values, frequencies = np.unique(np.asarray(counts, dtype=np.int64), return_counts=True)
+    if len(values) < 2:
+        raise ValueError("Fitting a power law needs at least two distinct counts")
+
+    # Number of counts, and sum of their logs, at or above each candidate
+    tail_sizes = np.cumsum(frequencies[::-1])[::-1]
+    tail_log_sums = np.cumsum((frequencies * np.log(values))[::-1])[::-1]
+    # The largest count alone has no tail to fit
+    max_xmin = np.quantile(counts, max_xmin_quantile)
+    num_candidates = min(max(int(np.searchsorted(values, max_xmin, side="right")), 1), len(values) - 1)
+    candidates = values[:num_candidates]
+    log_xmin = np.log(candidates - 0.5)
+    alphas = 1 + tail_sizes[:num_candidates] / (
+        tail_log_sums[:num_candidates] - tail_sizes[:num_candidates] * log_xmin
+    )
+
+    # Number of counts below each distinct count, and at or below it
+    below = tail_sizes[0] - tail_sizes
+    cumulative = below + frequencies
+    log_upper = np.log(values + 0.5)
+
+    distances = np.empty(len(candidates))
+    for start in range(0, len(candidates), _BLOCK_SIZE):
+        block = slice(start, min(start + _BLOCK_SIZE, len(candidates)))
+        rows = np.arange(block.start, block.stop)[:, None]
+        # CDFs of the tail above each candidate (rows) at each distinct count from the first candidate (columns)
+        columns = slice(block.start, None)
+        observed = (cumulative[None, columns] - below[rows]) / tail_sizes[rows]
+        fitted = 1 - np.exp((1 - alphas[rows]) * (log_upper[None, columns] - log_xmin[rows]))
+        # Only the counts at or above the candidate are part of its tail
+        in_tail = np.arange(block.start, len(values))[None, :] >= rows
+        distances[block] = np.where(in_tail, np.abs(observed - fitted), 0).max(axis=1)
+
+    best = int(np.argmin(distances))
+    return float(alphas[best]), int(candidates[best]), float(distances[best])
+
+
+def predicted_counts(num_counts: int, alpha: float, xmin: int) -> np.ndarray:
+    """
+    Counts expected from the fitted power law at each rank of a tail of `num_counts` counts, from the largest.
+    """
+    # Inverse of the (continuous approximation of the) fitted survival function: rank / num_counts = P(X >= x)
+    ranks = np.arange(1, num_counts + 1)
+    return (xmin - 0.5) * (ranks / num_counts) ** (-1 / (alpha - 1)) + 0.5
+
+
+class ZipfResults(DataMeasurementResults):
+    def __init__(self, alpha: float, xmin: Optional[int], ks_distance: float, counts_df: pd.DataFrame):
+        # NaN (and no xmin) when the vocabulary has too few distinct counts to fit
+        self.alpha = alpha
+        self.xmin = xmin
+        self.ks_distance = ks_distance
+        # Observed counts by rank, with the counts predicted by the fit at or above xmin
+        self.counts_df = counts_df
+
+    def __eq__(self, other):
+        if isinstance(other, ZipfResults):
+            try:
+                assert np.array_equal([self.alpha, self.ks_distance], [other.alpha, other.ks_distance], equal_nan=True)
+                assert self.xmin == other.xmin
+                assert self.counts_df.equals(other.counts_df)
+                return True
+            except AssertionError:
+                return False
+        else:
+            return False
+
+    def to_figure(self):
+        fig, axs = plt.subplots(figsize=(15, 6), dpi=150)
+        ranks = np.arange(1, len(self.counts_df) + 1)
+        axs.loglog(ranks, self.counts_df[CNT], marker=".", linestyle="none", label="Observed count")
+        axs.loglog(ranks, self.counts_df[PREDICTED_CNT], label=f"Power law fit (alpha={self.alpha:.2f})")
+        axs.set_xlabel("Rank")
+        axs.set_ylabel("Count")
+        axs.legend()
+        return fig
+
+
+class ZipfWidget(Widget):
+    def __init__(self):
+        self.zipf_table = gr.DataFrame(render=False)
+        self.zipf_summary = gr.Markdown(render=False)
+        self.zipf_plot = gr.Plot(render=False)
+
+    def render(self):
+        with gr.TabItem("Vocabulary Distribution: Zipf's Law Fit"):
+            gr.Markdown(
+                "Use this widget for the counts of different words in your dataset, measuring the difference "
+                "between the observed count and the expected count under Zipf's law."
+            )
+            gr.Markdown(
+                "This shows how close the observed language is to an ideal natural language distribution following "
+                "[Zipf's law](https://en.wikipedia.org/wiki/Zipf%27s_law), calculated by minimizing the "
+                "[Kolmogorov-Smirnov (KS) statistic](https://en.wikipedia.org/wiki/Kolmogorov%E2%80%93Smirnov_test)."
+            )
+            gr.Markdown(
+                "In general, an alpha greater than 2 or a minimum count greater than 10 (take with a grain of salt) "
+                "means that your distribution is relatively _unnatural_ for natural language. This can be a sign of "
+                "mixed artefacts in the dataset, such as HTML markup."
+            )
+            gr.Markdown("### Here is your dataset's Zipf results:")
+            self.zipf_table.render()
+            self.zipf_summary.render()
+            self.zipf_plot.render()
+
+    def update(self, results: ZipfResults):
+        if results.xmin is None:
+            return {
+                self.zipf_table: pd.DataFrame(),
+                self.zipf_summary: "There are too few distinct word counts in this dataset to fit Zipf's law.",
+                self.zipf_plot: results.to_figure(),
+            }
+        fit_results_table = pd.DataFrame.from_dict(
+            {
+                "Alpha:": ["%.2f" % results.alpha],
+                "KS distance:": ["%.2f" % results.ks_distance],
+                "Min count:": ["%s" % results.xmin],
+            },
+            columns=["Results"],
+            orient="index",
+        )
+        summary = (
+            f"The optimal alpha based on this dataset is: **{round(results.alpha, 2)}**, with a KS distance of: "
+            f"**{round(results.ks_distance, 2)}**. This was fit with a minimum count of: **{results.xmin}**, which "
+            "is the count *beyond which* the scaling regime of the power law fits best."
+        )
+        if results.alpha > 2:
+            summary += (
+                "\n\nYour alpha value is a bit on the high side, which means that the distribution over words in this "
+                "dataset is a bit unnatural. This could be due to non-language items throughout the dataset."
+            )
+        return {
+            self.zipf_table: fit_results_table.reset_index(names=""),
+            self.zipf_summary: summary,
+            self.zipf_plot: results.to_figure(),
+        }
+
+    @property
+    def output_components(self):
+        return [self.zipf_table, self.zipf_summary, self.zipf_plot]
+
+    def add_events(self, state: gr.State):
+        pass
+
+
+class Zipf(CachedMeasurementMixin, TokenizedDatasetMixin, DataMeasurement):
+    name = "zipf"
+    widget = ZipfWidget
+    dependencies = [VocabularyCounts]
+
+    def measure(self, dataset: Dataset) -> ZipfResults:
+        dataset = self.tokenize_dataset(dataset)
+        return self.zipf_results(self.dependency_results(VocabularyCounts, dataset).vocabulary_index)
+
+    def create_state(self) -> MeasurementState:
+        return MeasurementState()
+
+    def results_from_state(self, state: MeasurementState) -> ZipfResults:
+        return self.zipf_results(self.upstream_results[VocabularyCounts.name].vocabulary_index)
+
+    @staticmethod
+    def zipf_results(vocabulary_index: VocabularyIndex) -> ZipfResults:
+        counts = vocabulary_index.counts
+        if len(np.unique(counts)) < 2:
+            counts_df = pd.DataFrame({CNT: counts, PREDICTED_CNT: np.nan}, index=vocabulary_index.token_index)
+            return ZipfResults(alpha=np.nan, xmin=None, ks_distance=np.nan, counts_df=counts_df)
+        alpha, xmin, ks_distance = fit_power_law(counts)
+
+        # The index is sorted by count, so the tail of the fit is a prefix of it
+        num_tail = int(np.count_nonzero(counts >= xmin))
+        predicted = np.full(len(counts), np.nan)
+        predicted[:num_tail] = predicted_counts(num_tail, alpha, xmin)
+        counts_df = pd.DataFrame({CNT: counts, PREDICTED_CNT: predicted}, index=vocabulary_index.token_index)
+
+        return ZipfResults(alpha=alpha, xmin=xmin, ks_distance=ks_distance, counts_df=counts_df)
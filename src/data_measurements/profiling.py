@@ -0,0 +1,136 @@
+import json
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Union
+
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+def peak_rss() -> Optional[int]:
+    """
+    Peak resident set size of the current process so far, in bytes, or None where it isn't available.
+    """
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+@dataclass
+class StageProfile:
+    name: str
+    wall_time: float = 0.0
+    # CPU time of the thread that ran the stage
+    cpu_time: float = 0.0
+    # Peak of the Python memory allocated during the stage, on top of what was allocated before it (tracemalloc)
+    peak_memory: int = 0
+    peak_rss: Optional[int] = None
+    num_rows: Optional[int] = None
+
+    @property
+    def rows_per_second(self) -> Optional[float]:
+        if self.num_rows is None or self.wall_time <= 0:
+            return None
+        return self.num_rows / self.wall_time
+
+    def to_dict(self) -> Dict:
+        return {**asdict(self), "rows_per_second": self.rows_per_second}
+
+
+@contextmanager
+def trace_memory() -> Iterator[None]:
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    try:
+        yield
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+
+@contextmanager
+def profile_stage(name: str, num_rows: Optional[int] = None) -> Iterator[StageProfile]:
+    """
+    Profiles the body of the `with` block. The yielded profile is filled in when the block exits.
+
+    Stages running concurrently in threads share the process' tracemalloc peak, so their memory figures overlap.
+    """
+    profile = StageProfile(name=name, num_rows=num_rows)
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    elif hasattr(tracemalloc, "reset_peak"):
+        tracemalloc.reset_peak()
+    start_memory, _ = tracemalloc.get_traced_memory()
+    start_wall, start_cpu = time.perf_counter(), time.thread_time()
+
+    try:
+        yield profile
+    finally:
+        profile.wall_time = time.perf_counter() - start_wall
+        profile.cpu_time = time.thread_time() - start_cpu
+        _, peak_memory = tracemalloc.get_traced_memory()
+        profile.peak_memory = max(peak_memory - start_memory, 0)
+        profile.peak_rss = peak_rss()
+        if started_tracing:
+            tracemalloc.stop()
+
+
+@contextmanager
+def accumulate_time(profile: StageProfile) -> Iterator[StageProfile]:
+    """
+    Adds the wall and CPU time of the body of the `with` block to `profile`, for stages that run in many small
+    steps (e.g. batch after batch) among other stages. Memory isn't traced step by step.
+    """
+    start_wall, start_cpu = time.perf_counter(), time.thread_time()
+    try:
+        yield profile
+    finally:
+        profile.wall_time += time.perf_counter() - start_wall
+        profile.cpu_time += time.thread_time() - start_cpu
+
+
+class ProfileReport:
+    """
+    Profiles of the stages of a suite run (loading, tokenization and each measurement), in the order they ran.
+    """
+
+    def __init__(self, stages: Optional[List[StageProfile]] = None):
+        self.stages = stages if stages is not None else []
+
+    def add(self, stage: StageProfile):
+        self.stages.append(stage)
+
+    def __getitem__(self, name: str) -> StageProfile:
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        raise KeyError(name)
+
+    def __contains__(self, name: str) -> bool:
+        return any(stage.name == name for stage in self.stages)
+
+    @contextmanager
+    def stage(self, name: str, num_rows: Optional[int] = None) -> Iterator[StageProfile]:
+        with profile_stage(name, num_rows=num_rows) as profile:
+            yield profile
+        self.add(profile)
+
+    def to_dict(self) -> Dict:
+        return {"stages": [stage.to_dict() for stage in self.stages]}
+
+    def to_json(self, path: Optional[Union[str, Path]] = None) -> str:
+        report = json.dumps(self.to_dict(), indent=2)
+        if path is not None:
+            Path(path).write_text(report, encoding="utf-8")
+        return report
@@ -0,0 +1,112 @@
+import math
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+
+def hash_values(values: np.ndarray) -> np.ndarray:
+    """
+    64-bit hashes of an array of values, stable across runs and processes.
+    """
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+class SpaceSaving:
+    """
+    Heavy hitters sketch keeping approximate counts of at most `capacity` items, whatever the number of distinct
+    items (Metwally et al., 2005). Counts are never underestimated, and overestimated by at most `error`, itself
+    at most `max_error = total / capacity`: every item more frequent than that is in the sketch.
+
+    Batches are added as exact counts and sketches are merged as mergeable summaries (Agarwal et al., 2012), so
+    the sketch of a stream doesn't depend on how it was split into batches or shards beyond these bounds.
+    """
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError(f"The capacity of the sketch must be positive, got {capacity}")
+        self.capacity = capacity
+        # Items in order of insertion, with their (over)estimated count and the maximum overestimation
+        self.counts = pd.DataFrame({"count": pd.Series(dtype="int64"), "error": pd.Series(dtype="int64")})
+        self.total = 0
+
+    @property
+    def min_count(self) -> int:
+        # Count of any item that isn't in a full sketch is at most its smallest count
+        return int(self.counts["count"].min()) if len(self.counts) >= self.capacity else 0
+
+    @property
+    def max_error(self) -> float:
+        return self.total / self.capacity
+
+    def update(self, items: np.ndarray, counts: np.ndarray):
+        """
+        Adds the exact counts of a batch of distinct items.
+        """
+        batch = pd.DataFrame({"count": np.asarray(counts, dtype=np.int64), "error": 0}, index=items)
+        self._merge(batch, other_min_count=0, other_total=int(batch["count"].sum()))
+
+    def merge(self, other: "SpaceSaving") -> "SpaceSaving":
+        self._merge(other.counts, other_min_count=other.min_count, other_total=other.total)
+        return self
+
+    def _merge(self, counts: pd.DataFrame, other_min_count: int, other_total: int):
+        items = self.counts.index.append(counts.index.difference(self.counts.index, sort=False))
+        # Items missing from a summary may have had up to its minimum count there
+        merged = self.counts.reindex(items).fillna(self.min_count) + counts.reindex(items).fillna(other_min_count)
+        merged = merged.astype("int64")
+        self.counts = merged.iloc[np.sort(np.argsort(-merged["count"].to_numpy(), kind="mergesort")[: self.capacity])]
+        self.total += other_total
+
+    def top(self, n: Optional[int] = None) -> pd.DataFrame:
+        """
+        The `n` items with the largest counts, with their count and maximum overestimation.
+        """
+        top = self.counts.sort_values("count", ascending=False, kind="mergesort")
+        return top if n is None else top.head(n)
+
+
+class HyperLogLog:
+    """
+    Estimates the number of distinct items added to it with 2 ** `precision` one-byte registers (Flajolet et al.,
+    2007), with a relative standard error of about 1.04 / sqrt(2 ** precision): 0.8% for the default precision.
+    Sketches are merged by taking the maximum of their registers, so they can be built per shard.
+    """
+
+    def __init__(self, precision: int = 14):
+        # Hash bits left after the register index must fit in a float64 mantissa, see `update_hashes`
+        if not 11 <= precision <= 18:
+            raise ValueError(f"The precision must be between 11 and 18, got {precision}")
+        self.precision = precision
+        self.registers = np.zeros(2**precision, dtype=np.uint8)
+
+    def update(self, items: np.ndarray):
+        self.update_hashes(hash_values(items))
+
+    def update_hashes(self, hashes: np.ndarray):
+        hashes = hashes.astype(np.uint64, copy=False)
+        index = (hashes >> np.uint64(64 - self.precision)).astype(np.int64)
+        rest = hashes & np.uint64((1 << (64 - self.precision)) - 1)
+        # Position of the leftmost 1 in the remaining bits; they fit in a float64 mantissa, so frexp is exact
+        rank = (64 - self.precision) - np.frexp(rest.astype(np.float64))[1] + 1
+        np.maximum.at(self.registers, index, rank.astype(np.uint8))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.precision != self.precision:
+            raise ValueError(f"Can't merge sketches of precision {self.precision} and {other.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> float:
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros > 0:
+            # Linear counting is more accurate for small cardinalities
+            return m * math.log(m / zeros)
+        return float(estimate)
+
+    @property
+    def relative_error(self) -> float:
+        return 1.04 / math.sqrt(len(self.registers))
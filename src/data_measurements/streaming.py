@@ -0,0 +1,19 @@
+from typing import Iterator, Union
+
+import pyarrow as pa
+from datasets import Dataset, Features, IterableDataset
+
+
+def iter_arrow_batches(dataset: Union[Dataset, IterableDataset], batch_size: int = 1000) -> Iterator[pa.Table]:
+    """
+    Iterates over a dataset once, as Arrow tables of at most `batch_size` rows. Only one batch is held in memory
+    at a time; for a materialized `Dataset` the batches are slices of its (memory-mapped) table.
+    """
+    if isinstance(dataset, Dataset):
+        yield from dataset.with_format("arrow").iter(batch_size=batch_size)
+    else:
+        features = dataset.features
+        for batch in dataset.iter(batch_size=batch_size):
+            # Typed by the dataset's features when it has them, e.g. as strings for a batch of missing texts
+            schema = Features({name: features[name] for name in batch}).arrow_schema if features else None
+            yield pa.Table.from_pydict(batch, schema=schema)
@@ -0,0 +1,71 @@
+from typing import List, Union
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+
+# Separators between the tokens of CountVectorizer's default token pattern: anything but Unicode word characters
+WORD_SEPARATOR = r"[^\p{L}\p{N}_]+"
+
+
+def drop_empty_tokens(tokens: pa.ListArray) -> pa.ListArray:
+    # Splitting leaves empty tokens around leading and trailing separators, and for empty texts
+    values = pc.list_flatten(tokens)
+    kept = pc.not_equal(values, "").to_numpy(zero_copy_only=False)
+    if kept.all():
+        return tokens
+    parents = pc.list_parent_indices(tokens).to_numpy()
+    offsets = np.zeros(len(tokens) + 1, dtype=np.int32)
+    np.cumsum(np.bincount(parents[kept], minlength=len(tokens)), out=offsets[1:])
+    return pa.ListArray.from_arrays(pa.array(offsets), values.filter(pa.array(kept)), mask=tokens.is_null())
+
+
+class ArrowTokenizer:
+    """
+    Tokenizer running as Arrow compute kernels over whole columns of texts. Tokenized measurements and the suite
+    call `tokenize_arrow` on batches of the feature instead of calling the tokenizer on each text; it can still be
+    called on a single text like any other tokenizer.
+    """
+
+    def __init__(self, lowercase: bool = False):
+        self.lowercase = lowercase
+
+    def split(self, texts: pa.Array) -> pa.ListArray:
+        raise NotImplementedError()
+
+    def tokenize_arrow(self, texts: Union[pa.Array, pa.ChunkedArray]) -> pa.ListArray:
+        if isinstance(texts, pa.ChunkedArray):
+            texts = texts.combine_chunks()
+        if self.lowercase:
+            texts = pc.utf8_lower(texts)
+        return drop_empty_tokens(self.split(texts))
+
+    def batch_tokenize(self, texts: List[str]) -> List[List[str]]:
+        return self.tokenize_arrow(pa.array(texts, type=pa.string())).to_pylist()
+
+    def __call__(self, text: str) -> List[str]:
+        return self.batch_tokenize([text])[0]
+
+
+class WhitespaceTokenizer(ArrowTokenizer):
+    """
+    Splits texts on whitespace, like `str.split()`.
+    """
+
+    def split(self, texts: pa.Array) -> pa.ListArray:
+        return pc.utf8_split_whitespace(texts)
+
+
+class RegexTokenizer(ArrowTokenizer):
+    """
+    Splits texts on matches of a (RE2) separator pattern. The default gives the tokens of sklearn's
+    `CountVectorizer(token_pattern=r"(?u)\\b\\w+\\b").build_tokenizer()`.
+    """
+
+    def __init__(self, pattern: str = WORD_SEPARATOR, lowercase: bool = False):
+        super().__init__(lowercase=lowercase)
+        self.pattern = pattern
+
+    def split(self, texts: pa.Array) -> pa.ListArray:
+        return pc.split_pattern_regex(texts, pattern=self.pattern)
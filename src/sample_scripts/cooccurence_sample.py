@@ -1,15 +1,10 @@
-from sklearn.feature_extraction.text import CountVectorizer
-
 from data_measurements import DataMeasurementSuite
 from data_measurements.measurements import Cooccurences
+from data_measurements.tokenizers import RegexTokenizer
 
 
-tokenizer = CountVectorizer(token_pattern="(?u)\\b\\w+\\b").build_tokenizer()
-
-import time
-
-
-t = time.time()
+# Same tokens as CountVectorizer(token_pattern="(?u)\\b\\w+\\b").build_tokenizer(), tokenized with Arrow kernels
+tokenizer = RegexTokenizer()
 
 suite = DataMeasurementSuite(
     dataset="hate_speech18",
@@ -20,8 +15,7 @@ suite = DataMeasurementSuite(
     measurements=[Cooccurences],
 )
 
-results = suite.run()
+results = suite.run(profile=True)
 
-elapsed = time.time() - t
-print(elapsed)
+print(suite.profile_report.to_json())
 # results["cooccurences"]
@@ -0,0 +1,104 @@
+from unittest.mock import MagicMock
+
+import pyarrow as pa
+import pytest
+from datasets import Dataset
+
+from data_measurements.measurements.base import (
+    TOKEN_IDS_FIELD,
+    TOKENIZED_FIELD,
+    batch_tokenizer,
+    intern_dataset,
+    intern_tokens,
+    tokenize_dataset,
+)
+
+
+class BatchTokenizer:
+    def __init__(self):
+        self.batch_tokenize = MagicMock(side_effect=lambda texts: [text.split() for text in texts])
+
+    def __call__(self, text):
+        raise AssertionError("The batch API should be used")
+
+
+@pytest.mark.parametrize("num_proc", [None, 2])
+def test_tokenize_dataset(num_proc, dummy_tokenizer):
+    dataset = Dataset.from_dict({"text": ["Hello world", "What is up", "Kitty Cat"], "label": [0, 1, 0]})
+
+    tokenized = tokenize_dataset(dataset, feature="text", tokenizer=dummy_tokenizer, batch_size=2, num_proc=num_proc)
+
+    assert tokenized.column_names == ["text", "label", TOKENIZED_FIELD]
+    assert tokenized[TOKENIZED_FIELD] == [["Hello", "world"], ["What", "is", "up"], ["Kitty", "Cat"]]
+    assert tokenized["label"] == [0, 1, 0]
+
+
+def test_tokenize_dataset_batch_api():
+    tokenizer = BatchTokenizer()
+    dataset = Dataset.from_dict({"text": ["Hello world", "What is up", "Kitty Cat"]})
+
+    tokenized = tokenize_dataset(dataset, feature="text", tokenizer=tokenizer, batch_size=2)
+
+    assert tokenized[TOKENIZED_FIELD] == [["Hello", "world"], ["What", "is", "up"], ["Kitty", "Cat"]]
+    assert tokenizer.batch_tokenize.call_count == 2
+
+
+def test_batch_tokenizer_fast_tokenizer():
+    encodings = [MagicMock(tokens=["Hello", "world"]), MagicMock(tokens=["Kitty", "Cat"])]
+    tokenizer = MagicMock(spec=["is_fast", "backend_tokenizer", "__call__"], is_fast=True)
+    tokenizer.backend_tokenizer.encode_batch.return_value = encodings
+
+    tokens = batch_tokenizer(tokenizer)(["Hello world", "Kitty Cat"])
+
+    assert tokens == [["Hello", "world"], ["Kitty", "Cat"]]
+    tokenizer.backend_tokenizer.encode_batch.assert_called_once_with(["Hello world", "Kitty Cat"], add_special_tokens=False)
+
+
+def test_intern_tokens():
+    tokens = pa.chunked_array([[["he", "is"], None], [[], ["she", "is", "he"]]])
+
+    ids, vocabulary = intern_tokens(tokens)
+
+    assert vocabulary.to_pylist() == ["he", "is", "she"]
+    assert ids.type == pa.list_(pa.int32())
+    assert ids.to_pylist() == [[0, 1], None, [], [2, 1, 0]]
+
+
+def test_intern_dataset_token_ids():
+    dataset = Dataset.from_dict({TOKENIZED_FIELD: [[50256, 11], [11]]})
+
+    interned, vocabulary = intern_dataset(dataset)
+
+    assert vocabulary is None
+    assert interned.column_names == [TOKEN_IDS_FIELD]
+    assert interned[TOKEN_IDS_FIELD] == [[50256, 11], [11]]
+
+
+def test_tokenize_dataset_cache(dummy_tokenizer, tmp_path):
+    dataset = Dataset.from_dict({"text": ["Hello world", "What is up", "Kitty Cat"]})
+
+    tokenized = tokenize_dataset(dataset, feature="text", tokenizer=dummy_tokenizer, cache_dir=tmp_path)
+    (cache_file,) = tmp_path.glob("tokenized-*.arrow")
+    modified = cache_file.stat().st_mtime_ns
+    cached = tokenize_dataset(dataset, feature="text", tokenizer=dummy_tokenizer, cache_dir=tmp_path)
+
+    assert cached[TOKENIZED_FIELD] == tokenized[TOKENIZED_FIELD]
+    assert str(cache_file) in [f["filename"] for f in cached.cache_files]
+    assert cache_file.stat().st_mtime_ns == modified
+
+
+class UnhashableTokenizer:
+    def __call__(self, text):
+        return text.split()
+
+    def __reduce__(self):
+        raise TypeError("Can't pickle")
+
+
+def test_tokenize_dataset_cache_unhashable_tokenizer(tmp_path):
+    tokenizer = UnhashableTokenizer()
+    dataset = Dataset.from_dict({"text": ["Hello world"]})
+    tokenized = tokenize_dataset(dataset, feature="text", tokenizer=tokenizer, cache_dir=tmp_path)
+
+    assert tokenized[TOKENIZED_FIELD] == [["Hello", "world"]]
+    assert list(tmp_path.glob("tokenized-*.arrow")) == []
@@ -1,7 +1,7 @@
 import pytest
 from datasets import Dataset
 
-from data_measurements.measurements import Cooccurences
+from data_measurements.measurements import Cooccurences, VocabularyCounts
 
 
 @pytest.fixture
@@ -22,3 +22,15 @@ def test_cooccurences_initialize(dummy_tokenizer):
 def test_cooccurences_run(dummy_tokenizer, dataset):
     cooccurences = Cooccurences(tokenizer=dummy_tokenizer, feature="text")
     cooccurences.measure(dataset)
+
+
+def test_cooccurences_merge_partials(dummy_tokenizer, dataset):
+    shards = [dataset.shard(2, i, contiguous=True) for i in range(2)]
+    vocabulary_counts = VocabularyCounts(tokenizer=dummy_tokenizer, feature="text")
+    cooccurences = Cooccurences(tokenizer=dummy_tokenizer, feature="text")
+    cooccurences.upstream_results = {
+        "vocabulary_counts": vocabulary_counts.merge_partials([vocabulary_counts.measure_partial(s) for s in shards])
+    }
+    results = cooccurences.merge_partials([cooccurences.measure_partial(s) for s in shards])
+
+    assert results == Cooccurences(tokenizer=dummy_tokenizer, feature="text").measure(dataset)
@@ -0,0 +1,92 @@
+import pyarrow as pa
+from datasets import Dataset
+
+from data_measurements.cache import ResultsCache
+from data_measurements.measurements import (
+    ApproximateGeneralStats,
+    GeneralStats,
+    TextDuplicates,
+    TextDuplicatesResults,
+    VocabularyCounts,
+)
+from data_measurements.tokenizers import WhitespaceTokenizer
+
+
+def test_approximate_general_stats(dummy_tokenizer):
+    dataset = Dataset.from_dict({"text": ["the cat sat", "the dog sat", "a cat ran", "cat"]})
+    general_stats = ApproximateGeneralStats(tokenizer=dummy_tokenizer, feature="text", capacity=2)
+    general_stats.upstream_results = {"text_duplicates": TextDuplicatesResults(duplicate_fraction=0.25)}
+
+    shards = [dataset.shard(2, i, contiguous=True) for i in range(2)]
+    results = general_stats.merge_partials([general_stats.measure_partial(shard, batch_size=1) for shard in shards])
+
+    # Small cardinalities are estimated exactly
+    assert results.total_words == 6
+    assert results.total_open_words == 4
+    assert results.distinct_documents == 4
+    assert results.sorted_top_vocab_df.index.tolist()[0] == "cat"
+    assert results.sorted_top_vocab_df.loc["cat", "count"] >= 3
+    # "the" and "a" are closed class words
+    assert "the" not in results.sorted_top_vocab_df.index
+    # cat, sat, dog, sat, cat, ran, cat
+    assert results.top_vocab_max_error == 7 / 2
+    assert results.dups_frac == 0.25
+
+
+def test_approximate_general_stats_cache_key(dummy_tokenizer, tmp_path):
+    dataset = Dataset.from_dict({"text": ["the cat sat"]})
+    cache = ResultsCache(tmp_path)
+    small, large = (
+        ApproximateGeneralStats(tokenizer=dummy_tokenizer, feature="text", cache=cache, capacity=capacity)
+        for capacity in [1, 100]
+    )
+
+    assert small.cache_key(dataset) != large.cache_key(dataset)
+
+
+def test_general_stats_distinct_documents(dummy_tokenizer, mock_load_metric):
+    dataset = Dataset.from_dict({"text": ["the cat sat", "the cat sat", "a cat ran", None]})
+    general_stats = GeneralStats(tokenizer=dummy_tokenizer, feature="text")
+    vocabulary_counts = VocabularyCounts(tokenizer=dummy_tokenizer, feature="text")
+    general_stats.upstream_results = {
+        "vocabulary_counts": vocabulary_counts.measure(dataset.select(range(3))),
+        # Distinct documents are counted by TextDuplicates, missing texts excluded
+        "text_duplicates": TextDuplicates(feature="text").measure(dataset),
+    }
+
+    state = general_stats.measure_partial(dataset.select(range(3)))
+    state.update(dataset.select([3]).with_format("arrow")[:].append_column("tokenized_text", pa.array([None])))
+
+    assert general_stats.results_from_state(state).distinct_documents == 2
+
+
+def test_general_stats_missing_texts(mock_load_metric):
+    dataset = Dataset.from_dict({"text": ["the cat", "", " \t", None, "a cat "]})
+    # Arrow tokenizers keep missing texts missing
+    general_stats = GeneralStats(tokenizer=WhitespaceTokenizer(), feature="text")
+    general_stats.upstream_results = {"text_duplicates": TextDuplicatesResults(duplicate_fraction=0.0)}
+
+    results = general_stats.measure(dataset)
+    partial_results = general_stats.merge_partials(
+        [general_stats.measure_partial(dataset.shard(2, i, contiguous=True), batch_size=2) for i in range(2)]
+    )
+
+    for results in [results, partial_results]:
+        assert (results.text_nan_count, results.empty_text_count, results.whitespace_text_count) == (1, 1, 1)
+        assert results.feature == "text"
+
+
+def test_general_stats_distinct_documents_approximate(mock_load_metric):
+    dataset = Dataset.from_dict({"text": ["a cat", " a cat", "a cat ", "dog", None]})
+    tokenizer = WhitespaceTokenizer()
+    upstream_results = {
+        "vocabulary_counts": VocabularyCounts(tokenizer=tokenizer, feature="text").measure(dataset),
+        "text_duplicates": TextDuplicates(feature="text").measure(dataset),
+    }
+    general_stats = GeneralStats(tokenizer=tokenizer, feature="text")
+    approximate_general_stats = ApproximateGeneralStats(tokenizer=tokenizer, feature="text")
+    general_stats.upstream_results = approximate_general_stats.upstream_results = upstream_results
+
+    # Both compare texts with surrounding whitespace removed
+    assert general_stats.measure(dataset).distinct_documents == 2
+    assert approximate_general_stats.measure(dataset).distinct_documents == 2
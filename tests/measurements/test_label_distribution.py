@@ -1,27 +1,32 @@
+import numpy as np
+import pyarrow as pa
+import pytest
 from datasets import Dataset
+from scipy.stats import skew
 
-from data_measurements.measurements import LabelDistribution
+from data_measurements.measurements import LabelDistribution, LabelDistributionResults
 
 
-def test_label_distribution_initialize(mock_load_metric):
+def test_label_distribution_initialize():
     LabelDistribution(feature="text")
-    mock_load_metric.assert_called_once_with("label_distribution")
 
 
-def test_label_distribution_run(mock_load_metric):
+def test_label_distribution_run():
     dataset = Dataset.from_dict(
         {
             "text": ["Hello", "World", "Hello", "Foo Bar"],
             "label": [1, 2, 1, 1],
         }
     )
-    label_distribution = LabelDistribution(feature="label")
-    label_distribution.measure(dataset)
+    results = LabelDistribution(feature="label").measure(dataset)
 
-    label_distribution.metric.compute.assert_called_once_with(data=dataset["label"])
+    assert results == LabelDistributionResults(
+        label_distribution={"labels": [1, 2], "fractions": [0.75, 0.25]},
+        label_skew=1.1547005383792515,
+    )
 
 
-def test_label_distribution_figure(mock_load_metric):
+def test_label_distribution_figure():
     dataset = Dataset.from_dict(
         {
             "text": ["Hello", "World", "Hello", "Foo Bar"],
@@ -34,3 +39,38 @@ def test_label_distribution_figure(mock_load_metric):
     results = label_distribution.measure(dataset)
 
     results.to_figure()
+
+
+def test_label_distribution_update_finalize():
+    label_distribution = LabelDistribution(feature="label")
+    label_distribution.update(pa.table({"label": [1, 2]}))
+    label_distribution.update(pa.table({"label": [1, 1]}))
+    results = label_distribution.finalize()
+
+    assert results == LabelDistributionResults(
+        label_distribution={"labels": [1, 2], "fractions": [0.75, 0.25]},
+        label_skew=1.1547005383792515,
+    )
+
+
+def test_label_distribution_merge_partials():
+    dataset = Dataset.from_dict({"label": [1, 2, 1, 1]})
+    label_distribution = LabelDistribution(feature="label")
+    states = [label_distribution.measure_partial(dataset.shard(2, i, contiguous=True)) for i in range(2)]
+
+    assert label_distribution.merge_partials(states) == LabelDistributionResults(
+        label_distribution={"labels": [1, 2], "fractions": [0.75, 0.25]},
+        label_skew=1.1547005383792515,
+    )
+
+
+def test_label_distribution_merge_partials_random():
+    rng = np.random.default_rng(0)
+    for _ in range(20):
+        dataset = Dataset.from_dict({"label": rng.integers(0, 5, size=rng.integers(2, 200)).tolist()})
+        label_distribution = LabelDistribution(feature="label")
+        states = [label_distribution.measure_partial(dataset.shard(3, i, contiguous=True)) for i in range(3)]
+        results = label_distribution.merge_partials(states)
+
+        assert results == label_distribution.measure(dataset)
+        assert results.label_skew == pytest.approx(skew(dataset["label"]), nan_ok=True)
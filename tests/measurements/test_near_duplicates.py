@@ -0,0 +1,117 @@
+import pyarrow as pa
+import pytest
+from datasets import Dataset
+
+from data_measurements.cache import ResultsCache
+from data_measurements.measurements import NearDuplicates
+from data_measurements.measurements.base import intern_tokens
+from data_measurements.measurements.near_duplicates import (
+    lsh_bands,
+    minhash_permutations,
+    minhash_signatures,
+    shingle_hashes,
+)
+from data_measurements.sketches import hash_values
+
+
+@pytest.fixture
+def dataset():
+    template = "thank you for your order number {} it will be shipped to you within three business days"
+    return Dataset.from_dict(
+        {
+            "text": [
+                template.format(1),
+                "the quick brown fox jumps over the lazy dog",
+                template.format(2),
+                "",
+                template.format(3),
+                "a completely different sentence about cats and dogs",
+            ]
+        }
+    )
+
+
+def test_shingle_hashes():
+    tokens = pa.array([["a", "b", "c"], ["a"], [], None, ["a", "b", "c", "d"]])
+
+    rows, hashes = shingle_hashes(tokens, shingle_size=3)
+
+    assert rows.tolist() == [0, 1, 4, 4]
+    # Shingles of the same tokens have the same hash, whatever their row
+    assert hashes[0] == hashes[2] and len(set(hashes.tolist())) == 3
+
+
+def test_minhash_signatures_jaccard():
+    permutations = minhash_permutations(256)
+    words = [f"w{i}" for i in range(100)]
+    # Jaccard similarity of the shingles of single tokens is 50 / 150
+    tokens = pa.array([words[:100], words[50:] + [f"x{i}" for i in range(50)]])
+
+    signatures = minhash_signatures(tokens, permutations, shingle_size=1)
+
+    assert (signatures[0] == signatures[1]).mean() == pytest.approx(1 / 3, abs=0.1)
+
+
+def test_lsh_bands():
+    bands, rows = lsh_bands(0.8, 128)
+
+    assert bands * rows <= 128
+    # The probability of sharing a band crosses 1/2 near the threshold
+    assert 0.7 < (1 / bands) ** (1 / rows) < 0.9
+
+
+def test_near_duplicates_run(dummy_tokenizer, dataset):
+    results = NearDuplicates(tokenizer=dummy_tokenizer, feature="text", threshold=0.5, shingle_size=2).measure(
+        dataset
+    )
+
+    labels = results.cluster_labels
+    assert labels[0] == labels[2] == labels[4]
+    assert len({labels[0], labels[1], labels[3], labels[5]}) == 4
+    assert results.near_duplicate_fraction == pytest.approx(2 / 6)
+    assert results.num_clusters == 1
+    assert results.clusters_df["count"].tolist() == [3]
+    assert results.clusters_df["example"].tolist() == [dataset["text"][0]]
+
+
+@pytest.mark.parametrize("num_proc", [None, 2])
+def test_near_duplicates_leaves_dataset_dir(dummy_tokenizer, dataset, tmp_path, num_proc):
+    near_duplicates = NearDuplicates(tokenizer=dummy_tokenizer, feature="text", threshold=0.5, shingle_size=2)
+    near_duplicates.num_proc = num_proc
+    # Tokenized beforehand, as by a suite, so that only the signatures are computed from the saved dataset
+    near_duplicates.tokenize_dataset(dataset).save_to_disk(tmp_path)
+    files = set(tmp_path.iterdir())
+
+    results = near_duplicates.measure(Dataset.load_from_disk(tmp_path))
+
+    assert results.num_clusters == 1
+    assert set(tmp_path.iterdir()) == files
+
+
+def test_near_duplicates_merge_partials(dummy_tokenizer, dataset):
+    near_duplicates = NearDuplicates(tokenizer=dummy_tokenizer, feature="text", threshold=0.5, shingle_size=2)
+    states = [near_duplicates.measure_partial(dataset.shard(3, i, contiguous=True)) for i in range(3)]
+
+    assert near_duplicates.merge_partials(states) == near_duplicates.measure(dataset)
+
+
+def test_minhash_signatures_token_ids():
+    tokens = pa.array([["a", "b", "c", "d"], ["b", "c", "e"], []])
+    ids, vocabulary = intern_tokens(tokens)
+    vocabulary_hashes = hash_values(vocabulary.to_numpy(zero_copy_only=False))
+    permutations = minhash_permutations(16)
+
+    # Ids into a vocabulary are hashed as the tokens they stand for
+    assert (
+        minhash_signatures(ids, permutations, 2, vocabulary_hashes) == minhash_signatures(tokens, permutations, 2)
+    ).all()
+
+
+def test_near_duplicates_cache_key(dummy_tokenizer, dataset, tmp_path):
+    cache = ResultsCache(tmp_path)
+    keys = {
+        NearDuplicates(tokenizer=dummy_tokenizer, feature="text", cache=cache, **options).cache_key(dataset)
+        for options in [{}, {"threshold": 0.5}, {"num_perm": 64}, {"shingle_size": 2}, {"seed": 2}]
+    }
+
+    assert len(keys) == 5
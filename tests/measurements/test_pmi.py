@@ -22,3 +22,11 @@ def test_pmi_initialize(dummy_tokenizer):
 def test_pmi_run(dummy_tokenizer, dataset):
     pmi = PMI(tokenizer=dummy_tokenizer, feature="text")
     pmi.measure(dataset)
+
+
+def test_pmi_reuses_cooccurences(dummy_tokenizer, dataset):
+    pmi = PMI(tokenizer=dummy_tokenizer, feature="text")
+    results = pmi.measure(dataset)
+
+    assert set(pmi.upstream_results) == {"vocabulary_counts", "cooccurences"}
+    assert results.matrix.shape == pmi.upstream_results["cooccurences"].matrix.shape
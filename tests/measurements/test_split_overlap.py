@@ -0,0 +1,92 @@
+import pickle
+
+import pytest
+from datasets import Dataset, DatasetDict
+
+from data_measurements import DataMeasurementSuite
+from data_measurements.cache import ResultsCache
+from data_measurements.measurements import SplitOverlap
+
+
+@pytest.fixture
+def splits():
+    return DatasetDict(
+        {
+            "train": Dataset.from_dict({"text": ["Hello", "World", "Foo Bar", None, "Hello"]}),
+            "test": Dataset.from_dict({"text": ["Baz", "Hello ", "Qux", None, "Foo Bar", "World"]}),
+        }
+    )
+
+
+def test_split_overlap_initialize():
+    SplitOverlap(feature=None)
+
+
+def test_split_overlap_run(splits):
+    results = SplitOverlap(feature="text", reference=splits["train"], num_samples=2).measure(splits["test"])
+
+    assert results.num_rows == 6
+    # Compared as text duplicates are, with surrounding whitespace removed
+    assert results.num_overlapping_rows == 3
+    assert results.overlap_fraction == 0.5
+    assert results.sample_row_ids == [1, 4]
+    assert results.sample_texts == ["Hello ", "Foo Bar"]
+
+
+def test_split_overlap_no_reference(splits):
+    with pytest.raises(ValueError):
+        SplitOverlap(feature="text").measure(splits["test"])
+
+
+def test_split_overlap_merge_partials(splits):
+    split_overlap = SplitOverlap(feature="text", reference=splits, reference_split="train")
+    # The reference is indexed before the measurement is sent to the workers
+    split_overlap = pickle.loads(pickle.dumps(split_overlap))
+    states = [split_overlap.measure_partial(splits["test"].shard(3, i, contiguous=True)) for i in range(3)]
+    results = split_overlap.merge_partials(states)
+
+    assert results == split_overlap.measure(splits["test"])
+    assert results.sample_row_ids == [1, 4, 5]
+    assert results.reference_split == "train"
+
+
+def test_split_overlap_suite(splits, mock_load_dataset):
+    suite = DataMeasurementSuite(
+        dataset=splits,
+        measurements=[SplitOverlap],
+        feature="text",
+        label="label",
+        split="test",
+        tokenizer=lambda x: x,
+    )
+    results = suite.run(num_shards=2, batch_size=2)
+
+    assert results["split_overlap"].num_overlapping_rows == 3
+    assert results["split_overlap"].sample_row_ids == [1, 4, 5]
+
+
+@pytest.mark.parametrize("split", ["train", None])
+def test_split_overlap_suite_without_reference(splits, split):
+    # A single dataset, or the reference split itself, would be compared with itself
+    dataset = splits if split == "train" else splits["test"]
+    suite = DataMeasurementSuite(
+        dataset=dataset,
+        measurements=[SplitOverlap],
+        feature="text",
+        label="label",
+        split=split,
+        tokenizer=lambda x: x,
+    )
+
+    with pytest.raises(ValueError):
+        suite.run()
+
+
+def test_split_overlap_cache_key(splits, tmp_path):
+    cache = ResultsCache(tmp_path)
+    keys = {
+        SplitOverlap(feature="text", reference=splits, cache=cache, **options).cache_key(splits["test"])
+        for options in [{}, {"reference_split": "test"}, {"num_samples": 1}]
+    }
+
+    assert len(keys) == 3
@@ -1,16 +1,77 @@
+import pyarrow as pa
 from datasets import Dataset
 
+from data_measurements.cache import ResultsCache
 from data_measurements.measurements import TextDuplicates
 
 
-def test_text_duplicates_initialize(mock_load_metric):
+def test_text_duplicates_initialize():
     TextDuplicates(feature=None)
-    mock_load_metric.assert_called_once_with("text_duplicates")
 
 
-def test_text_duplicates_run(mock_load_metric):
+def test_text_duplicates_run():
+    dataset = Dataset.from_dict({"text": ["Hello", "World", "Hello", "Foo Bar", "World "]})
+    results = TextDuplicates(feature="text").measure(dataset)
+
+    assert results.duplicate_fraction == 0.4
+    # Listed as the metric lists them, by exact text
+    assert results.duplicates_dict == {"Hello": 2}
+
+
+def test_text_duplicates_spill(tmp_path):
+    dataset = Dataset.from_dict({"text": [str(i % 300) for i in range(1000)]})
+    # A budget of a few hundred distinct texts spills every batch
+    text_duplicates = TextDuplicates(feature="text", memory_budget=1000, spill_dir=tmp_path)
+
+    state = text_duplicates.measure_partial(dataset, batch_size=100)
+
+    assert state.hashes.runs
+    assert text_duplicates.results_from_state(state).duplicate_fraction == 0.7
+    # Reading the results leaves the state as it was, closing it removes the spilled runs
+    assert state.num_rows == 1000
+    state.close()
+    assert not list(tmp_path.iterdir())
+    assert text_duplicates.measure(dataset).duplicate_fraction == 0.7
+    assert not list(tmp_path.iterdir())
+
+
+def test_text_duplicates_update_finalize():
+    text_duplicates = TextDuplicates(feature="text")
+    text_duplicates.update(pa.table({"text": ["Hello", "World"]}))
+    text_duplicates.update(pa.table({"text": ["Hello ", "Foo Bar"]}))
+    results = text_duplicates.finalize()
+
+    assert results.duplicate_fraction == 0.25
+
+
+def test_text_duplicates_merge_partials():
     dataset = Dataset.from_dict({"text": ["Hello", "World", "Hello", "Foo Bar"]})
     text_duplicates = TextDuplicates(feature="text")
-    text_duplicates.measure(dataset)
+    states = [text_duplicates.measure_partial(dataset.shard(2, i, contiguous=True)) for i in range(2)]
+
+    assert text_duplicates.merge_partials(states).duplicate_fraction == 0.25
+
+
+def test_text_duplicates_max_listed():
+    dataset = Dataset.from_dict({"text": ["Hello", "World", "Hello", "Foo", "World ", "Hello", "Foo", "Bar"]})
+    results = TextDuplicates(feature="text", max_listed=2, memory_budget=100).measure(dataset)
+
+    assert results.duplicate_fraction == 0.5
+    assert results.duplicates_dict is None
+    assert results.top_duplicates_df["count"].tolist() == [3, 2]
+    # Texts are listed as they first appear, so "World " is listed as "World"
+    assert results.top_duplicates_df["instance"].tolist()[0] == "Hello"
+    assert results.top_duplicates_df["instance"].tolist()[1] in ["World", "Foo"]
+    assert results.top_duplicates_df["row"].tolist()[0] == 0
+
+
+def test_text_duplicates_cached_max_listed(tmp_path):
+    dataset = Dataset.from_dict({"text": ["Hello", "World", "Hello", "World", "Foo"]})
+    cache = ResultsCache(tmp_path)
+
+    results = TextDuplicates(feature="text", cache=cache).measure(dataset)
+    listed = TextDuplicates(feature="text", cache=cache, max_listed=1).measure(dataset)
 
-    text_duplicates.metric.compute.assert_called_once_with(data=dataset["text"])
+    assert results.duplicates_dict == {"Hello": 2, "World": 2}
+    assert listed.duplicates_dict is None
+    assert len(listed.top_duplicates_df) == 1
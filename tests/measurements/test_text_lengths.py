@@ -1,23 +1,23 @@
+from collections import Counter
 from statistics import mean, stdev
 from unittest.mock import MagicMock
 
 import pytest
 from datasets import Dataset
 
+from data_measurements.cache import ResultsCache
 from data_measurements.measurements import TextLengths
+from data_measurements.measurements.text_lengths import length_moments
 
 
 @pytest.fixture
-def mock_statistics(monkeypatch):
-    mock_mean = MagicMock()
-    mock_mean.return_value = "mean"
-    mock_stdev = MagicMock()
-    mock_stdev.return_value = "stdev"
+def mock_length_moments(monkeypatch):
+    mock_moments = MagicMock()
+    mock_moments.return_value = ("mean", "stdev")
 
-    monkeypatch.setattr("data_measurements.measurements.text_lengths.mean", mock_mean)
-    monkeypatch.setattr("data_measurements.measurements.text_lengths.stdev", mock_stdev)
+    monkeypatch.setattr("data_measurements.measurements.text_lengths.length_moments", mock_moments)
 
-    return {"mean": mock_mean, "stdev": mock_stdev}
+    return mock_moments
 
 
 @pytest.fixture
@@ -35,7 +35,7 @@ def test_text_lengths_initialize(dummy_tokenizer):
     TextLengths(tokenizer=dummy_tokenizer, feature=None)
 
 
-def test_text_lengths_run_mock_stats(mock_statistics, dummy_tokenizer, dataset):
+def test_text_lengths_run_mock_stats(mock_length_moments, dummy_tokenizer, dataset):
     text_lengths = TextLengths(tokenizer=dummy_tokenizer, feature="text")
     results = text_lengths.measure(dataset)
 
@@ -43,8 +43,7 @@ def test_text_lengths_run_mock_stats(mock_statistics, dummy_tokenizer, dataset):
     assert results.standard_dev_instance_length == "stdev"
     assert results.num_instance_lengths == 2
 
-    mock_statistics["mean"].assert_called_once()
-    mock_statistics["stdev"].assert_called_once()
+    mock_length_moments.assert_called_once_with({2: 2, 3: 1})
 
 
 def test_text_lengths_run(dataset, dummy_tokenizer):
@@ -62,3 +61,45 @@ def test_text_lengths_figure(dataset, dummy_tokenizer):
     results = text_lengths.measure(dataset)
 
     results.to_figure()
+
+
+def test_text_lengths_update_finalize(dataset, dummy_tokenizer):
+    text_lengths = TextLengths(tokenizer=dummy_tokenizer, feature="text")
+    tokenized = text_lengths.tokenize_dataset(dataset).with_format("arrow")
+    text_lengths.update(tokenized[:2])
+    text_lengths.update(tokenized[2:])
+    results = text_lengths.finalize()
+
+    assert results.average_instance_length == mean([2, 3, 2])
+    assert results.standard_dev_instance_length == stdev([2, 3, 2])
+    assert results.num_instance_lengths == 2
+    assert results.length_counts.to_dict() == {2: 2, 3: 1}
+    results.to_figure()
+
+
+def test_text_lengths_merge_partials(dataset, dummy_tokenizer):
+    text_lengths = TextLengths(tokenizer=dummy_tokenizer, feature="text")
+    states = [text_lengths.measure_partial(dataset.shard(2, i, contiguous=True)) for i in range(2)]
+    results = text_lengths.merge_partials(states)
+
+    assert results == text_lengths.measure(dataset)
+    assert results.average_instance_length == mean([2, 3, 2])
+    assert results.standard_dev_instance_length == stdev([2, 3, 2])
+
+
+def test_text_lengths_cached(dataset, dummy_tokenizer, tmp_path, monkeypatch):
+    mock_moments = MagicMock(wraps=length_moments)
+    monkeypatch.setattr("data_measurements.measurements.text_lengths.length_moments", mock_moments)
+    cache = ResultsCache(tmp_path)
+
+    results = TextLengths(tokenizer=dummy_tokenizer, feature="text", cache=cache).measure(dataset)
+    cached_results = TextLengths(tokenizer=dummy_tokenizer, feature="text", cache=cache).measure(dataset)
+
+    assert cached_results == results
+    mock_moments.assert_called_once()
+
+
+@pytest.mark.parametrize("lengths", [[2, 3, 2], [0, 1], [7] * 10 + [1_000_000], list(range(1, 1000, 7)) * 3])
+def test_length_moments(lengths):
+    # Exact, and rounded as the statistics module rounds them
+    assert length_moments(Counter(lengths)) == (mean(lengths), stdev(lengths))
@@ -0,0 +1,89 @@
+import pickle
+
+import pandas as pd
+import pytest
+from datasets import Dataset
+
+from data_measurements.measurements import VocabularyCounts
+from data_measurements.measurements.base import TOKENIZED_FIELD, tokenize_dataset
+from data_measurements.cache import ResultsCache
+from data_measurements.measurements.vocabulary import VocabularyIndex, count_vocab_frequencies
+
+
+@pytest.fixture
+def dataset():
+    return Dataset.from_list(
+        [
+            {"text": "the cat"},
+            {"text": "the dog"},
+            {"text": "the cat sat"},
+        ]
+    )
+
+
+def test_vocabulary_counts_run(dummy_tokenizer, dataset):
+    results = VocabularyCounts(tokenizer=dummy_tokenizer, feature="text").measure(dataset)
+
+    assert results.vocab_counts_df.loc["the", "count"] == 3
+    assert results.vocab_counts_df.loc["cat", "count"] == 2
+    assert results.vocab_counts_df["proportion"].sum() == pytest.approx(1.0)
+
+
+def test_vocabulary_counts_merge_partials(dummy_tokenizer, dataset):
+    vocabulary_counts = VocabularyCounts(tokenizer=dummy_tokenizer, feature="text")
+    states = [vocabulary_counts.measure_partial(dataset.shard(2, i, contiguous=True)) for i in range(2)]
+
+    assert vocabulary_counts.merge_partials(states) == vocabulary_counts.measure(dataset)
+
+
+def test_vocabulary_counts_token_ids(dataset):
+    ids = {"the": 5, "cat": 3, "dog": 7, "sat": 1}
+    results = VocabularyCounts(tokenizer=lambda text: [ids[word] for word in text.split()], feature="text").measure(
+        dataset
+    )
+
+    assert results.vocab_counts_df.index.tolist() == [5, 3, 7, 1]
+    assert results.vocab_counts_df["count"].tolist() == [3, 2, 1, 1]
+
+
+def test_count_vocab_frequencies_batches(dummy_tokenizer, dataset):
+    tokenized = tokenize_dataset(dataset, feature="text", tokenizer=dummy_tokenizer)
+    expected = pd.Series(tokenized[TOKENIZED_FIELD]).explode().value_counts(sort=False)
+
+    counts = count_vocab_frequencies(tokenized, batch_size=1)
+
+    assert counts.index.tolist() == ["the", "cat", "dog", "sat"]
+    assert counts["count"].to_dict() == expected.to_dict()
+
+
+def test_vocabulary_index_save_load(dummy_tokenizer, dataset, tmp_path):
+    index = VocabularyCounts(tokenizer=dummy_tokenizer, feature="text").measure(dataset).vocabulary_index
+    index.save(tmp_path / "vocabulary.arrow")
+
+    loaded = VocabularyIndex.load(tmp_path / "vocabulary.arrow")
+
+    assert loaded == index
+    assert loaded.tokens.to_pylist() == ["the", "cat", "dog", "sat"]
+    assert loaded.ids(["cat", "bird"]).tolist() == [1, -1]
+    # Pickled as a reference to the file rather than its contents
+    assert len(pickle.dumps(loaded)) < len(pickle.dumps(VocabularyIndex(loaded.table)))
+    assert pickle.loads(pickle.dumps(loaded)) == index
+
+
+def test_vocabulary_index_closed_class_mask():
+    index = VocabularyIndex.from_count_frame(pd.DataFrame({"count": [3, 2, 1]}, index=["the", "cat", "and"]))
+
+    assert index.closed_class_mask().tolist() == [True, False, True]
+    assert index.to_frame(~index.closed_class_mask())["proportion"].tolist() == [1.0]
+
+
+def test_vocabulary_counts_cached_index(dummy_tokenizer, dataset, tmp_path):
+    cache = ResultsCache(tmp_path)
+    vocabulary_counts = VocabularyCounts(tokenizer=dummy_tokenizer, feature="text", cache=cache)
+    results = vocabulary_counts.measure(dataset)
+
+    cached = vocabulary_counts.cached_results(dataset)
+
+    assert cached == results
+    assert cached.vocabulary_index.path is not None
+    assert cached.vocab_counts_df.equals(results.vocab_counts_df)
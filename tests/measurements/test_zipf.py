@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+from datasets import Dataset
+
+from data_measurements.measurements import Zipf
+from data_measurements.measurements.zipf import fit_power_law
+
+
+@pytest.fixture
+def dataset():
+    return Dataset.from_list(
+        [
+            {"text": "the cat sat on the mat"},
+            {"text": "the dog sat on the log"},
+            {"text": "a cat and a dog"},
+        ]
+    )
+
+
+def brute_force_fit(counts, max_xmin=np.inf):
+    counts = np.sort(counts)
+    fits = []
+    for xmin in np.unique(counts)[:-1]:
+        if xmin > max_xmin and fits:
+            break
+        tail = counts[counts >= xmin]
+        alpha = 1 + len(tail) / np.sum(np.log(tail / (xmin - 0.5)))
+        values, frequencies = np.unique(tail, return_counts=True)
+        fitted = 1 - ((values + 0.5) / (xmin - 0.5)) ** (1 - alpha)
+        fits.append((np.abs(np.cumsum(frequencies) / len(tail) - fitted).max(), alpha, xmin))
+    distance, alpha, xmin = min(fits)
+    return alpha, xmin, distance
+
+
+def test_fit_power_law():
+    counts = np.random.default_rng(0).zipf(2.0, 5_000)
+
+    alpha, xmin, distance = fit_power_law(counts, max_xmin_quantile=1.0)
+
+    assert (alpha, xmin, distance) == pytest.approx(brute_force_fit(counts))
+    assert alpha == pytest.approx(2.0, abs=0.1)
+    # By default, candidates are capped to the 90th percentile of the counts
+    assert fit_power_law(counts) == pytest.approx(brute_force_fit(counts, np.quantile(counts, 0.9)))
+
+
+def test_zipf_run(dummy_tokenizer, dataset):
+    zipf = Zipf(tokenizer=dummy_tokenizer, feature="text")
+    results = zipf.measure(dataset)
+
+    assert set(zipf.upstream_results) == {"vocabulary_counts"}
+    assert results.counts_df.index[0] == "the"
+    assert results.counts_df["predicted_count"].notna().sum() == (results.counts_df["count"] >= results.xmin).sum()
+
+
+def test_zipf_merge_partials(dummy_tokenizer, dataset):
+    zipf = Zipf(tokenizer=dummy_tokenizer, feature="text")
+    results = zipf.measure(dataset)
+
+    assert zipf.merge_partials([zipf.measure_partial(dataset)]) == results
+
+
+def test_zipf_too_few_counts(dummy_tokenizer):
+    results = Zipf(tokenizer=dummy_tokenizer, feature="text").measure(Dataset.from_dict({"text": ["a b c"]}))
+
+    assert results.xmin is None
+    assert np.isnan(results.alpha)
+    assert results.counts_df["predicted_count"].isna().all()
@@ -0,0 +1,86 @@
+import os
+from pathlib import Path
+
+from datasets import Dataset
+
+from data_measurements.cache import ResultsCache, fingerprint
+from data_measurements.measurements.base import tokenize_dataset
+
+
+def test_results_cache_get_set(tmp_path):
+    cache = ResultsCache(tmp_path)
+    cache.set("key", {"value": 1})
+
+    assert cache.get("key") == {"value": 1}
+    assert cache.get("missing") is None
+
+
+def test_results_cache_invalidate(tmp_path):
+    cache = ResultsCache(tmp_path)
+    cache.set("key", 1)
+    cache.set("other", 2)
+    cache.invalidate("key")
+
+    assert cache.get("key") is None
+    assert cache.get("other") == 2
+
+    cache.clear()
+    assert cache.get("other") is None
+
+
+def test_results_cache_invalidate_artifacts(tmp_path):
+    cache = ResultsCache(tmp_path)
+    cache.set("key", 1)
+    cache.artifact_path("key", ".arrow").write_bytes(b"artifact")
+    cache.invalidate("key")
+
+    assert not cache.artifact_path("key", ".arrow").exists()
+
+
+def test_results_cache_lru_eviction(tmp_path):
+    cache = ResultsCache(tmp_path)
+    for i, key in enumerate(["a", "b", "c"]):
+        cache.set(key, "x" * 100)
+        os.utime(tmp_path / f"{key}.pkl", (i, i))
+    # Reading "a" makes "b" the least recently used entry
+    cache.get("a")
+
+    cache.max_size = 2 * os.path.getsize(tmp_path / "a.pkl")
+    cache.evict()
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.get("c") is not None
+
+
+def test_results_cache_evicts_tokenized_columns(tmp_path):
+    cache = ResultsCache(tmp_path)
+    datasets = [Dataset.from_dict({"text": [f"Hello world {i}"] * 100}) for i in range(3)]
+    tokenized = [tokenize_dataset(d, "text", str.split, cache_dir=cache.tokenized_dir) for d in datasets]
+    files = [Path(t.cache_files[-1]["filename"]) for t in tokenized]
+    cache.set("a", "x" * 100)
+
+    assert cache.size() == sum(path.stat().st_size for path in files) + os.path.getsize(tmp_path / "a.pkl")
+
+    # Using a tokenized column counts as a use
+    os.utime(files[0], (0, 0))
+    cache.use_tokenized(tokenized[0])
+    assert files[0].stat().st_mtime > 0
+
+    for i, path in enumerate([*files, tmp_path / "a.pkl"]):
+        os.utime(path, (i, i))
+    cache.max_size = cache.size() - 1
+    cache.evict()
+
+    # The first column is memory-mapped by a dataset in use, so the second one is evicted instead
+    assert [path.exists() for path in files] == [True, False, True]
+    assert cache.get("a") is not None
+
+
+def test_fingerprint_unhashable():
+    class Unpicklable:
+        def __reduce__(self):
+            raise TypeError("can't pickle")
+
+    assert fingerprint(str.split) == fingerprint(str.split)
+    assert fingerprint(Unpicklable()) is None
@@ -0,0 +1,22 @@
+import sys
+
+import pytest
+
+from data_measurements.closed_class import closed_class_words
+
+
+def test_closed_class_words_bundled(monkeypatch):
+    # Bundled languages never touch NLTK's corpora
+    monkeypatch.setitem(sys.modules, "nltk.corpus", None)
+    closed_class_words.cache_clear()
+
+    words = closed_class_words("english")
+
+    assert isinstance(words, frozenset)
+    assert {"the", "don't", "dont", "42"} <= words
+    assert "cat" not in words
+
+
+def test_closed_class_words_unknown_language():
+    with pytest.raises(ValueError):
+        closed_class_words("klingon")
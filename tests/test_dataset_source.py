@@ -0,0 +1,73 @@
+from datasets import Dataset, DatasetDict, IterableDataset
+
+from data_measurements.dataset_source import DatasetSource
+
+
+def test_dataset_source_in_memory():
+    dataset = Dataset.from_dict({"text": ["Hello", "World"], "label": [0, 1], "other": [1.0, 2.0]})
+
+    loaded = DatasetSource(dataset, split=None, columns=["text", "label"]).load()
+
+    assert loaded.column_names == ["text", "label"]
+    assert loaded["text"] == ["Hello", "World"]
+    assert DatasetSource(dataset, split=None, columns=["text"]).fingerprint is not None
+
+
+def test_dataset_source_dataset_dict():
+    dataset = Dataset.from_dict({"text": ["Hello", "World"]})
+    dataset_dict = DatasetDict({"train": dataset, "test": dataset.select([0])})
+
+    loaded = DatasetSource(dataset_dict, split="test", columns=["text", None]).load()
+
+    assert loaded["text"] == ["Hello"]
+
+
+def test_dataset_source_local_files(tmp_path):
+    dataset = Dataset.from_dict({"text": ["Hello", "World"], "other": [1, 2]})
+    dataset.to_parquet(tmp_path / "data.parquet")
+    dataset.to_json(tmp_path / "data.jsonl")
+    dataset.save_to_disk(tmp_path / "saved")
+
+    for path in [tmp_path / "data.parquet", tmp_path / "data.jsonl", tmp_path / "saved"]:
+        source = DatasetSource(path, split="train", columns=["text"])
+        loaded = source.load()
+        assert loaded.column_names == ["text"]
+        assert loaded["text"] == ["Hello", "World"]
+        assert source.fingerprint == DatasetSource(path, split="train", columns=["text"]).fingerprint
+
+
+def test_dataset_source_streaming(tmp_path):
+    dataset = Dataset.from_dict({"text": ["Hello", "World"]})
+
+    dataset.to_json(tmp_path / "data.jsonl")
+
+    # Loaded datasets are streamed as they are, files are streamed rather than loaded
+    assert DatasetSource(dataset, split=None, columns=["text"], streaming=True).load() is dataset
+    loaded = DatasetSource(tmp_path / "data.jsonl", split=None, columns=["text"], streaming=True).load()
+    assert isinstance(loaded, IterableDataset)
+    assert [row["text"] for row in loaded] == ["Hello", "World"]
+
+
+def test_dataset_source_saved_fingerprint(tmp_path):
+    dataset = Dataset.from_dict({"text": ["Hello", "World"]})
+    DatasetDict({"train": dataset}).save_to_disk(tmp_path / "saved_dict")
+    dataset.save_to_disk(tmp_path / "saved")
+
+    for path in [tmp_path / "saved_dict", tmp_path / "saved"]:
+        source = DatasetSource(path, split="train", columns=["text"])
+        fingerprint = source.fingerprint
+        # Mapping the dataset writes cache files next to its data files, the rows are the same
+        source.load().map(lambda row: {"length": len(row["text"])})
+        assert list(path.rglob("cache-*.arrow"))
+        assert source.fingerprint == fingerprint
+
+
+def test_dataset_source_hub_columns(mock_load_dataset):
+    dataset = Dataset.from_dict({"text": ["Hello"], "label": [0], "other": [1]})
+    mock_load_dataset.side_effect = [ValueError("BuilderConfig doesn't have a 'columns' key."), dataset]
+
+    loaded = DatasetSource("imdb", split="train", columns=["text", "label"]).load()
+
+    # Builders that can't read a subset of the columns load all of them, the others are then dropped
+    assert mock_load_dataset.call_args_list[0].kwargs["columns"] == ["text", "label"]
+    assert loaded.column_names == ["text", "label"]
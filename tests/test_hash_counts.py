@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+
+from data_measurements.hash_counts import HashCounts
+
+
+def test_hash_counts_spill(tmp_path):
+    hashes = np.random.default_rng(0).integers(0, 2**64, size=500, dtype=np.uint64)
+    stream = np.random.default_rng(1).choice(hashes, size=5_000)
+    expected, expected_counts = np.unique(stream, return_counts=True)
+
+    counts = HashCounts(memory_budget=100 * 16, spill_dir=tmp_path)
+    for batch in np.array_split(stream, 50):
+        counts.update(batch)
+    other = HashCounts(memory_budget=None)
+    other.update(stream[:10])
+
+    chunks = list(counts.merge(other).iter_counts())
+
+    assert len(counts.runs) > 1 and len(chunks) > 1
+    assert np.array_equal(np.concatenate([h for h, _ in chunks]), expected)
+    counted = dict(zip(expected.tolist(), expected_counts.tolist()))
+    for h in stream[:10].tolist():
+        counted[h] += 1
+    assert dict(zip(*(np.concatenate(c).tolist() for c in zip(*chunks)))) == counted
+    assert counts.num_hashes == 5_010
+
+    counts.clear()
+    assert not list(tmp_path.iterdir())
+
+
+def test_hash_counts_most_common(tmp_path):
+    stream = np.random.default_rng(0).zipf(1.5, size=5_000).astype(np.uint64)
+    counts = HashCounts(memory_budget=50 * 16, spill_dir=tmp_path)
+    for batch in np.array_split(stream, 50):
+        counts.update(batch)
+
+    hashes, top_counts = counts.most_common(10, min_count=2)
+
+    expected = sorted(zip(*np.unique(stream, return_counts=True)), key=lambda c: (c[1], c[0]), reverse=True)[:10]
+    assert len(counts.runs) > 1
+    assert list(zip(hashes.tolist(), top_counts.tolist())) == [(int(h), int(c)) for h, c in expected]
+    assert (counts.most_common(1_000, min_count=2)[1] >= 2).all()
+    counts.clear()
+
+
+def test_hash_counts_clear_temporary_spill_dir():
+    counts = HashCounts(memory_budget=10 * 16)
+    other = HashCounts(memory_budget=10 * 16)
+    for batch in np.array_split(np.arange(1_000, dtype=np.uint64), 10):
+        counts.update(batch)
+        other.update(batch + 1_000)
+    spill_dirs = [counts.spill_dir, other.spill_dir]
+
+    assert counts.merge(other).num_distinct() == 2_000
+    counts.clear()
+    # Including the directory the merged counts spilled to
+    assert not any(os.path.exists(spill_dir) for spill_dir in spill_dirs)
+    assert counts.spill_dir is None
@@ -1,6 +1,20 @@
+from unittest.mock import MagicMock
+
 import pytest
+from datasets import Dataset
 
 from data_measurements import DataMeasurementSuite
+from data_measurements.cache import ResultsCache
+from data_measurements.measurements.base import tokenize_dataset
+from data_measurements.measurement_suite import build_measurement_graph
+from data_measurements.measurements import (
+    PMI,
+    Cooccurences,
+    GeneralStats,
+    TextDuplicates,
+    TextLengths,
+    VocabularyCounts,
+)
 
 
 @pytest.fixture
@@ -21,6 +35,7 @@ def expected_results(mock_measurements):
 
 @pytest.fixture
 def suite(measurements, mock_load_dataset, mock_load_metric, monkeypatch):
+    mock_load_dataset.return_value = Dataset.from_dict({"text": ["Hello", "World", "Hello", "Foo Bar"], "label": [1, 0, 2, 0]})
     return DataMeasurementSuite(
         dataset="imdb",
         measurements=measurements,
@@ -32,10 +47,13 @@ def suite(measurements, mock_load_dataset, mock_load_metric, monkeypatch):
 
 
 def test_measurement_suite_initialize(suite, mock_load_dataset, measurements, monkeypatch):
-    mock_load_dataset.assert_called_with("imdb", split="train")
-
+    mock_load_dataset.assert_not_called()
     assert len(suite.measurements) == len(measurements)
 
+    suite.dataset
+    suite.dataset
+    mock_load_dataset.assert_called_once_with("imdb", split="train", columns=["text", "label"])
+
 
 def test_measurement_suite_run(suite, measurements, expected_results, monkeypatch):
     assert suite.measurements[0].feature == "text"
@@ -47,3 +65,249 @@ def test_measurement_suite_run(suite, measurements, expected_results, monkeypatc
     assert results["text_duplicates"] == expected_results[0]
     assert results["text_lengths"] == expected_results[1]
     assert results["label_distribution"] == expected_results[2]
+
+
+def test_measurement_suite_tokenizes_once(mock_load_dataset, mock_load_metric):
+    mock_load_dataset.return_value = Dataset.from_dict({"text": ["Hello world", "What is up", "Kitty Cat"]})
+    tokenized = []
+
+    def tokenizer(sentence: str):
+        tokenized.append(sentence)
+        return sentence.split()
+
+    suite = DataMeasurementSuite(
+        dataset="imdb",
+        measurements=[TextLengths, GeneralStats],
+        feature="text",
+        label="label",
+        split="train",
+        tokenizer=tokenizer,
+    )
+    suite.run()
+
+    assert len(tokenized) == 3
+
+
+def test_measurement_graph_order(dummy_tokenizer):
+    pmi = PMI(tokenizer=dummy_tokenizer, feature="text")
+    graph = build_measurement_graph([pmi], tokenizer=dummy_tokenizer, feature="text", label=None)
+
+    assert list(graph) == ["vocabulary_counts", "cooccurences", "PMI"]
+
+
+def test_measurement_suite_shares_dependencies(mock_load_dataset, mock_load_metric, dummy_tokenizer):
+    mock_load_dataset.return_value = Dataset.from_dict({"text": ["Hello world", "Hello world", "Kitty Cat"]})
+    suite = DataMeasurementSuite(
+        dataset="imdb",
+        measurements=[GeneralStats, TextDuplicates],
+        feature="text",
+        label="label",
+        split="train",
+        tokenizer=dummy_tokenizer,
+    )
+    results = suite.run()
+
+    assert list(results) == ["general_stats", "text_duplicates"]
+    assert results["general_stats"].dups_frac == results["text_duplicates"].duplicate_fraction == 1 - 2 / 3
+    # The duplicates were listed once, by the suite's TextDuplicates
+    assert results["text_duplicates"].duplicates_dict == {"Hello world": 2}
+
+
+@pytest.mark.parametrize("executor", ["threads", "processes"])
+def test_measurement_suite_run_parallel(executor, mock_load_dataset, dummy_tokenizer):
+    mock_load_dataset.return_value = Dataset.from_dict({"text": ["he went to the park", "she has a cat", "he is"]})
+    suite = DataMeasurementSuite(
+        dataset="imdb",
+        measurements=[TextLengths, Cooccurences],
+        feature="text",
+        label="label",
+        split="train",
+        tokenizer=dummy_tokenizer,
+    )
+    expected = suite.run()
+    results = suite.run(executor=executor, num_workers=2)
+
+    assert list(results) == ["text_lengths", "cooccurences"]
+    assert results["text_lengths"] == expected["text_lengths"]
+    assert results["cooccurences"].matrix.equals(expected["cooccurences"].matrix)
+
+
+@pytest.mark.parametrize("executor", ["serial", "processes"])
+def test_measurement_suite_run_sharded(executor, mock_load_dataset, dummy_tokenizer):
+    mock_load_dataset.return_value = Dataset.from_dict(
+        {"text": ["he went to the park", "she has a cat", "he is", "she is", "he has a dog", "the park", "a cat"]}
+    )
+    suite = DataMeasurementSuite(
+        dataset="imdb",
+        measurements=[TextLengths, VocabularyCounts, PMI],
+        feature="text",
+        label="label",
+        split="train",
+        tokenizer=dummy_tokenizer,
+    )
+    expected = suite.run()
+    results = suite.run(executor=executor, num_workers=2, num_shards=3, batch_size=2)
+
+    assert list(results) == ["text_lengths", "vocabulary_counts", "PMI"]
+    assert results["text_lengths"] == expected["text_lengths"]
+    assert results["vocabulary_counts"] == expected["vocabulary_counts"]
+    assert results["PMI"].matrix.equals(expected["PMI"].matrix)
+
+
+def test_measurement_suite_run_token_ids(mock_load_dataset, dummy_tokenizer):
+    mock_load_dataset.return_value = Dataset.from_dict({"text": ["he went to the park", "she has a cat", "he is", ""]})
+    kwargs = dict(
+        dataset="imdb",
+        measurements=[TextLengths, VocabularyCounts, PMI],
+        feature="text",
+        label="label",
+        split="train",
+        tokenizer=dummy_tokenizer,
+    )
+    expected = DataMeasurementSuite(**kwargs).run()
+    results = DataMeasurementSuite(**kwargs, token_ids=True).run()
+
+    assert results["text_lengths"] == expected["text_lengths"]
+    assert results["vocabulary_counts"] == expected["vocabulary_counts"]
+    assert results["PMI"].matrix.equals(expected["PMI"].matrix)
+
+
+@pytest.mark.parametrize("num_shards", [None, 2])
+def test_measurement_suite_run_profile(num_shards, mock_load_dataset, dummy_tokenizer):
+    mock_load_dataset.return_value = Dataset.from_dict({"text": ["he went to the park", "she has a cat", "he is"]})
+    suite = DataMeasurementSuite(
+        dataset="imdb",
+        measurements=[TextLengths, PMI],
+        feature="text",
+        label="label",
+        split="train",
+        tokenizer=dummy_tokenizer,
+    )
+    suite.run(executor="threads", num_shards=num_shards, profile=True)
+
+    stages = [stage.name for stage in suite.profile_report.stages]
+    assert stages[:2] == ["load", "tokenize"]
+    for name in ["text_lengths", "vocabulary_counts", "cooccurences", "PMI"]:
+        assert name in suite.profile_report
+    if num_shards is None:
+        assert suite.profile_report["text_lengths"].num_rows == 3
+    else:
+        assert "shard_0" in suite.profile_report and "shard_1" in suite.profile_report
+
+
+def test_measurement_suite_run_streaming_profile(mock_load_dataset, dummy_tokenizer):
+    mock_load_dataset.return_value = Dataset.from_dict({"text": ["he went to the park", "she has a cat", "he is"]})
+    suite = DataMeasurementSuite(
+        dataset="imdb",
+        measurements=[TextLengths, PMI],
+        feature="text",
+        label="label",
+        split="train",
+        tokenizer=dummy_tokenizer,
+        streaming=True,
+    )
+    suite.run(batch_size=2, profile=True)
+
+    # The updates of each measurement are timed separately
+    for name in ["tokenize", "update_text_lengths", "update_vocabulary_counts", "update_cooccurences", "update_PMI"]:
+        assert suite.profile_report[name].num_rows == 3
+        assert suite.profile_report[name].wall_time > 0
+    assert "stream" in suite.profile_report
+
+
+@pytest.mark.parametrize("iterable", [False, True])
+def test_measurement_suite_run_streaming(iterable, mock_load_dataset, dummy_tokenizer):
+    dataset = Dataset.from_dict({"text": ["he went to the park", "she has a cat", "he is", "she has a cat"]})
+    kwargs = dict(
+        dataset="imdb",
+        measurements=[TextLengths, VocabularyCounts, PMI],
+        feature="text",
+        label="label",
+        split="train",
+        tokenizer=dummy_tokenizer,
+    )
+    mock_load_dataset.return_value = dataset
+    expected = DataMeasurementSuite(**kwargs).run()
+
+    mock_load_dataset.return_value = dataset.to_iterable_dataset() if iterable else dataset
+    suite = DataMeasurementSuite(streaming=True, **kwargs)
+    results = suite.run(batch_size=3)
+
+    mock_load_dataset.assert_called_with("imdb", split="train", columns=["text", "label"], streaming=True)
+    assert results["text_lengths"] == expected["text_lengths"]
+    assert results["vocabulary_counts"] == expected["vocabulary_counts"]
+    assert results["PMI"].matrix.equals(expected["PMI"].matrix)
+
+
+def test_measurement_suite_update(mock_load_dataset, dummy_tokenizer, tmp_path):
+    dataset = Dataset.from_dict({"text": ["he went to the park", "she has a cat", "he is", "she has a cat"]})
+    kwargs = dict(
+        dataset="imdb",
+        measurements=[TextLengths, PMI, TextDuplicates],
+        feature="text",
+        label="label",
+        split="train",
+        tokenizer=dummy_tokenizer,
+    )
+    mock_load_dataset.return_value = dataset
+    expected = DataMeasurementSuite(**kwargs).run_streaming()
+
+    mock_load_dataset.return_value = dataset.select(range(2))
+    suite = DataMeasurementSuite(**kwargs)
+    suite.run_streaming()
+    suite.save_state(tmp_path / "state.pkl")
+
+    suite = DataMeasurementSuite(**kwargs)
+    suite.load_state(tmp_path / "state.pkl")
+    results = suite.update(dataset.select(range(2, 4)))
+
+    assert results["text_lengths"] == expected["text_lengths"]
+    assert results["PMI"].matrix.equals(expected["PMI"].matrix)
+    assert results["text_duplicates"].duplicate_fraction == expected["text_duplicates"].duplicate_fraction == 0.25
+    # Updating again measures the rows on top of all those measured so far
+    results = suite.update(dataset.select(range(3, 4)))
+    assert results["text_duplicates"].duplicate_fraction == 0.4
+
+
+@pytest.mark.parametrize("num_shards", [None, 2])
+def test_measurement_suite_cached(num_shards, mock_load_dataset, dummy_tokenizer, tmp_path, monkeypatch):
+    mock_tokenize_dataset = MagicMock(wraps=tokenize_dataset)
+    monkeypatch.setattr("data_measurements.measurement_suite.tokenize_dataset", mock_tokenize_dataset)
+    mock_load_dataset.return_value = Dataset.from_dict({"text": ["he went to the park", "she has a cat"]})
+    kwargs = dict(
+        dataset="imdb",
+        measurements=[TextLengths, PMI],
+        feature="text",
+        label="label",
+        split="train",
+        tokenizer=dummy_tokenizer,
+        cache=ResultsCache(tmp_path),
+    )
+
+    # Sharded runs cache their results as serial runs do
+    results = DataMeasurementSuite(**kwargs).run(num_shards=num_shards)
+    cached_results = DataMeasurementSuite(**kwargs).run()
+
+    mock_tokenize_dataset.assert_called_once()
+    assert cached_results["text_lengths"] == results["text_lengths"]
+    assert cached_results["PMI"].matrix.equals(results["PMI"].matrix)
+
+
+def test_measurement_suite_measurement_options(mock_load_dataset, dummy_tokenizer):
+    mock_load_dataset.return_value = Dataset.from_dict({"text": ["Hello world", "Hello world", "Hi", "Hi", "Hey"]})
+    kwargs = dict(
+        dataset="imdb",
+        measurements=[GeneralStats],
+        feature="text",
+        label="label",
+        split="train",
+        tokenizer=dummy_tokenizer,
+    )
+    # Options apply to the dependencies of the requested measurements too
+    suite = DataMeasurementSuite(**kwargs, measurement_options={"text_duplicates": {"max_listed": 1}})
+    results = suite.run()
+
+    assert suite.graph["text_duplicates"].max_listed == 1
+    assert results["general_stats"].dups_frac == 0.4
+    with pytest.raises(ValueError):
+        DataMeasurementSuite(**kwargs, measurement_options={"zipf": {}})
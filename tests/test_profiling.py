@@ -0,0 +1,29 @@
+import json
+
+from data_measurements.profiling import ProfileReport, profile_stage
+
+
+def test_profile_stage():
+    with profile_stage("allocate", num_rows=1000) as profile:
+        data = [bytes(1000) for _ in range(1000)]
+
+    assert len(data) == 1000
+    assert profile.wall_time > 0
+    assert profile.cpu_time >= 0
+    assert profile.peak_memory >= 1000 * 1000
+    assert profile.rows_per_second == 1000 / profile.wall_time
+
+
+def test_profile_report_to_json(tmp_path):
+    report = ProfileReport()
+    with report.stage("load", num_rows=10):
+        pass
+    with report.stage("tokenize"):
+        pass
+
+    exported = json.loads(report.to_json(tmp_path / "profile.json"))
+
+    assert "load" in report and report["load"].num_rows == 10
+    assert [stage["name"] for stage in exported["stages"]] == ["load", "tokenize"]
+    assert exported["stages"][1]["rows_per_second"] is None
+    assert json.loads((tmp_path / "profile.json").read_text()) == exported
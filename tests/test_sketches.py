@@ -0,0 +1,52 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_measurements.sketches import HyperLogLog, SpaceSaving
+
+
+def sketch_stream(stream, capacity, num_shards=1, num_batches=10):
+    sketches = []
+    for shard in np.array_split(stream, num_shards):
+        sketch = SpaceSaving(capacity)
+        for batch in np.array_split(shard, num_batches):
+            items, counts = np.unique(batch, return_counts=True)
+            sketch.update(items, counts)
+        sketches.append(sketch)
+    return sketches[0] if num_shards == 1 else sketches[0].merge(sketches[1]).merge(sketches[2])
+
+
+@pytest.mark.parametrize("num_shards", [1, 3])
+def test_space_saving_bounds(num_shards):
+    stream = np.random.default_rng(0).zipf(1.5, 20_000) % 5_000
+    true_counts = pd.Series(stream).value_counts()
+
+    sketch = sketch_stream(stream, capacity=100, num_shards=num_shards)
+
+    assert sketch.total == len(stream)
+    assert len(sketch.counts) == 100
+    counts = true_counts.reindex(sketch.counts.index)
+    assert (counts <= sketch.counts["count"]).all()
+    assert (counts >= sketch.counts["count"] - sketch.counts["error"]).all()
+    assert (sketch.counts["error"] <= sketch.max_error).all()
+    assert set(true_counts[true_counts > sketch.max_error].index) <= set(sketch.counts.index)
+    assert sketch.top(3).index.tolist() == true_counts.head(3).index.tolist()
+
+
+def test_space_saving_exact_below_capacity():
+    sketch = sketch_stream(np.array(["a", "b", "a", "c", "a", "b"]), capacity=10, num_batches=3)
+
+    assert sketch.top()["count"].to_dict() == {"a": 3, "b": 2, "c": 1}
+    assert (sketch.counts["error"] == 0).all()
+
+
+@pytest.mark.parametrize("num_items", [10, 1000, 100_000])
+def test_hyperloglog(num_items):
+    items = np.array([f"item {i}" for i in range(num_items)] * 2, dtype=object)
+    sketches = [HyperLogLog() for _ in range(3)]
+    for sketch, shard in zip(sketches, np.array_split(items, 3)):
+        sketch.update(shard)
+
+    sketch = sketches[0].merge(sketches[1]).merge(sketches[2])
+
+    assert sketch.estimate() == pytest.approx(num_items, rel=3 * sketch.relative_error)
@@ -0,0 +1,17 @@
+import pytest
+from datasets import Dataset, Features, Value
+
+from data_measurements.streaming import iter_arrow_batches
+
+
+@pytest.mark.parametrize("iterable", [False, True])
+def test_iter_arrow_batches_missing_texts(iterable):
+    dataset = Dataset.from_dict({"text": [None, None, "Hello"]}, features=Features({"text": Value("string")}))
+    if iterable:
+        dataset = dataset.to_iterable_dataset()
+
+    batches = list(iter_arrow_batches(dataset, batch_size=2))
+
+    # A batch of missing texts is still a batch of strings
+    assert [batch.schema.field("text").type for batch in batches] == ["string", "string"]
+    assert [batch.column("text").to_pylist() for batch in batches] == [[None, None], ["Hello"]]
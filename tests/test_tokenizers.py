@@ -0,0 +1,45 @@
+import pyarrow as pa
+import pytest
+from datasets import Dataset
+from sklearn.feature_extraction.text import CountVectorizer
+
+from data_measurements.measurements import TextLengths, VocabularyCounts
+from data_measurements.measurements.base import TOKENIZED_FIELD, tokenize_batch, tokenize_dataset
+from data_measurements.tokenizers import RegexTokenizer, WhitespaceTokenizer
+
+
+TEXTS = ["He went to the park.", "  she has\ta cat  ", "", "Über naïve résumé_2, 42!"]
+
+
+def test_whitespace_tokenizer():
+    tokenizer = WhitespaceTokenizer()
+
+    assert tokenizer.tokenize_arrow(pa.array(TEXTS + [None])).to_pylist() == [t.split() for t in TEXTS] + [None]
+    assert tokenizer("  she has\ta cat  ") == ["she", "has", "a", "cat"]
+
+
+def test_regex_tokenizer():
+    count_vectorizer_tokenizer = CountVectorizer(token_pattern="(?u)\\b\\w+\\b").build_tokenizer()
+
+    assert RegexTokenizer().batch_tokenize(TEXTS) == [count_vectorizer_tokenizer(t) for t in TEXTS]
+    assert RegexTokenizer(lowercase=True)("He went") == ["he", "went"]
+
+
+@pytest.mark.parametrize("tokenizer", [WhitespaceTokenizer(), RegexTokenizer()])
+def test_arrow_tokenizer_dataset(tokenizer):
+    dataset = Dataset.from_dict({"text": TEXTS, "label": [0, 1, 0, 1]})
+
+    tokenized = tokenize_dataset(dataset, feature="text", tokenizer=tokenizer, batch_size=3)
+    batch = tokenize_batch(dataset.with_format("arrow")[:], feature="text", tokenizer=tokenizer)
+
+    assert tokenized.column_names == ["text", "label", TOKENIZED_FIELD]
+    assert tokenized[TOKENIZED_FIELD] == [tokenizer(t) for t in TEXTS]
+    assert batch.column(TOKENIZED_FIELD).to_pylist() == [tokenizer(t) for t in TEXTS]
+
+
+def test_arrow_tokenizer_measurements(dummy_tokenizer):
+    dataset = Dataset.from_dict({"text": TEXTS})
+
+    for measurement in [TextLengths, VocabularyCounts]:
+        expected = measurement(tokenizer=dummy_tokenizer, feature="text").measure(dataset)
+        assert measurement(tokenizer=WhitespaceTokenizer(), feature="text").measure(dataset) == expected